@@ -105,10 +105,52 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # BEGIN IMMEDIATE : les écritures concurrentes attendent le verrou
+            # (jusqu'à `timeout` secondes) au lieu d'échouer en cours de
+            # transaction (numérotation des documents, stocks)
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        "TEST": {
+            # Base de test sur fichier : les tests de concurrence utilisent
+            # plusieurs connexions
+            "NAME": BASE_DIR / "test_db.sqlite3",
+        },
     }
 }
 
 
+# Cache
+# Cache fichier : partagé entre les workers gunicorn, sans service externe
+# (utilisé par le tableau de bord, voir users/cache.py)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("DJANGO_CACHE_DIR", os.path.join(BASE_DIR, "cache")),
+    }
+}
+
+DASHBOARD_CACHE_TIMEOUT = 300  # secondes
+
+# Statistiques et classements du rapport des ventes, par jeu de filtres
+RAPPORT_VENTES_CACHE_TIMEOUT = 60  # secondes
+
+# Durée de conservation des réponses rejouables (en-tête Idempotency-Key)
+IDEMPOTENCE_TTL = 24 * 3600  # secondes
+# Délai après lequel une requête restée en cours (worker arrêté) est rejouable
+IDEMPOTENCE_BAIL = 300  # secondes
+
+# Journal d'audit (users.audit) : 'tampon' écrit les entrées par lots depuis
+# un thread après le commit ; 'transaction' les écrit dans la transaction de
+# la requête (aucune perte possible, une requête de plus par entrée)
+AUDIT_DURABILITE = os.environ.get("AUDIT_DURABILITE", "tampon")
+AUDIT_TAILLE_LOT = 200  # entrées par bulk_create
+AUDIT_DELAI_FLUSH = 2  # secondes avant écriture d'un lot incomplet
+AUDIT_TAILLE_MAX = 10000  # entrées en attente au-delà desquelles on écrit directement
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
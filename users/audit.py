@@ -0,0 +1,158 @@
+# audit.py - Écriture du journal d'audit (AuditLog) par lots
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Deux niveaux de durabilité (réglage AUDIT_DURABILITE) :
+# - 'transaction' : INSERT immédiat dans la transaction de l'appelant,
+#   l'entrée est validée ou annulée avec l'opération journalisée (tests)
+# - 'tampon' : l'entrée est mise en file au commit de la transaction, puis
+#   écrite par bulk_create depuis un thread par lots de AUDIT_TAILLE_LOT ou
+#   toutes les AUDIT_DELAI_FLUSH secondes. Les entrées en attente sont
+#   écrites à l'arrêt du processus, mais perdues s'il est tué.
+# Au-delà de AUDIT_TAILLE_MAX entrées en attente, l'appelant écrit lui-même.
+
+
+def _reglage(nom, defaut):
+    return getattr(settings, nom, defaut)
+
+
+def _differe():
+    return _reglage('AUDIT_DURABILITE', 'transaction') == 'tampon'
+
+
+def _ecrire(entrees):
+    from .models import AuditLog
+
+    try:
+        AuditLog.objects.bulk_create(entrees)
+        return
+    except DatabaseError:
+        logger.exception("Écriture de %d entrée(s) d'audit en lot échouée",
+                         len(entrees))
+
+    # Une entrée invalide (utilisateur supprimé entre-temps...) ne doit pas
+    # faire perdre le reste du lot
+    for entree in entrees:
+        try:
+            AuditLog.objects.bulk_create([entree])
+        except DatabaseError:
+            logger.error("Entrée d'audit perdue : %s %s #%s", entree.action,
+                         entree.modele, entree.objet_id)
+
+
+class EcrivainAudit:
+    """File d'entrées d'audit vidée par un thread d'arrière-plan"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._thread = None
+
+    def _demarrer(self):
+        # Démarré au premier usage, et à nouveau après un fork (workers)
+        with self._verrou:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._file = queue.Queue(
+                maxsize=_reglage('AUDIT_TAILLE_MAX', 10000))
+            self._thread = threading.Thread(
+                target=self._boucle, name='ecrivain-audit', daemon=True)
+            self._thread.start()
+
+    def ajouter(self, entrees):
+        self._demarrer()
+        for index, entree in enumerate(entrees):
+            try:
+                self._file.put_nowait(entree)
+            except queue.Full:
+                # File saturée : l'appelant écrit le reste lui-même
+                _ecrire(entrees[index:])
+                return
+
+    def vider(self, timeout=10):
+        """Écrit les entrées en attente ; retourne False si le délai expire"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        termine = threading.Event()
+        self._file.put(termine)
+        return termine.wait(timeout)
+
+    def _boucle(self):
+        while True:
+            lot, signaux = [], []
+            element = self._file.get()
+            limite = time.monotonic() + _reglage('AUDIT_DELAI_FLUSH', 2)
+            taille = _reglage('AUDIT_TAILLE_LOT', 200)
+            while True:
+                if isinstance(element, threading.Event):
+                    signaux.append(element)
+                    if self._file.empty():
+                        break
+                else:
+                    lot.append(element)
+                    # Une demande de vidage attend que toute la file soit écrite
+                    if len(lot) >= taille and not signaux:
+                        break
+                try:
+                    if signaux:
+                        element = self._file.get_nowait()
+                    else:
+                        element = self._file.get(
+                            timeout=max(limite - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if lot:
+                close_old_connections()
+                try:
+                    _ecrire(lot)
+                except Exception:
+                    logger.exception("Écrivain d'audit : %d entrée(s) perdue(s)",
+                                     len(lot))
+                    connection.close()
+            for signal in signaux:
+                signal.set()
+
+
+_ecrivain = EcrivainAudit()
+atexit.register(_ecrivain.vider)
+
+
+def journaliser_lot(entrees):
+    """Enregistre des instances AuditLog non sauvegardées"""
+    entrees = list(entrees)
+    if not entrees:
+        return
+    if not _differe():
+        from .models import AuditLog
+
+        AuditLog.objects.bulk_create(entrees)
+        return
+    transaction.on_commit(lambda: _ecrivain.ajouter(entrees))
+
+
+def journaliser(**champs):
+    """Équivalent de AuditLog.objects.create(**champs) selon AUDIT_DURABILITE
+
+    La date de l'entrée est celle de l'appel, pas celle de l'écriture.
+    """
+    from .models import AuditLog
+
+    journaliser_lot([AuditLog(**champs)])
+
+
+def vider(timeout=10):
+    """Écrit immédiatement les entrées en attente du processus courant"""
+    return _ecrivain.vider(timeout)
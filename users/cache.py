@@ -0,0 +1,72 @@
+# cache.py - Cache du tableau de bord (framework de cache Django)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+# Le tableau de bord est découpé en sections mises en cache séparément :
+# - 'ventes' : dépend des ventes, paiements et clients, une entrée par portée
+# - 'stocks' : dépend de StockEntrepot, Entrepot et Produit, invalidé pour
+#   toutes les portées
+# Une modification de Produit invalide les deux sections.
+SECTIONS_DASHBOARD = ('ventes', 'stocks')
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def portee_dashboard(user):
+    """Portée du cache : 'admin' ou 'vendeur:<id>'"""
+    if user.role == 'admin':
+        return 'admin'
+    return f'vendeur:{user.id}'
+
+
+def _generation(section):
+    # Incrémenter la génération invalide d'un coup toutes les portées
+    return cache.get_or_set(f'dashboard:{section}:generation', 1, None)
+
+
+def _cle(section, portee):
+    return (f'dashboard:{section}:{portee}:'
+            f'{timezone.localdate().isoformat()}:{_generation(section)}')
+
+
+def section_dashboard(section, portee, calculer, rafraichir=False):
+    """Retourne (données, généré_le, depuis_cache) pour une section
+
+    `calculer` n'est appelé que si la section est absente du cache.
+    """
+    cle = _cle(section, portee)
+    entree = None if rafraichir else cache.get(cle)
+    if entree is not None:
+        return entree['donnees'], entree['genere_le'], True
+
+    entree = {'donnees': calculer(), 'genere_le': timezone.now()}
+    cache.set(cle, entree, _timeout())
+    return entree['donnees'], entree['genere_le'], False
+
+
+def _invalider(section, vendeur_id=None):
+    if section == 'stocks' or vendeur_id is None:
+        try:
+            cache.incr(f'dashboard:{section}:generation')
+        except ValueError:
+            cache.set(f'dashboard:{section}:generation', 1, None)
+        return
+
+    cache.delete_many([
+        _cle(section, 'admin'),
+        _cle(section, f'vendeur:{vendeur_id}'),
+    ])
+
+
+def invalider_dashboard(section, vendeur_id=None):
+    """Invalide une section après le commit de la transaction en cours
+
+    Pour 'ventes', seules les portées admin et du vendeur concerné sont
+    invalidées ; sans vendeur, toutes les portées le sont.
+    """
+    transaction.on_commit(lambda: _invalider(section, vendeur_id))
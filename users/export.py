@@ -0,0 +1,101 @@
+# export.py - Exports de rapports diffusés au fil de l'eau (CSV, XLSX, NDJSON)
+import csv
+import json
+import tempfile
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# Les vues qui exportent renvoient elles-mêmes un StreamingHttpResponse ;
+# ces renderers déclarent les formats pour la négociation de contenu de DRF
+# (?format=csv, en-tête Accept). Sans eux, ?format=csv donne un 404. Les
+# réponses d'erreur restent rendues en JSON.
+class CSVRenderer(JSONRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class XLSXRenderer(JSONRenderer):
+    media_type = ('application/vnd.openxmlformats-officedocument.'
+                  'spreadsheetml.sheet')
+    format = 'xlsx'
+
+
+class NDJSONRenderer(JSONRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+RENDERERS_EXPORT = (CSVRenderer, XLSXRenderer, NDJSONRenderer)
+FORMATS_EXPORT = tuple(renderer.format for renderer in RENDERERS_EXPORT)
+
+TAILLE_MORCEAU = 64 * 1024
+
+
+class _Tampon:
+    """Pseudo-fichier pour csv.writer : write() renvoie la ligne écrite"""
+
+    def write(self, valeur):
+        return valeur
+
+
+def _valeur_cellule(valeur):
+    # openpyxl refuse les dates avec fuseau horaire
+    if hasattr(valeur, 'tzinfo') and valeur.tzinfo is not None:
+        return timezone.localtime(valeur).replace(tzinfo=None)
+    return valeur
+
+
+def _flux_csv(lignes, colonnes):
+    writer = csv.writer(_Tampon())
+    # BOM : accents lus correctement par Excel
+    yield '\ufeff' + writer.writerow([titre for _, titre in colonnes])
+    for ligne in lignes:
+        yield writer.writerow(ligne)
+
+
+def _flux_ndjson(lignes, colonnes):
+    cles = [cle for cle, _ in colonnes]
+    for ligne in lignes:
+        yield json.dumps(dict(zip(cles, ligne)), cls=JSONEncoder) + '\n'
+
+
+def _flux_xlsx(lignes, colonnes, titre):
+    # Classeur en écriture seule : les lignes sont écrites dans un fichier
+    # temporaire au fur et à mesure, puis le fichier est envoyé par morceaux
+    from openpyxl import Workbook
+
+    classeur = Workbook(write_only=True)
+    feuille = classeur.create_sheet(title=titre[:31])
+    feuille.append([titre for _, titre in colonnes])
+    for ligne in lignes:
+        feuille.append([_valeur_cellule(valeur) for valeur in ligne])
+
+    with tempfile.TemporaryFile() as fichier:
+        classeur.save(fichier)
+        fichier.seek(0)
+        while morceau := fichier.read(TAILLE_MORCEAU):
+            yield morceau
+
+
+def reponse_export(format_export, lignes, colonnes, nom):
+    """StreamingHttpResponse d'un export
+
+    `lignes` : itérable de tuples (typiquement values_list(...).iterator()),
+    `colonnes` : [(clé, titre)] dans le même ordre, `nom` : nom du fichier
+    sans extension.
+    """
+    if format_export == 'csv':
+        contenu, type_mime = _flux_csv(lignes, colonnes), 'text/csv; charset=utf-8'
+    elif format_export == 'xlsx':
+        contenu, type_mime = _flux_xlsx(lignes, colonnes, nom), XLSXRenderer.media_type
+    else:
+        contenu, type_mime = _flux_ndjson(lignes, colonnes), NDJSONRenderer.media_type
+
+    reponse = StreamingHttpResponse(contenu, content_type=type_mime)
+    reponse['Content-Disposition'] = (
+        f'attachment; filename="{nom}_{timezone.localdate():%Y%m%d}.{format_export}"')
+    return reponse
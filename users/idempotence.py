@@ -0,0 +1,117 @@
+# idempotence.py - Rejeu des requêtes POST via l'en-tête Idempotency-Key
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import CleIdempotence
+
+
+# Un terminal qui renvoie une requête (timeout réseau) avec la même clé
+# reçoit la réponse enregistrée, sans nouvelle exécution de la vue.
+# Les réponses 5xx et les exceptions (dont les erreurs de validation levées
+# par le serializer) ne sont pas conservées : la requête sera réexécutée.
+# Une requête interrompue sans réponse (worker tué) garde sa clé en cours
+# jusqu'à la fin de son bail (IDEMPOTENCE_BAIL) ; un nouvel essai la reprend
+# ensuite.
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCE_TTL', 24 * 3600))
+
+
+def _bail():
+    return timezone.now() + timedelta(
+        seconds=getattr(settings, 'IDEMPOTENCE_BAIL', 300))
+
+
+def expirees():
+    """Clés dont la durée de conservation est dépassée"""
+    return CleIdempotence.objects.filter(created_at__lt=timezone.now() - _ttl())
+
+
+def _empreinte(request):
+    contenu = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def _erreur(message, code):
+    return Response({'error': message}, status=code)
+
+
+def idempotent(vue):
+    """Décorateur de méthode de ViewSet : active l'en-tête Idempotency-Key"""
+    @wraps(vue)
+    def wrapper(self, request, *args, **kwargs):
+        cle = request.headers.get('Idempotency-Key')
+        if not cle:
+            return vue(self, request, *args, **kwargs)
+        if len(cle) > 255:
+            return _erreur("Idempotency-Key trop longue (255 caractères max)",
+                           status.HTTP_400_BAD_REQUEST)
+
+        endpoint = f'{request.method} {request.path}'[:255]
+        empreinte = _empreinte(request)
+
+        existante = CleIdempotence.objects.filter(
+            user=request.user, cle=cle).first()
+        if existante is not None and existante.created_at < timezone.now() - _ttl():
+            existante.delete()
+            existante = None
+
+        if existante is None:
+            try:
+                # Enregistrée (validée) avant l'exécution : une requête
+                # concurrente avec la même clé obtient un 409
+                existante = CleIdempotence.objects.create(
+                    user=request.user, cle=cle, endpoint=endpoint,
+                    empreinte=empreinte, bail_expire_le=_bail())
+            except IntegrityError:
+                return _erreur("Requête en cours de traitement avec cette clé",
+                               status.HTTP_409_CONFLICT)
+        else:
+            if (existante.endpoint, existante.empreinte) != (endpoint, empreinte):
+                return _erreur(
+                    "Idempotency-Key déjà utilisée pour une autre requête",
+                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if existante.statut_http is not None:
+                return Response(existante.reponse, status=existante.statut_http,
+                                headers={'Idempotent-Replayed': 'true'})
+            # Bail expiré : la clé est reprise par un UPDATE conditionnel,
+            # un seul essai concurrent l'obtient
+            en_cours = (existante.bail_expire_le is not None
+                        and existante.bail_expire_le > timezone.now())
+            bail = _bail()
+            reprise = not en_cours and CleIdempotence.objects.filter(
+                pk=existante.pk, statut_http__isnull=True,
+                bail_expire_le=existante.bail_expire_le,
+            ).update(bail_expire_le=bail)
+            if not reprise:
+                return _erreur("Requête en cours de traitement avec cette clé",
+                               status.HTTP_409_CONFLICT)
+            existante.bail_expire_le = bail
+
+        # Écritures limitées au bail courant : sans effet si la clé a été
+        # reprise entre-temps
+        mienne = CleIdempotence.objects.filter(
+            pk=existante.pk, bail_expire_le=existante.bail_expire_le)
+        try:
+            # La réponse est enregistrée dans la transaction de la vue
+            with transaction.atomic():
+                reponse = vue(self, request, *args, **kwargs)
+                if reponse.status_code < 500:
+                    mienne.update(statut_http=reponse.status_code,
+                                  reponse=getattr(reponse, 'data', None))
+        except Exception:
+            mienne.delete()
+            raise
+        if reponse.status_code >= 500:
+            mienne.delete()
+        return reponse
+    return wrapper
@@ -0,0 +1,78 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.utils import timezone
+
+from users.models import StockEntrepot, ValorisationStock
+
+
+VALEUR = DecimalField(max_digits=14, decimal_places=2)
+
+# niveau -> (regroupement sur StockEntrepot, libellé, champ de ValorisationStock)
+NIVEAUX = {
+    'entrepot': ('entrepot_id', 'entrepot__nom', 'entrepot_id'),
+    'categorie': ('produit__categorie_id', 'produit__categorie__nom', 'categorie_id'),
+    'produit': ('produit_id', 'produit__nom', 'produit_id'),
+}
+
+
+class Command(BaseCommand):
+    help = ("Enregistre la valorisation du stock du jour par entrepôt, "
+            "par catégorie et par produit (table ValorisationStock)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', help="Date de la photographie (AAAA-MM-JJ), aujourd'hui par défaut")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Nombre de lignes par bulk_create")
+
+    def handle(self, *args, **options):
+        try:
+            jour = date.fromisoformat(options['date']) if options['date'] \
+                else timezone.localdate()
+        except ValueError:
+            raise CommandError("Format de date attendu : AAAA-MM-JJ")
+
+        batch_size = options['batch_size']
+        total = 0
+
+        with transaction.atomic():
+            # Une nouvelle exécution le même jour remplace la précédente
+            ValorisationStock.objects.filter(date=jour).delete()
+
+            for niveau, (cle, libelle, champ) in NIVEAUX.items():
+                lignes = StockEntrepot.objects.order_by().values(
+                    cle, libelle
+                ).annotate(
+                    total_quantite=Sum('quantite'),
+                    total_reservee=Sum('quantite_reservee'),
+                    total_achat=Sum(F('quantite') * F('produit__prix_achat'),
+                                    output_field=VALEUR),
+                    total_vente=Sum(F('quantite') * F('produit__prix_vente'),
+                                    output_field=VALEUR),
+                )
+
+                lot = []
+                for ligne in lignes.iterator(chunk_size=batch_size):
+                    lot.append(ValorisationStock(
+                        date=jour,
+                        niveau=niveau,
+                        **{champ: ligne[cle]},
+                        libelle=ligne[libelle] or '',
+                        quantite=ligne['total_quantite'] or 0,
+                        quantite_reservee=ligne['total_reservee'] or 0,
+                        valeur_achat=ligne['total_achat'] or 0,
+                        valeur_vente=ligne['total_vente'] or 0,
+                    ))
+                    if len(lot) >= batch_size:
+                        ValorisationStock.objects.bulk_create(lot)
+                        total += len(lot)
+                        lot = []
+                ValorisationStock.objects.bulk_create(lot)
+                total += len(lot)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Valorisation du {jour} enregistrée ({total} ligne(s))"))
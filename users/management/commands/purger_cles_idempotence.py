@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from users.idempotence import expirees
+
+
+class Command(BaseCommand):
+    help = ("Supprime les clés Idempotency-Key dont la durée de conservation "
+            "(IDEMPOTENCE_TTL) est dépassée")
+
+    def handle(self, *args, **options):
+        supprimees, _ = expirees().delete()
+        self.stdout.write(self.style.SUCCESS(
+            f"{supprimees} clé(s) expirée(s) supprimée(s)"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Produit, StockEntrepot
+
+
+class Command(BaseCommand):
+    help = ("Reconstruit les totaux de stock stockés sur Produit "
+            "(quantite_totale, quantite_reservee) à partir de StockEntrepot")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Affiche le nombre de produits désynchronisés sans rien modifier")
+
+    def handle(self, *args, **options):
+        stocks = StockEntrepot.objects.filter(
+            produit=OuterRef('pk')
+        ).order_by().values('produit')
+
+        desynchronises = Produit.objects.annotate(
+            reel_total=Coalesce(
+                Subquery(stocks.annotate(total=Sum('quantite')).values('total')),
+                Value(0)
+            ),
+            reel_reserve=Coalesce(
+                Subquery(stocks.annotate(
+                    total=Sum('quantite_reservee')).values('total')),
+                Value(0)
+            ),
+        ).exclude(
+            Q(quantite_totale=F('reel_total')) &
+            Q(quantite_reservee=F('reel_reserve'))
+        ).count()
+
+        if options['dry_run']:
+            self.stdout.write(f"{desynchronises} produit(s) désynchronisé(s)")
+            return
+
+        with transaction.atomic():
+            total = Produit.objects.all().synchroniser_stocks()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} produit(s) recalculé(s), {desynchronises} corrigé(s)"))
@@ -0,0 +1,102 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+
+from users.models import (
+    LigneDeVente, LigneVenteJournaliere, Vente, VenteJournaliere
+)
+
+
+MONTANT = DecimalField(max_digits=14, decimal_places=2)
+
+
+class Command(BaseCommand):
+    help = ("Reconstruit les agrégats quotidiens des ventes confirmées "
+            "(VenteJournaliere, LigneVenteJournaliere)")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--depuis', help="Ne reconstruit qu'à partir de cette date (AAAA-MM-JJ)")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Nombre de lignes par bulk_create")
+
+    def handle(self, *args, **options):
+        try:
+            depuis = date.fromisoformat(options['depuis']) if options['depuis'] else None
+        except ValueError:
+            raise CommandError("Format de date attendu : AAAA-MM-JJ")
+        batch_size = options['batch_size']
+
+        ventes = Vente.objects.filter(statut='confirmee')
+        lignes = LigneDeVente.objects.filter(vente__statut='confirmee')
+        if depuis:
+            ventes = ventes.filter(created_at__date__gte=depuis)
+            lignes = lignes.filter(vente__created_at__date__gte=depuis)
+
+        par_vendeur = ventes.annotate(
+            jour=TruncDate('created_at')
+        ).order_by().values('jour', 'created_by_id').annotate(
+            total_ventes=Count('id'),
+            total_montant=Sum('montant_total'),
+        )
+
+        par_ligne = lignes.annotate(
+            jour=TruncDate('vente__created_at')
+        ).order_by().values(
+            'jour', 'vente__created_by_id', 'entrepot_id', 'produit_id'
+        ).annotate(
+            total_quantite=Sum('quantite'),
+            total_montant=Sum(F('quantite') * F('prix_unitaire'),
+                              output_field=MONTANT),
+            total_ventes=Count('vente', distinct=True),
+        )
+
+        with transaction.atomic():
+            anciens_vendeur = VenteJournaliere.objects.all()
+            anciens_ligne = LigneVenteJournaliere.objects.all()
+            if depuis:
+                anciens_vendeur = anciens_vendeur.filter(date__gte=depuis)
+                anciens_ligne = anciens_ligne.filter(date__gte=depuis)
+            anciens_vendeur.delete()
+            anciens_ligne.delete()
+
+            total_vendeur = self._inserer(VenteJournaliere, (
+                VenteJournaliere(
+                    date=ligne['jour'],
+                    vendeur_id=ligne['created_by_id'],
+                    nombre_ventes=ligne['total_ventes'],
+                    chiffre_affaires=ligne['total_montant'] or 0,
+                ) for ligne in par_vendeur.iterator(chunk_size=batch_size)
+            ), batch_size)
+
+            total_ligne = self._inserer(LigneVenteJournaliere, (
+                LigneVenteJournaliere(
+                    date=ligne['jour'],
+                    vendeur_id=ligne['vente__created_by_id'],
+                    entrepot_id=ligne['entrepot_id'],
+                    produit_id=ligne['produit_id'],
+                    quantite=ligne['total_quantite'] or 0,
+                    chiffre_affaires=ligne['total_montant'] or 0,
+                    nombre_ventes=ligne['total_ventes'],
+                ) for ligne in par_ligne.iterator(chunk_size=batch_size)
+            ), batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_vendeur} agrégat(s) vendeur et "
+            f"{total_ligne} agrégat(s) produit reconstruits"))
+
+    def _inserer(self, modele, objets, batch_size):
+        total = 0
+        lot = []
+        for objet in objets:
+            lot.append(objet)
+            if len(lot) >= batch_size:
+                modele.objects.bulk_create(lot)
+                total += len(lot)
+                lot = []
+        modele.objects.bulk_create(lot)
+        return total + len(lot)
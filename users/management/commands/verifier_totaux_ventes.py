@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.models import Vente
+
+
+class Command(BaseCommand):
+    help = ("Vérifie les montants stockés sur Vente (montant_total, "
+            "montant_restant) par rapport à leurs lignes")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--corriger', action='store_true',
+            help="Recalcule les montants des ventes incohérentes")
+        parser.add_argument(
+            '--limite', type=int, default=20,
+            help="Nombre de ventes incohérentes affichées (défaut : 20)")
+
+    def handle(self, *args, **options):
+        incoherentes = Vente.objects.incoherentes().order_by('pk')
+        total = incoherentes.count()
+
+        for vente in incoherentes[:options['limite']]:
+            self.stdout.write(
+                f"{vente.numero_vente} : montant_total={vente.montant_total} "
+                f"attendu={vente.total_calcule}, "
+                f"montant_restant={vente.montant_restant}")
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS("Tous les totaux sont cohérents"))
+            return
+
+        if not options['corriger']:
+            self.stdout.write(f"{total} vente(s) incohérente(s)")
+            return
+
+        with transaction.atomic():
+            corrigees = Vente.objects.filter(
+                pk__in=incoherentes.values('pk')
+            ).recalculer_totaux()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{corrigees} vente(s) corrigée(s)"))
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:53
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def remplir_totaux_stock(apps, schema_editor):
+    Produit = apps.get_model("users", "Produit")
+    StockEntrepot = apps.get_model("users", "StockEntrepot")
+
+    stocks = (
+        StockEntrepot.objects.filter(produit=OuterRef("pk"))
+        .order_by()
+        .values("produit")
+    )
+    Produit.objects.update(
+        quantite_totale=Coalesce(
+            Subquery(stocks.annotate(total=Sum("quantite")).values("total")),
+            Value(0),
+        ),
+        quantite_reservee=Coalesce(
+            Subquery(stocks.annotate(total=Sum("quantite_reservee")).values("total")),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_produit_image_produit_thumbnail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="produit",
+            name="quantite_reservee",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="produit",
+            name="quantite_totale",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(remplir_totaux_stock, migrations.RunPython.noop),
+    ]
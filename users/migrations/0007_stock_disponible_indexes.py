@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:54
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0006_produit_quantite_totale_produit_quantite_reservee"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="produit",
+            index=models.Index(
+                F("quantite_totale") - F("quantite_reservee"),
+                name="produit_disponible_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="produit",
+            index=models.Index(
+                F("quantite_totale") - F("quantite_reservee") - F("stock_alerte"),
+                name="produit_marge_alerte_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockentrepot",
+            index=models.Index(
+                F("quantite") - F("quantite_reservee"),
+                name="stock_disponible_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockentrepot",
+            index=models.Index(
+                F("quantite") - F("quantite_reservee") - F("stock_alerte"),
+                name="stock_marge_alerte_idx",
+            ),
+        ),
+    ]
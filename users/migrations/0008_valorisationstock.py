@@ -0,0 +1,86 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0007_stock_disponible_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ValorisationStock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                (
+                    "niveau",
+                    models.CharField(
+                        choices=[
+                            ("entrepot", "Entrepôt"),
+                            ("categorie", "Catégorie"),
+                            ("produit", "Produit"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("libelle", models.CharField(blank=True, max_length=200)),
+                ("quantite", models.IntegerField(default=0)),
+                ("quantite_reservee", models.IntegerField(default=0)),
+                (
+                    "valeur_achat",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "valeur_vente",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "categorie",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="users.categorie",
+                    ),
+                ),
+                (
+                    "entrepot",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="users.entrepot",
+                    ),
+                ),
+                (
+                    "produit",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="users.produit",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "indexes": [
+                    models.Index(
+                        fields=["niveau", "date"], name="valorisation_niveau_date_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:58
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0008_valorisationstock"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="stockentrepot",
+            name="stock_disponible_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="stockentrepot",
+            name="stock_marge_alerte_idx",
+        ),
+        migrations.AddField(
+            model_name="stockentrepot",
+            name="quantite_disponible",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=django.db.models.functions.comparison.Greatest(
+                    django.db.models.expressions.CombinedExpression(
+                        models.F("quantite"), "-", models.F("quantite_reservee")
+                    ),
+                    models.Value(0),
+                ),
+                output_field=models.IntegerField(),
+            ),
+        ),
+        migrations.AddField(
+            model_name="stockentrepot",
+            name="statut_stock",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(
+                        quantite__lte=models.F("quantite_reservee"),
+                        then=models.Value("rupture"),
+                    ),
+                    models.When(
+                        quantite__lte=django.db.models.expressions.CombinedExpression(
+                            models.F("quantite_reservee"), "+", models.F("stock_alerte")
+                        ),
+                        then=models.Value("faible"),
+                    ),
+                    default=models.Value("normal"),
+                ),
+                output_field=models.CharField(
+                    choices=[
+                        ("rupture", "Rupture"),
+                        ("faible", "Stock faible"),
+                        ("normal", "Normal"),
+                    ],
+                    max_length=10,
+                ),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="stockentrepot",
+            index=models.Index(
+                fields=["statut_stock", "entrepot"], name="stock_statut_entrepot_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def remplir_agregats(apps, schema_editor):
+    Vente = apps.get_model("users", "Vente")
+    LigneDeVente = apps.get_model("users", "LigneDeVente")
+    VenteJournaliere = apps.get_model("users", "VenteJournaliere")
+    LigneVenteJournaliere = apps.get_model("users", "LigneVenteJournaliere")
+
+    par_vendeur = (
+        Vente.objects.filter(statut="confirmee")
+        .annotate(jour=TruncDate("created_at"))
+        .order_by()
+        .values("jour", "created_by_id")
+        .annotate(total_ventes=Count("id"), total_montant=Sum("montant_total"))
+    )
+    VenteJournaliere.objects.bulk_create(
+        VenteJournaliere(
+            date=ligne["jour"],
+            vendeur_id=ligne["created_by_id"],
+            nombre_ventes=ligne["total_ventes"],
+            chiffre_affaires=ligne["total_montant"] or 0,
+        )
+        for ligne in par_vendeur
+    )
+
+    par_ligne = (
+        LigneDeVente.objects.filter(vente__statut="confirmee")
+        .annotate(jour=TruncDate("vente__created_at"))
+        .order_by()
+        .values("jour", "vente__created_by_id", "entrepot_id", "produit_id")
+        .annotate(
+            total_quantite=Sum("quantite"),
+            total_montant=Sum(
+                F("quantite") * F("prix_unitaire"),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+            total_ventes=Count("vente", distinct=True),
+        )
+    )
+    LigneVenteJournaliere.objects.bulk_create(
+        LigneVenteJournaliere(
+            date=ligne["jour"],
+            vendeur_id=ligne["vente__created_by_id"],
+            entrepot_id=ligne["entrepot_id"],
+            produit_id=ligne["produit_id"],
+            quantite=ligne["total_quantite"] or 0,
+            chiffre_affaires=ligne["total_montant"] or 0,
+            nombre_ventes=ligne["total_ventes"],
+        )
+        for ligne in par_ligne
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0009_stockentrepot_quantite_disponible"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LigneVenteJournaliere",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("quantite", models.IntegerField(default=0)),
+                (
+                    "chiffre_affaires",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                ("nombre_ventes", models.IntegerField(default=0)),
+                (
+                    "entrepot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.entrepot"
+                    ),
+                ),
+                (
+                    "produit",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="users.produit"
+                    ),
+                ),
+                (
+                    "vendeur",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "vendeur", "entrepot", "produit"),
+                        name="unique_ligne_vente_journaliere",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="VenteJournaliere",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("nombre_ventes", models.IntegerField(default=0)),
+                (
+                    "chiffre_affaires",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "vendeur",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("date", "vendeur"), name="unique_vente_journaliere"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(remplir_agregats, migrations.RunPython.noop),
+    ]
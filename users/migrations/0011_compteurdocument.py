@@ -0,0 +1,79 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:03
+
+import re
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+def initialiser_compteurs(apps, schema_editor):
+    """Reprend le plus grand numéro existant par série et par jour"""
+    CompteurDocument = apps.get_model("users", "CompteurDocument")
+    sources = (
+        ("V", apps.get_model("users", "Vente"), "numero_vente"),
+        ("F", apps.get_model("users", "Facture"), "numero_facture"),
+        ("TRF", apps.get_model("users", "TransfertEntrepot"), "reference"),
+    )
+    derniers = {}
+    for serie, modele, champ in sources:
+        motif = re.compile(rf"^{serie}(\d{{8}})(\d+)$")
+        numeros = modele.objects.filter(**{f"{champ}__startswith": serie})
+        for numero in numeros.values_list(champ, flat=True).iterator():
+            correspondance = motif.match(numero)
+            if not correspondance:
+                continue
+            try:
+                jour = datetime.strptime(correspondance[1], "%Y%m%d").date()
+            except ValueError:
+                continue
+            cle = (serie, jour)
+            derniers[cle] = max(derniers.get(cle, 0), int(correspondance[2]))
+
+    CompteurDocument.objects.bulk_create(
+        CompteurDocument(serie=serie, date=jour, dernier_numero=numero)
+        for (serie, jour), numero in derniers.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0010_ventejournaliere_ligneventejournaliere"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompteurDocument",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "serie",
+                    models.CharField(
+                        choices=[
+                            ("V", "Vente"),
+                            ("F", "Facture"),
+                            ("TRF", "Transfert"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("dernier_numero", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("serie", "date"), name="unique_compteur_document"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(initialiser_compteurs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:13
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0011_compteurdocument"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CleIdempotence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("cle", models.CharField(max_length=255)),
+                ("endpoint", models.CharField(max_length=255)),
+                ("empreinte", models.CharField(max_length=64)),
+                ("statut_http", models.PositiveSmallIntegerField(null=True)),
+                (
+                    "reponse",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        null=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "cle"), name="unique_cle_idempotence"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0012_cleidempotence"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="vente",
+            name="reference_locale",
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="vente",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("reference_locale__isnull", False)),
+                fields=("created_by", "reference_locale"),
+                name="unique_vente_reference_locale",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0014_auditlog_created_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mouvementstock",
+            name="type_mouvement",
+            field=models.CharField(
+                choices=[
+                    ("entree", "Entrée en stock"),
+                    ("sortie", "Sortie de stock"),
+                    ("ajustement", "Ajustement"),
+                    ("transfert", "Transfert entrepôt"),
+                    ("liberation", "Libération de réservation"),
+                ],
+                max_length=20,
+            ),
+        ),
+    ]
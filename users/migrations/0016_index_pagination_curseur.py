@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0015_mouvementstock_liberation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="auditlog",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="auditlog_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="mouvementstock",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="mouvement_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transfertentrepot",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="transfert_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vente",
+            index=models.Index(fields=["-created_at", "-id"], name="vente_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="vente",
+            index=models.Index(
+                fields=["created_by", "-created_at", "-id"],
+                name="vente_vendeur_created_idx",
+            ),
+        ),
+    ]
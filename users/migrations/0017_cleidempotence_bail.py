@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0016_index_pagination_curseur"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cleidempotence",
+            name="bail_expire_le",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -1,18 +1,23 @@
-from django.db.models.signals import post_save, post_delete
-from django.db import models
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.db import models, transaction, DatabaseError, IntegrityError
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
-from django.db.models import Sum
+from django.db.models import Sum, OuterRef, Subquery, Value, F, Count, Case, When, Max, ExpressionWrapper
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf, Round
 from django_rest_passwordreset.signals import reset_password_token_created
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.core.mail import EmailMultiAlternatives
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.html import strip_tags
 from django.utils import timezone
 
 # Ajoutez ces imports si nécessaire
 from django.db.models import Q
 
+from .cache import invalider_dashboard
+from .audit import journaliser, journaliser_lot
+
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -90,6 +95,42 @@ class Fournisseur(models.Model):
 # ... autres imports ...
 
 
+# Expressions SQL du stock disponible, partagées par les filtres et les index
+PRODUIT_DISPONIBLE = F('quantite_totale') - F('quantite_reservee')
+STOCK_DISPONIBLE = F('quantite') - F('quantite_reservee')
+
+
+class ProduitQuerySet(models.QuerySet):
+    def en_rupture(self):
+        """Produits dont le stock disponible est nul ou négatif"""
+        return self.alias(disponible_sql=PRODUIT_DISPONIBLE).filter(
+            disponible_sql__lte=0)
+
+    def stock_faible(self):
+        """Produits dont le stock disponible est entre 1 et stock_alerte"""
+        return self.alias(
+            disponible_sql=PRODUIT_DISPONIBLE,
+            marge_alerte=PRODUIT_DISPONIBLE - F('stock_alerte'),
+        ).filter(disponible_sql__gt=0, marge_alerte__lte=0)
+
+    def synchroniser_stocks(self):
+        """Recalcule les totaux de stock stockés à partir de StockEntrepot (un seul UPDATE)"""
+        stocks = StockEntrepot.objects.filter(
+            produit=OuterRef('pk')
+        ).order_by().values('produit')
+        return self.update(
+            quantite_totale=Coalesce(
+                Subquery(stocks.annotate(total=Sum('quantite')).values('total')),
+                Value(0)
+            ),
+            quantite_reservee=Coalesce(
+                Subquery(stocks.annotate(
+                    total=Sum('quantite_reservee')).values('total')),
+                Value(0)
+            ),
+        )
+
+
 class Produit(models.Model):
     code = models.CharField(max_length=50, unique=True)
     nom = models.CharField(max_length=200)
@@ -117,23 +158,43 @@ class Produit(models.Model):
     created_by = models.ForeignKey(
         CustomUser, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Totaux tous entrepôts, maintenus à chaque modification de StockEntrepot
+    quantite_totale = models.IntegerField(default=0, editable=False)
+    quantite_reservee = models.IntegerField(default=0, editable=False)
+
+    objects = ProduitQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(PRODUIT_DISPONIBLE, name='produit_disponible_idx'),
+            models.Index(PRODUIT_DISPONIBLE - F('stock_alerte'),
+                         name='produit_marge_alerte_idx'),
+        ]
+
+    # Colonnes écrites uniquement par synchroniser_stocks()
+    CHAMPS_STOCK = ('quantite_totale', 'quantite_reservee')
+
+    def save(self, *args, **kwargs):
+        # Un UPDATE ne réécrit pas les totaux de stock depuis la copie en
+        # mémoire : ils ont pu changer depuis la lecture du produit
+        if not self._state.adding and not args and \
+                kwargs.get('update_fields') is None:
+            differes = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                champ.name for champ in self._meta.concrete_fields
+                if not champ.primary_key and champ.name not in self.CHAMPS_STOCK
+                and champ.attname not in differes
+            ]
+        super().save(*args, **kwargs)
 
     def stock_actuel(self):
         """Stock total dans tous les entrepôts"""
-        total = StockEntrepot.objects.filter(produit=self).aggregate(
-            total=Sum('quantite')
-        )['total'] or 0
-        return total
+        return self.quantite_totale
 
     def stock_reserve(self):
         """Stock réservé dans tous les entrepôts"""
-        total = StockEntrepot.objects.filter(produit=self).aggregate(
-            total=Sum('quantite_reservee')
-        )['total'] or 0
-        return total
+        return self.quantite_reservee
 
     # PROPRIÉTÉS (ajoutez @property)
     @property
@@ -153,6 +214,35 @@ class Produit(models.Model):
         return f"{self.nom} ({self.code})"
 
 
+class ClientQuerySet(models.QuerySet):
+    def avec_statistiques(self, date_debut=None, date_fin=None):
+        """Annote les statistiques d'achat en une requête groupée
+
+        total_achats, nombre_commandes, dernier_achat et solde_restant
+        portent sur les ventes confirmées ; la période (dates incluses)
+        est appliquée en agrégation conditionnelle, les clients sans vente
+        sur la période restent présents avec des totaux à zéro.
+        """
+        ventes = Q(vente__statut='confirmee')
+        if date_debut:
+            ventes &= Q(vente__created_at__date__gte=date_debut)
+        if date_fin:
+            ventes &= Q(vente__created_at__date__lte=date_fin)
+        montant = models.DecimalField(max_digits=14, decimal_places=2)
+        # Meta.ordering n'est pas appliqué aux requêtes GROUP BY
+        ordering = self.query.order_by or self.model._meta.ordering
+        return self.order_by(*ordering).annotate(
+            total_achats=Coalesce(
+                Sum('vente__montant_total', filter=ventes),
+                Value(0), output_field=montant),
+            nombre_commandes=Count('vente', filter=ventes),
+            dernier_achat=Max('vente__created_at', filter=ventes),
+            solde_restant=Coalesce(
+                Sum('vente__montant_restant', filter=ventes),
+                Value(0), output_field=montant),
+        )
+
+
 class Client(models.Model):
     TYPE_CLIENT_CHOICES = (
         ('particulier', 'Particulier'),
@@ -169,6 +259,8 @@ class Client(models.Model):
         CustomUser, on_delete=models.SET_NULL, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ClientQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
 
@@ -178,6 +270,76 @@ class Client(models.Model):
 # DÉPLACEZ Entrepot ICI, AVANT MouvementStock
 
 
+class EntrepotQuerySet(models.QuerySet):
+    def avec_valorisation(self, prix='achat'):
+        """Annote valeur_stock et nombre_produits en une requête groupée
+
+        prix : 'achat' (prix_achat) ou 'vente' (prix_vente) du produit.
+        """
+        if prix not in ('achat', 'vente'):
+            raise ValueError("prix doit valoir 'achat' ou 'vente'")
+        # Meta.ordering n'est pas appliqué aux requêtes GROUP BY
+        ordering = self.query.order_by or self.model._meta.ordering
+        return self.order_by(*ordering).annotate(
+            valeur_stock=Coalesce(
+                Sum(
+                    F('stockentrepot__quantite') *
+                    F(f'stockentrepot__produit__prix_{prix}'),
+                    output_field=models.DecimalField(
+                        max_digits=14, decimal_places=2)
+                ),
+                Value(0),
+                output_field=models.DecimalField(
+                    max_digits=14, decimal_places=2)
+            ),
+            nombre_produits=Count('stockentrepot'),
+        )
+
+    def avec_ventes(self, date_debut=None, date_fin=None):
+        """Annote chiffre_affaires, nombre_ventes et quantite_vendue
+
+        Calculés depuis les lignes de vente confirmées sorties de chaque
+        entrepôt (sous-requêtes groupées, sans multiplier les lignes d'une
+        éventuelle annotation de stock) : une vente répartie sur plusieurs
+        entrepôts n'est comptée qu'à hauteur de ses lignes. La remise de la
+        vente est répartie au prorata des lignes.
+        """
+        lignes = LigneDeVente.objects.filter(
+            entrepot=OuterRef('pk'), vente__statut='confirmee')
+        if date_debut:
+            lignes = lignes.filter(vente__created_at__date__gte=date_debut)
+        if date_fin:
+            lignes = lignes.filter(vente__created_at__date__lte=date_fin)
+        lignes = lignes.order_by().values('entrepot')
+
+        montant = models.DecimalField(max_digits=14, decimal_places=2)
+        sous_total = F('quantite') * F('prix_unitaire')
+        # Part de la vente après remise : montant_total / (montant_total + remise).
+        # Calcul en flottant : SQLite stocke les montants entiers en INTEGER
+        # (CAST AS NUMERIC compris) et ferait une division entière
+        flottant = models.FloatField()
+        net = ExpressionWrapper(
+            Cast(sous_total * F('vente__montant_total'), flottant) / NullIf(
+                Cast(F('vente__montant_total') + F('vente__remise'), flottant),
+                Value(0.0)),
+            output_field=flottant)
+
+        def agregat(expression, output_field):
+            return Coalesce(
+                Subquery(lignes.annotate(valeur=expression).values('valeur'),
+                         output_field=output_field),
+                Value(0), output_field=output_field)
+
+        return self.annotate(
+            chiffre_affaires=agregat(
+                Round(Sum(net), 2, output_field=montant),
+                montant),
+            nombre_ventes=agregat(Count('vente', distinct=True),
+                                  models.IntegerField()),
+            quantite_vendue=agregat(Sum('quantite'), models.IntegerField()),
+        )
+
+
 class Entrepot(models.Model):
     """Modèle pour les entrepôts"""
     nom = models.CharField(max_length=200)
@@ -192,28 +354,176 @@ class Entrepot(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     actif = models.BooleanField(default=True)
 
+    objects = EntrepotQuerySet.as_manager()
+
     class Meta:
         ordering = ['nom']
         verbose_name_plural = 'Entrepôts'
 
     def stock_total_valeur(self):
         """Calcule la valeur totale du stock dans l'entrepôt"""
-        stocks = StockEntrepot.objects.filter(entrepot=self)
-        total = 0
-        for stock in stocks:
-            total += stock.quantite * stock.produit.prix_achat
-        return total
+        # Valeur déjà annotée par Entrepot.objects.avec_valorisation()
+        if hasattr(self, 'valeur_stock'):
+            return self.valeur_stock
+        return Entrepot.objects.filter(pk=self.pk).avec_valorisation().values_list(
+            'valeur_stock', flat=True).get()
 
     def produits_count(self):
         """Nombre de produits différents dans l'entrepôt"""
+        if hasattr(self, 'nombre_produits'):
+            return self.nombre_produits
         return StockEntrepot.objects.filter(entrepot=self).count()
 
     def __str__(self):
         return f"{self.nom}"
 
 
+class StockInsuffisantError(ValueError):
+    """Mouvement de stock refusé ; `details` liste les lignes en cause"""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details or []
+
+
+def quantites_par_stock(lignes):
+    """Cumule les quantités de lignes de vente par (produit_id, entrepot_id)"""
+    quantites = {}
+    for ligne in lignes:
+        cle = (ligne.produit_id, ligne.entrepot_id)
+        quantites[cle] = quantites.get(cle, 0) + ligne.quantite
+    return quantites
+
+
+class StockEntrepotQuerySet(models.QuerySet):
+    def en_rupture(self):
+        """Stocks dont la quantité disponible est nulle"""
+        return self.filter(statut_stock='rupture')
+
+    def stock_faible(self):
+        """Stocks dont la quantité disponible est entre 1 et stock_alerte"""
+        return self.filter(statut_stock='faible')
+
+    # Mouvements en lot : `demandes` = {(produit_id, entrepot_id): quantite}.
+    # Chaque entrepôt reçoit un seul UPDATE conditionnel ; si une ligne ne
+    # satisfait pas la condition, tout le lot est annulé.
+
+    def reserver_lot(self, demandes):
+        """Réserve les quantités si le disponible est suffisant"""
+        self._mouvement_lot(
+            demandes,
+            condition=lambda n: Q(quantite_disponible__gte=n),
+            valeurs=lambda n: {'quantite_reservee': F('quantite_reservee') + n},
+            erreur=lambda stock: (
+                f"Stock insuffisant pour {stock.produit.nom} dans "
+                f"{stock.entrepot.nom}. Disponible: {stock.quantite_disponible}"),
+            verifier=lambda stock, n: stock.quantite_disponible >= n,
+        )
+
+    def prelever_lot(self, demandes):
+        """Sort du stock des quantités précédemment réservées"""
+        self._mouvement_lot(
+            demandes,
+            condition=lambda n: Q(quantite_reservee__gte=n, quantite__gte=n),
+            valeurs=lambda n: {
+                'quantite_reservee': F('quantite_reservee') - n,
+                'quantite': F('quantite') - n,
+            },
+            erreur=lambda stock: (
+                f"Quantité réservée insuffisante pour {stock.produit.nom} dans "
+                f"{stock.entrepot.nom}: {stock.quantite_reservee}"),
+            verifier=lambda stock, n: (
+                stock.quantite_reservee >= n and stock.quantite >= n),
+        )
+
+    def liberer_lot(self, demandes):
+        """Libère des réservations (sans descendre sous zéro)"""
+        self._mouvement_lot(
+            demandes,
+            condition=None,
+            valeurs=lambda n: {
+                'quantite_reservee': Greatest(
+                    F('quantite_reservee') - n, Value(0)),
+            },
+        )
+
+    def _mouvement_lot(self, demandes, condition, valeurs, erreur=None,
+                       verifier=None):
+        demandes = {cle: n for cle, n in demandes.items() if n}
+        if not demandes:
+            return
+
+        par_entrepot = {}
+        for (produit_id, entrepot_id), quantite in demandes.items():
+            par_entrepot.setdefault(entrepot_id, {})[produit_id] = quantite
+
+        with transaction.atomic():
+            for entrepot_id, quantites in par_entrepot.items():
+                # Quantité propre à chaque ligne : CASE produit_id WHEN ...
+                quantite = Case(
+                    *[When(produit_id=produit_id, then=Value(n))
+                      for produit_id, n in quantites.items()],
+                    output_field=models.IntegerField(),
+                )
+                lignes = self.filter(
+                    entrepot_id=entrepot_id, produit_id__in=list(quantites))
+                if condition is not None:
+                    lignes = lignes.filter(condition(quantite))
+                modifiees = lignes.update(
+                    updated_at=timezone.now(), **valeurs(quantite))
+                if erreur is not None and modifiees != len(quantites):
+                    raise self._erreur_lot(
+                        entrepot_id, quantites, erreur, verifier)
+
+            Produit.objects.filter(
+                pk__in={produit_id for produit_id, _ in demandes}
+            ).synchroniser_stocks()
+        # Les UPDATE en lot ne déclenchent pas les signaux de StockEntrepot
+        invalider_dashboard('stocks')
+
+    def _erreur_lot(self, entrepot_id, quantites, erreur, verifier):
+        stocks = {
+            stock.produit_id: stock
+            for stock in self.model.objects.filter(
+                entrepot_id=entrepot_id, produit_id__in=list(quantites)
+            ).select_related('produit', 'entrepot')
+        }
+        details = []
+        for produit_id, n in quantites.items():
+            stock = stocks.get(produit_id)
+            if stock is None:
+                details.append({
+                    'produit': produit_id, 'entrepot': entrepot_id,
+                    'quantite': n,
+                    'message': "Produit non disponible dans cet entrepôt",
+                })
+            elif not verifier(stock, n):
+                details.append({
+                    'produit': produit_id, 'entrepot': entrepot_id,
+                    'quantite': n, 'message': erreur(stock),
+                })
+        return StockInsuffisantError(
+            '; '.join(detail['message'] for detail in details)
+            or "Stock modifié pendant l'opération", details)
+
+
+def calculer_statut_stock(disponible, stock_alerte):
+    """Équivalent Python de la colonne générée StockEntrepot.statut_stock"""
+    if disponible <= 0:
+        return 'rupture'
+    if disponible <= stock_alerte:
+        return 'faible'
+    return 'normal'
+
+
 class StockEntrepot(models.Model):
     """Stock d'un produit dans un entrepôt spécifique"""
+    STATUT_STOCK = (
+        ('rupture', 'Rupture'),
+        ('faible', 'Stock faible'),
+        ('normal', 'Normal'),
+    )
+
     entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE)
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
     quantite = models.IntegerField(default=0)
@@ -224,50 +534,74 @@ class StockEntrepot(models.Model):
     emplacement = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Colonnes calculées par la base, y compris lors des QuerySet.update()
+    quantite_disponible = models.GeneratedField(
+        expression=Greatest(STOCK_DISPONIBLE, Value(0)),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
+    statut_stock = models.GeneratedField(
+        expression=Case(
+            When(quantite__lte=F('quantite_reservee'), then=Value('rupture')),
+            When(quantite__lte=F('quantite_reservee') + F('stock_alerte'),
+                 then=Value('faible')),
+            default=Value('normal'),
+        ),
+        output_field=models.CharField(max_length=10, choices=STATUT_STOCK),
+        db_persist=True,
+    )
+
+    objects = StockEntrepotQuerySet.as_manager()
 
     class Meta:
         unique_together = ['entrepot', 'produit']
         ordering = ['produit__nom']
+        indexes = [
+            # Sert les recherches globales (statut seul) et par entrepôt
+            models.Index(fields=['statut_stock', 'entrepot'],
+                         name='stock_statut_entrepot_idx'),
+        ]
 
-    @property
-    def quantite_disponible(self):
-        """Quantité réellement disponible pour vente"""
-        return max(0, self.quantite - self.quantite_reservee)
+    def save(self, *args, **kwargs):
+        # Les totaux du produit sont mis à jour dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Produit.objects.filter(pk=self.produit_id).synchroniser_stocks()
+        # Après un UPDATE, Django ne relit pas les colonnes générées
+        self.quantite_disponible = max(0, self.quantite - self.quantite_reservee)
+        self.statut_stock = calculer_statut_stock(
+            self.quantite - self.quantite_reservee, self.stock_alerte)
 
     @property
     def en_rupture(self):
-        return self.quantite_disponible <= 0
+        return self.statut_stock == 'rupture'
 
     @property
     def stock_faible(self):
-        return 0 < self.quantite_disponible <= self.stock_alerte
+        return self.statut_stock == 'faible'
 
     def reserver_stock(self, quantite):
         """Réserver du stock pour une vente"""
-        if quantite > self.quantite_disponible:
-            raise ValueError(
-                f"Stock insuffisant. Disponible: {self.quantite_disponible}")
-
-        self.quantite_reservee += quantite
-        self.save()
+        StockEntrepot.objects.reserver_lot(
+            {(self.produit_id, self.entrepot_id): quantite})
+        self._relire_quantites()
 
     def liberer_stock(self, quantite):
         """Libérer du stock réservé"""
-        self.quantite_reservee = max(0, self.quantite_reservee - quantite)
-        self.save()
+        StockEntrepot.objects.liberer_lot(
+            {(self.produit_id, self.entrepot_id): quantite})
+        self._relire_quantites()
 
     def prelever_stock(self, quantite):
         """Prélever du stock (confirmer une vente)"""
-        if quantite > self.quantite_reservee:
-            raise ValueError(
-                f"Quantité réservée insuffisante: {self.quantite_reservee}")
+        StockEntrepot.objects.prelever_lot(
+            {(self.produit_id, self.entrepot_id): quantite})
+        self._relire_quantites()
 
-        if quantite > self.quantite:
-            raise ValueError(f"Stock total insuffisant: {self.quantite}")
-
-        self.quantite_reservee -= quantite
-        self.quantite -= quantite
-        self.save()
+    def _relire_quantites(self):
+        self.refresh_from_db(fields=[
+            'quantite', 'quantite_reservee', 'quantite_disponible',
+            'statut_stock', 'updated_at'])
 
     def __str__(self):
         return f"{self.produit.nom} - {self.entrepot.nom}: {self.quantite_disponible}"
@@ -281,6 +615,7 @@ class MouvementStock(models.Model):
         ('sortie', 'Sortie de stock'),
         ('ajustement', 'Ajustement'),
         ('transfert', 'Transfert entrepôt'),  # Ajout
+        ('liberation', 'Libération de réservation'),
     )
 
     produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
@@ -297,6 +632,13 @@ class MouvementStock(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Pagination par curseur (CurseurPagination)
+            models.Index(fields=['-created_at', '-id'],
+                         name='mouvement_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.prix_unitaire:
             if self.type_mouvement == 'entree':
@@ -311,6 +653,41 @@ class MouvementStock(models.Model):
 
 
 # models.py - Ajoutez ces modèles après le modèle Vente
+class VenteQuerySet(models.QuerySet):
+    @staticmethod
+    def _total_lignes():
+        """Somme des lignes - remise, calculée en SQL (sous-requête)"""
+        lignes = LigneDeVente.objects.filter(
+            vente=OuterRef('pk')
+        ).order_by().values('vente').annotate(
+            total=Sum(F('quantite') * F('prix_unitaire'))
+        ).values('total')
+        montant = models.DecimalField(max_digits=12, decimal_places=2)
+        return Round(
+            Coalesce(Subquery(lignes, output_field=montant),
+                     Value(0), output_field=montant) - F('remise'),
+            2, output_field=montant)
+
+    def incoherentes(self):
+        """Ventes dont les montants stockés ne correspondent plus aux lignes"""
+        return self.annotate(total_calcule=self._total_lignes()).filter(
+            ~Q(montant_total=F('total_calcule'))
+            | ~Q(montant_restant=F('total_calcule') - F('montant_paye'))
+        )
+
+    def recalculer_totaux(self):
+        """Recalcule montants et statut de paiement depuis les lignes (un UPDATE)"""
+        total = self._total_lignes()
+        return self.update(
+            montant_total=total,
+            montant_restant=total - F('montant_paye'),
+            statut_paiement=Case(
+                When(montant_paye=0, then=Value('non_paye')),
+                When(montant_paye__lt=total, then=Value('partiel')),
+                default=Value('paye'),
+            ),
+        )
+
 
 class Vente(models.Model):
     STATUT_VENTE = (
@@ -367,24 +744,101 @@ class Vente(models.Model):
         CustomUser, on_delete=models.SET_NULL, null=True
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Identifiant attribué par le terminal (ventes synchronisées hors ligne)
+    reference_locale = models.CharField(max_length=100, null=True, blank=True)
+
+    objects = VenteQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
-
-    def save(self, *args, **kwargs):
-        # Calculer le montant restant
-        self.montant_restant = self.montant_total - self.montant_paye
-
-        # Mettre à jour le statut de paiement
+        indexes = [
+            # Pagination par curseur (CurseurPagination), globale et par vendeur
+            models.Index(fields=['-created_at', '-id'],
+                         name='vente_created_idx'),
+            models.Index(fields=['created_by', '-created_at', '-id'],
+                         name='vente_vendeur_created_idx'),
+        ]
+        constraints = [
+            # Une vente hors ligne rejouée n'est pas créée deux fois
+            models.UniqueConstraint(
+                fields=['created_by', 'reference_locale'],
+                condition=Q(reference_locale__isnull=False),
+                name='unique_vente_reference_locale'),
+        ]
+
+    # Statut lu en base, pour détecter les confirmations / annulations
+    _statut_enregistre = None
+    # Valeurs lues en base : save() n'écrit que les champs modifiés depuis
+    _valeurs_enregistrees = None
+
+    # Champs recalculés par save() à partir des montants
+    CHAMPS_CALCULES = ('montant_total', 'montant_restant', 'statut_paiement',
+                       'date_paiement')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._statut_enregistre = instance.__dict__.get('statut')
+        instance._memoriser_valeurs()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(
+            using=using, fields=fields, from_queryset=from_queryset)
+        self._memoriser_valeurs(
+            [self._meta.get_field(nom).attname for nom in fields]
+            if fields else None)
+        if not fields or 'statut' in fields:
+            self._statut_enregistre = self.statut
+
+    def _memoriser_valeurs(self, champs=None):
+        if self._valeurs_enregistrees is None:
+            self._valeurs_enregistrees = {}
+        for champ in self._meta.concrete_fields:
+            if champ.primary_key or champ.attname not in self.__dict__:
+                continue  # Champ différé : pas de valeur connue
+            if champs is None or champ.attname in champs:
+                self._valeurs_enregistrees[champ.attname] = \
+                    self.__dict__[champ.attname]
+
+    def champs_modifies(self):
+        """Champs modifiés depuis la lecture en base (None si non chargée)"""
+        if self._valeurs_enregistrees is None:
+            return None
+        return [
+            attname for attname, valeur in self._valeurs_enregistrees.items()
+            if self.__dict__.get(attname, valeur) != valeur
+        ]
+
+    def calculer_statut_paiement(self):
         if self.montant_paye == 0:
-            self.statut_paiement = 'non_paye'
-        elif self.montant_paye < self.montant_total:
-            self.statut_paiement = 'partiel'
-        else:
-            self.statut_paiement = 'paye'
-            self.date_paiement = timezone.now()
-
-        super().save(*args, **kwargs)
+            return 'non_paye'
+        if self.montant_paye < self.montant_total:
+            return 'partiel'
+        return 'paye'
+
+    @classmethod
+    def ajuster_montant(cls, vente_id, delta, vente=None):
+        """Répercute une variation du total des lignes (UPDATE avec F())
+
+        `vente`, si fourni, est mis à jour en mémoire de la même façon.
+        """
+        nouveau_total = F('montant_total') + delta
+        cls.objects.filter(pk=vente_id).update(
+            montant_total=nouveau_total,
+            montant_restant=F('montant_restant') + delta,
+            statut_paiement=Case(
+                When(montant_paye=0, then=Value('non_paye')),
+                When(montant_paye__lt=nouveau_total, then=Value('partiel')),
+                default=Value('paye'),
+            ),
+        )
+        if vente is not None:
+            vente.montant_total += delta
+            vente.montant_restant = vente.montant_total - vente.montant_paye
+            vente.statut_paiement = vente.calculer_statut_paiement()
+            vente._memoriser_valeurs(
+                ['montant_total', 'montant_restant', 'statut_paiement'])
 
     def calculer_total(self):
         total = sum(detail.sous_total() for detail in self.lignes_vente.all())
@@ -407,91 +861,430 @@ class Vente(models.Model):
             raise ValueError(
                 "Seules les ventes brouillon peuvent être confirmées")
 
-        self.statut = 'confirmee'
+        _, echecs = Vente.confirmer_lot([self])
+        if echecs:
+            raise StockInsuffisantError(echecs[self.id])
+
+    @classmethod
+    def confirmer_lot(cls, ventes, user=None):
+        """Confirme des ventes brouillon dans une seule transaction
+
+        Les prélèvements de stock sont cumulés et appliqués en un UPDATE
+        par entrepôt ; les ventes dont le stock réservé ne suffit pas sont
+        écartées sans bloquer les autres. `ventes` doit précharger
+        lignes_vente (avec produit et entrepot). Retourne
+        (ventes confirmées, {vente_id: message d'erreur}).
+        """
+        echecs = {}
+        candidates = []
+        for vente in ventes:
+            if vente.statut != 'brouillon':
+                echecs[vente.id] = (
+                    "Seules les ventes brouillon peuvent être confirmées")
+            else:
+                candidates.append(vente)
+        if not candidates:
+            return candidates, echecs
+
+        with transaction.atomic():
+            # Statut relu sous verrou : une vente confirmée ou annulée depuis
+            # la lecture n'est ni prélevée ni comptée deux fois
+            brouillons = set(cls.objects.select_for_update().filter(
+                pk__in=[vente.id for vente in candidates], statut='brouillon'
+            ).values_list('pk', flat=True))
+            verrouillees = []
+            for vente in candidates:
+                if vente.id in brouillons:
+                    verrouillees.append(vente)
+                else:
+                    echecs[vente.id] = (
+                        "Seules les ventes brouillon peuvent être confirmées")
+
+            demandes = {
+                vente.id: quantites_par_stock(
+                    ligne for ligne in vente.lignes_vente.all()
+                    if not ligne.stock_preleve)
+                for vente in verrouillees
+            }
+            paires = {cle for demande in demandes.values() for cle in demande}
+            stocks = {
+                (produit_id, entrepot_id): [quantite, reservee]
+                for produit_id, entrepot_id, quantite, reservee
+                in StockEntrepot.objects.filter(
+                    produit_id__in={p for p, _ in paires},
+                    entrepot_id__in={e for _, e in paires},
+                ).values_list('produit_id', 'entrepot_id', 'quantite',
+                              'quantite_reservee')
+            }
 
-        # Prélever le stock pour chaque ligne de vente
-        for ligne in self.lignes_vente.all():
-            ligne.prelever_stock_entrepot()
+            # Répartition du stock réservé entre les ventes, dans l'ordre reçu
+            acceptees = []
+            for vente in verrouillees:
+                manques = [
+                    ligne for ligne in vente.lignes_vente.all()
+                    if not ligne.stock_preleve and (
+                        (ligne.produit_id, ligne.entrepot_id) not in stocks
+                        or min(stocks[(ligne.produit_id, ligne.entrepot_id)])
+                        < demandes[vente.id][
+                            (ligne.produit_id, ligne.entrepot_id)])
+                ]
+                if manques:
+                    echecs[vente.id] = '; '.join(
+                        f"Quantité réservée insuffisante pour "
+                        f"{ligne.produit.nom} dans {ligne.entrepot.nom}"
+                        for ligne in manques)
+                    continue
+                for cle, quantite in demandes[vente.id].items():
+                    stocks[cle][0] -= quantite
+                    stocks[cle][1] -= quantite
+                acceptees.append(vente)
+
+            total = {}
+            for vente in acceptees:
+                for cle, quantite in demandes[vente.id].items():
+                    total[cle] = total.get(cle, 0) + quantite
+            try:
+                StockEntrepot.objects.prelever_lot(total)
+            except StockInsuffisantError:
+                # Stock modifié depuis la lecture : prélèvement vente par vente
+                restantes = []
+                for vente in acceptees:
+                    try:
+                        StockEntrepot.objects.prelever_lot(demandes[vente.id])
+                    except StockInsuffisantError as e:
+                        echecs[vente.id] = str(e)
+                    else:
+                        restantes.append(vente)
+                acceptees = restantes
+
+            if not acceptees:
+                return acceptees, echecs
+
+            ids = [vente.id for vente in acceptees]
+            modifiees = cls.objects.filter(
+                pk__in=ids, statut='brouillon').update(statut='confirmee')
+            if modifiees != len(ids):
+                # Impossible sous le verrou : tout le lot est annulé plutôt
+                # que de garder des prélèvements sans vente confirmée
+                raise DatabaseError(
+                    f"{len(ids) - modifiees} vente(s) modifiée(s) pendant "
+                    f"la confirmation")
+            LigneDeVente.objects.filter(vente_id__in=ids).update(
+                stock_preleve=True)
+            for vente in acceptees:
+                vente.statut = 'confirmee'
+                vente._statut_enregistre = 'confirmee'
+                vente._memoriser_valeurs(['statut'])
+
+            # UPDATE en lot : agrégats, audit et cache mis à jour ici
+            VenteJournaliere.appliquer_ventes(acceptees)
+            journaliser_lot(
+                AuditLog(
+                    user_id=user.id if user else vente.created_by_id,
+                    action='vente',
+                    modele='Vente',
+                    objet_id=vente.id,
+                    details={
+                        'action': 'confirmation',
+                        'numero_vente': vente.numero_vente,
+                        'client': vente.client.nom if vente.client else 'Aucun'
+                    }
+                )
+                for vente in acceptees
+            )
+            invalider_dashboard('ventes')
+
+        return acceptees, echecs
+
+    def annuler_vente(self, user=None):
+        """Annuler une vente brouillon et libérer ses réservations"""
+        _, echecs = Vente.annuler_lot([self], user=user)
+        if echecs:
+            raise ValueError(echecs[self.id])
+
+    @classmethod
+    def annuler_lot(cls, ventes, user=None):
+        """Annule des ventes brouillon dans une seule transaction
+
+        Les réservations sont libérées en un UPDATE par entrepôt ; les
+        mouvements de stock et le journal d'audit sont écrits en lot.
+        `ventes` doit précharger lignes_vente (avec produit). Retourne
+        (ventes annulées, {vente_id: message d'erreur}).
+        """
+        echecs = {}
+        candidates = []
+        for vente in ventes:
+            if vente.statut != 'brouillon':
+                echecs[vente.id] = (
+                    "Seules les ventes en brouillon peuvent être annulées")
+            else:
+                candidates.append(vente)
+        if not candidates:
+            return candidates, echecs
+
+        with transaction.atomic():
+            # Statut relu sous verrou : une vente confirmée depuis la lecture
+            # garde son stock
+            brouillons = set(cls.objects.select_for_update().filter(
+                pk__in=[vente.id for vente in candidates], statut='brouillon'
+            ).values_list('pk', flat=True))
+            annulees = []
+            for vente in candidates:
+                if vente.id in brouillons:
+                    annulees.append(vente)
+                else:
+                    echecs[vente.id] = (
+                        "Seules les ventes en brouillon peuvent être annulées")
+            if not annulees:
+                return annulees, echecs
+
+            lignes = [
+                (vente, ligne) for vente in annulees
+                for ligne in vente.lignes_vente.all() if not ligne.stock_preleve
+            ]
+            StockEntrepot.objects.liberer_lot(
+                quantites_par_stock(ligne for _, ligne in lignes))
+            cls.objects.filter(pk__in=brouillons).update(statut='annulee')
+            for vente in annulees:
+                vente.statut = 'annulee'
+                vente._statut_enregistre = 'annulee'
+                vente._memoriser_valeurs(['statut'])
+
+            mouvements = MouvementStock.objects.bulk_create(
+                MouvementStock(
+                    produit=ligne.produit,
+                    entrepot_id=ligne.entrepot_id,
+                    type_mouvement='liberation',
+                    quantite=ligne.quantite,
+                    prix_unitaire=ligne.prix_unitaire,
+                    motif=f"Annulation vente {vente.numero_vente}",
+                    created_by_id=user.id if user else vente.created_by_id
+                )
+                for vente, ligne in lignes
+            )
 
-        self.save()
+            # UPDATE et bulk_create : audit et cache mis à jour ici
+            journaliser_lot([
+                AuditLog(
+                    user_id=user.id if user else vente.created_by_id,
+                    action='vente',
+                    modele='Vente',
+                    objet_id=vente.id,
+                    details={
+                        'action': 'annulation',
+                        'numero_vente': vente.numero_vente,
+                    }
+                )
+                for vente in annulees
+            ] + [
+                AuditLog(
+                    user_id=mouvement.created_by_id,
+                    action='mouvement_stock',
+                    modele='MouvementStock',
+                    objet_id=mouvement.id,
+                    details={
+                        'produit': mouvement.produit.nom,
+                        'type': mouvement.type_mouvement,
+                        'quantite': mouvement.quantite,
+                    }
+                )
+                for mouvement in mouvements
+            ])
+            for vendeur_id in {vente.created_by_id for vente in annulees}:
+                invalider_dashboard('ventes', vendeur_id)
 
-        # Log d'audit
-        AuditLog.objects.create(
-            user=self.created_by,
-            action='vente',
-            modele='Vente',
-            objet_id=self.id,
-            details={
-                'action': 'confirmation',
-                'numero_vente': self.numero_vente,
-                'client': self.client.nom if self.client else 'Aucun'
-            }
-        )    # ... (autres méthodes existantes)
+        return annulees, echecs
 
     def save(self, *args, **kwargs):
-        # Calculer le montant total si la vente existe déjà
-        if self.pk:
-            self.montant_total = self.calculer_total()
+        anciennes = None if self._state.adding else self._valeurs_enregistrees
+
+        # Le montant total est tenu à jour par les lignes (signaux de
+        # LigneDeVente) ; seule une variation de la remise s'y répercute ici
+        if anciennes and 'remise' in anciennes:
+            self.montant_total -= self.remise - anciennes['remise']
 
         # Calculer le montant restant
         self.montant_restant = self.montant_total - self.montant_paye
 
         # Mettre à jour le statut de paiement
-        if self.montant_paye == 0:
-            self.statut_paiement = 'non_paye'
-        elif self.montant_paye < self.montant_total:
-            self.statut_paiement = 'partiel'
-        else:
-            self.statut_paiement = 'paye'
+        statut_precedent = (anciennes or {}).get('statut_paiement')
+        self.statut_paiement = self.calculer_statut_paiement()
+        if self.statut_paiement == 'paye' and (
+                statut_precedent != 'paye' or self.date_paiement is None):
             self.date_paiement = timezone.now()
 
-        super().save(*args, **kwargs)
+        # Vente chargée depuis la base : UPDATE des seuls champs modifiés
+        if anciennes is not None and not args:
+            modifies = self.champs_modifies()
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = modifies
+            else:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {
+                    champ for champ in modifies
+                    if champ in self.CHAMPS_CALCULES}
+
+        # Les agrégats (signal post_save) sont écrits dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        self._memoriser_valeurs(
+            None if update_fields is None else
+            [self._meta.get_field(nom).attname for nom in update_fields])
+
+    # Champs modifiés par l'enregistrement d'un paiement
+    CHAMPS_PAIEMENT = ('montant_paye', 'montant_restant', 'statut_paiement',
+                       'date_paiement', 'mode_paiement')
+
+    @staticmethod
+    def _encaissement(montant, mode_paiement, maintenant):
+        """Valeurs de l'UPDATE qui ajoute `montant` (F() : valeurs en base)"""
+        solde = Q(montant_restant__lte=montant)
+        return {
+            'montant_paye': F('montant_paye') + montant,
+            'montant_restant': F('montant_restant') - montant,
+            'statut_paiement': Case(When(solde, then=Value('paye')),
+                                    default=Value('partiel')),
+            'date_paiement': Case(When(solde, then=Value(maintenant)),
+                                  default=F('date_paiement')),
+            # Mode principal : celui du premier paiement
+            'mode_paiement': Case(
+                When(Q(mode_paiement__isnull=True) | Q(mode_paiement=''),
+                     then=Value(mode_paiement)),
+                default=F('mode_paiement')),
+        }
 
     def ajouter_paiement(self, montant, mode_paiement, reference='', notes='', user=None):
-        """Ajouter un paiement à la vente"""
-        # Créer l'objet Paiement
-        paiement = Paiement.objects.create(
-            vente=self,
-            montant=montant,
-            mode_paiement=mode_paiement,
-            reference=reference,
-            notes=notes,
-            created_by=user or self.created_by
-        )
-
-        # Mettre à jour le montant payé
-        self.montant_paye += montant
-
-        # Si la vente n'a pas de mode de paiement principal, utiliser celui du premier paiement
-        if not self.mode_paiement:
-            self.mode_paiement = mode_paiement
+        """Ajouter un paiement à la vente
+
+        Un UPDATE conditionnel (montants en F()) verrouille la ligne de la
+        vente et vérifie le montant restant : deux paiements simultanés ne
+        s'écrasent pas et ne peuvent dépasser le total. Lève ValueError si
+        la vente n'est pas confirmée ou si le montant dépasse le restant.
+        """
+        with transaction.atomic():
+            maj = Vente.objects.filter(
+                pk=self.pk, statut='confirmee', montant_restant__gte=montant,
+            ).update(**self._encaissement(montant, mode_paiement, timezone.now()))
+            if not maj:
+                actuelle = Vente.objects.only('statut', 'montant_restant').get(
+                    pk=self.pk)
+                if actuelle.statut != 'confirmee':
+                    raise ValueError(
+                        "Seules les ventes confirmées peuvent recevoir des paiements")
+                if actuelle.montant_restant <= 0:
+                    raise ValueError("Cette vente est déjà entièrement payée")
+                raise ValueError(
+                    f"Le montant ({montant}) dépasse le montant restant "
+                    f"({actuelle.montant_restant})")
+            self.refresh_from_db(fields=self.CHAMPS_PAIEMENT)
+
+            paiement = Paiement.objects.create(
+                vente=self,
+                montant=montant,
+                mode_paiement=mode_paiement,
+                reference=reference,
+                notes=notes,
+                created_by=user or self.created_by
+            )
 
-        # Mettre à jour le statut de paiement
-        if self.montant_paye >= self.montant_total:
-            self.statut_paiement = 'paye'
-            self.date_paiement = timezone.now()
-        elif self.montant_paye > 0:
-            self.statut_paiement = 'partiel'
-        else:
-            self.statut_paiement = 'non_paye'
+            # Log d'audit
+            journaliser(
+                user=user or self.created_by,
+                action='vente',
+                modele='Paiement',
+                objet_id=paiement.id,
+                details={
+                    'vente': self.numero_vente,
+                    'montant': str(montant),
+                    'mode_paiement': mode_paiement,
+                    'nouveau_statut': self.statut_paiement
+                }
+            )
 
-        self.save()
+        return paiement
 
-        # Log d'audit
-        AuditLog.objects.create(
-            user=user or self.created_by,
-            action='vente',
-            modele='Paiement',
-            objet_id=paiement.id,
-            details={
-                'vente': self.numero_vente,
-                'montant': str(montant),
-                'mode_paiement': mode_paiement,
-                'nouveau_statut': self.statut_paiement
-            }
-        )
+    @classmethod
+    def repartir_paiement(cls, ventes, montant, mode_paiement, reference='',
+                          notes='', user=None):
+        """Répartit un règlement global sur des ventes, les plus anciennes d'abord
+
+        `ventes` : queryset des ventes candidates (celles d'un client). Les
+        ventes confirmées non soldées sont verrouillées, puis entièrement
+        payées dans l'ordre de création ; la dernière peut l'être en partie.
+        Retourne la liste des paiements créés ; lève ValueError si le montant
+        dépasse le solde dû.
+        """
+        with transaction.atomic():
+            dues = list(ventes.select_for_update().filter(
+                statut='confirmee', montant_restant__gt=0,
+            ).order_by('created_at', 'pk').only(
+                'numero_vente', 'montant_restant', 'created_by'))
+            solde = sum(vente.montant_restant for vente in dues)
+            if montant > solde:
+                raise ValueError(
+                    f"Le montant ({montant}) dépasse le solde dû ({solde})")
+
+            soldees, partielle, reste = [], None, montant
+            for vente in dues:
+                if reste <= 0:
+                    break
+                if vente.montant_restant <= reste:
+                    soldees.append(vente)
+                    reste -= vente.montant_restant
+                else:
+                    partielle = vente
+                    break
+
+            maintenant = timezone.now()
+            paiements = [
+                Paiement(vente=vente, montant=vente.montant_restant,
+                         mode_paiement=mode_paiement, reference=reference,
+                         notes=notes, created_by=user or vente.created_by)
+                for vente in soldees
+            ]
+            if soldees:
+                # Lignes verrouillées : le restant lu est celui payé
+                cls.objects.filter(pk__in=[vente.pk for vente in soldees]).update(
+                    montant_paye=F('montant_paye') + F('montant_restant'),
+                    montant_restant=0,
+                    statut_paiement='paye',
+                    date_paiement=maintenant,
+                    mode_paiement=Case(
+                        When(Q(mode_paiement__isnull=True) | Q(mode_paiement=''),
+                             then=Value(mode_paiement)),
+                        default=F('mode_paiement')),
+                )
+            if partielle is not None:
+                cls.objects.filter(pk=partielle.pk).update(
+                    **cls._encaissement(reste, mode_paiement, maintenant))
+                paiements.append(Paiement(
+                    vente=partielle, montant=reste, mode_paiement=mode_paiement,
+                    reference=reference, notes=notes,
+                    created_by=user or partielle.created_by))
+
+            Paiement.objects.bulk_create(paiements)
+            journaliser_lot(
+                AuditLog(
+                    user=user or paiement.vente.created_by,
+                    action='vente',
+                    modele='Paiement',
+                    objet_id=paiement.id,
+                    details={
+                        'vente': paiement.vente.numero_vente,
+                        'montant': str(paiement.montant),
+                        'mode_paiement': mode_paiement,
+                        'reglement_global': str(montant),
+                    }
+                )
+                for paiement in paiements
+            )
+            # bulk_create n'envoie pas post_save
+            payees = soldees + ([partielle] if partielle is not None else [])
+            for vendeur_id in {vente.created_by_id for vente in payees}:
+                invalider_dashboard('ventes', vendeur_id)
 
-        return paiement
+        return paiements
 
 
 class Paiement(models.Model):
@@ -563,6 +1356,16 @@ class LigneDeVente(models.Model):
     stock_preleve = models.BooleanField(
         default=False)  # Si le stock a été prélevé
 
+    # Sous-total lu en base, pour répercuter les variations sur la vente
+    _sous_total_enregistre = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'quantite' in instance.__dict__ and 'prix_unitaire' in instance.__dict__:
+            instance._sous_total_enregistre = instance.sous_total()
+        return instance
+
     def sous_total(self):
         return self.quantite * self.prix_unitaire
 
@@ -606,6 +1409,13 @@ class TransfertEntrepot(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     confirme_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Pagination par curseur (CurseurPagination)
+            models.Index(fields=['-created_at', '-id'],
+                         name='transfert_created_idx'),
+        ]
+
     def confirmer_transfert(self):
         """Confirmer le transfert et mettre à jour les stocks"""
         if self.statut == 'brouillon':
@@ -670,17 +1480,352 @@ class AuditLog(models.Model):
     modele = models.CharField(max_length=100)
     objet_id = models.IntegerField(null=True, blank=True)
     details = models.JSONField(default=dict)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Date de l'événement : l'entrée peut être écrite plus tard (users.audit)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Pagination par curseur (CurseurPagination)
+            models.Index(fields=['-created_at', '-id'],
+                         name='auditlog_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.action} - {self.modele} #{self.objet_id}"
 
 
+class ValorisationStock(models.Model):
+    """Photographie quotidienne des quantités et valeurs de stock"""
+    NIVEAU_CHOICES = (
+        ('entrepot', 'Entrepôt'),
+        ('categorie', 'Catégorie'),
+        ('produit', 'Produit'),
+    )
+
+    date = models.DateField()
+    niveau = models.CharField(max_length=20, choices=NIVEAU_CHOICES)
+    entrepot = models.ForeignKey(
+        Entrepot, on_delete=models.SET_NULL, null=True, blank=True)
+    categorie = models.ForeignKey(
+        Categorie, on_delete=models.SET_NULL, null=True, blank=True)
+    produit = models.ForeignKey(
+        Produit, on_delete=models.SET_NULL, null=True, blank=True)
+    # Nom au moment de la capture (conservé si l'objet est supprimé)
+    libelle = models.CharField(max_length=200, blank=True)
+    quantite = models.IntegerField(default=0)
+    quantite_reservee = models.IntegerField(default=0)
+    valeur_achat = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    valeur_vente = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['niveau', 'date'],
+                         name='valorisation_niveau_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.niveau} {self.libelle}: {self.valeur_achat}"
+
+
+class AgregatQuerySet(models.QuerySet):
+    def incrementer(self, cles, valeurs):
+        """Ajoute `valeurs` à la ligne identifiée par `cles` (créée si absente)"""
+        increments = {champ: F(champ) + valeur for champ, valeur in valeurs.items()}
+        if self.filter(**cles).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                self.create(**cles, **valeurs)
+        except IntegrityError:
+            # Créée entre-temps par une transaction concurrente
+            self.filter(**cles).update(**increments)
+
+
+class VenteJournaliere(models.Model):
+    """Agrégat quotidien des ventes confirmées par vendeur"""
+    date = models.DateField()
+    vendeur = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    nombre_ventes = models.IntegerField(default=0)
+    chiffre_affaires = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+
+    objects = AgregatQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'vendeur'], name='unique_vente_journaliere'),
+        ]
+
+    @classmethod
+    def appliquer_vente(cls, vente, sens=1):
+        """Ajoute (sens=1) ou retire (sens=-1) une vente confirmée des agrégats"""
+        cls.appliquer_ventes([vente], sens)
+
+    @classmethod
+    def appliquer_ventes(cls, ventes, sens=1):
+        """Version en lot : les montants sont cumulés par agrégat avant écriture"""
+        cles_ventes = {}
+        par_vendeur = {}
+        for vente in ventes:
+            cle = (timezone.localtime(vente.created_at).date(),
+                   vente.created_by_id)
+            cles_ventes[vente.id] = cle
+            nombre, montant = par_vendeur.get(cle, (0, 0))
+            par_vendeur[cle] = (nombre + 1, montant + vente.montant_total)
+
+        for (jour, vendeur_id), (nombre, montant) in par_vendeur.items():
+            cls.objects.incrementer(
+                {'date': jour, 'vendeur_id': vendeur_id},
+                {'nombre_ventes': sens * nombre,
+                 'chiffre_affaires': sens * montant}
+            )
+
+        lignes = LigneDeVente.objects.filter(
+            vente_id__in=list(cles_ventes)
+        ).order_by().values(
+            'vente_id', 'entrepot_id', 'produit_id'
+        ).annotate(
+            total_quantite=Sum('quantite'),
+            total_montant=Sum(F('quantite') * F('prix_unitaire'),
+                              output_field=models.DecimalField(
+                                  max_digits=14, decimal_places=2)),
+        )
+        par_ligne = {}
+        for ligne in lignes:
+            jour, vendeur_id = cles_ventes[ligne['vente_id']]
+            cle = (jour, vendeur_id, ligne['entrepot_id'], ligne['produit_id'])
+            quantite, montant, nombre = par_ligne.get(cle, (0, 0, 0))
+            par_ligne[cle] = (quantite + ligne['total_quantite'],
+                              montant + ligne['total_montant'], nombre + 1)
+
+        for cle, (quantite, montant, nombre) in par_ligne.items():
+            jour, vendeur_id, entrepot_id, produit_id = cle
+            LigneVenteJournaliere.objects.incrementer(
+                {
+                    'date': jour,
+                    'vendeur_id': vendeur_id,
+                    'entrepot_id': entrepot_id,
+                    'produit_id': produit_id,
+                },
+                {
+                    'quantite': sens * quantite,
+                    'chiffre_affaires': sens * montant,
+                    'nombre_ventes': sens * nombre,
+                }
+            )
+
+    def __str__(self):
+        return f"{self.date} - {self.vendeur}: {self.chiffre_affaires}"
+
+
+class LigneVenteJournaliere(models.Model):
+    """Agrégat quotidien des lignes vendues (jour × vendeur × entrepôt × produit)"""
+    date = models.DateField()
+    vendeur = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True)
+    entrepot = models.ForeignKey(Entrepot, on_delete=models.CASCADE)
+    produit = models.ForeignKey(Produit, on_delete=models.CASCADE)
+    quantite = models.IntegerField(default=0)
+    # Somme des quantite * prix_unitaire des lignes (hors remise)
+    chiffre_affaires = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0)
+    nombre_ventes = models.IntegerField(default=0)
+
+    objects = AgregatQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'vendeur', 'entrepot', 'produit'],
+                name='unique_ligne_vente_journaliere'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.produit_id} x{self.quantite}"
+
+
+class CompteurDocument(models.Model):
+    """Dernier numéro attribué par série de documents et par jour"""
+    SERIE_VENTE = 'V'
+    SERIE_FACTURE = 'F'
+    SERIE_TRANSFERT = 'TRF'
+    SERIE_CHOICES = (
+        (SERIE_VENTE, 'Vente'),
+        (SERIE_FACTURE, 'Facture'),
+        (SERIE_TRANSFERT, 'Transfert'),
+    )
+
+    serie = models.CharField(max_length=10, choices=SERIE_CHOICES)
+    date = models.DateField()
+    dernier_numero = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['serie', 'date'], name='unique_compteur_document'),
+        ]
+
+    def __str__(self):
+        return f"{self.serie}{self.date:%Y%m%d} - {self.dernier_numero}"
+
+    @classmethod
+    def prochain(cls, serie, jour=None):
+        """Réserve et retourne le numéro suivant de la série pour le jour
+
+        L'UPDATE verrouille la ligne du compteur jusqu'à la fin de la
+        transaction appelante : deux créations simultanées sont
+        sérialisées, et un rollback libère le numéro (séquence sans trou).
+        """
+        jour = jour or timezone.localdate()
+        compteur = cls.objects.filter(serie=serie, date=jour)
+        with transaction.atomic():
+            if not compteur.update(dernier_numero=F('dernier_numero') + 1):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            serie=serie, date=jour, dernier_numero=1)
+                    return 1
+                except IntegrityError:
+                    # Créé entre-temps par une transaction concurrente
+                    compteur.update(dernier_numero=F('dernier_numero') + 1)
+            return compteur.values_list('dernier_numero', flat=True).get()
+
+    @classmethod
+    def generer_numero(cls, serie, jour=None):
+        """Numéro formaté : <série><AAAAMMJJ><compteur sur 4 chiffres>"""
+        jour = jour or timezone.localdate()
+        return f"{serie}{jour:%Y%m%d}{cls.prochain(serie, jour):04d}"
+
+
+class CleIdempotence(models.Model):
+    """Réponse enregistrée pour un en-tête Idempotency-Key (voir idempotence.py)"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    cle = models.CharField(max_length=255)
+    # Méthode et chemin de la requête, et empreinte de son contenu
+    endpoint = models.CharField(max_length=255)
+    empreinte = models.CharField(max_length=64)
+    # Nuls tant que la requête est en cours de traitement
+    statut_http = models.PositiveSmallIntegerField(null=True)
+    reponse = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    # Fin du bail de traitement : passé ce délai, une clé toujours en cours
+    # (requête interrompue) peut être reprise par un nouvel essai
+    bail_expire_le = models.DateTimeField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'cle'], name='unique_cle_idempotence'),
+        ]
+
+    def __str__(self):
+        return f"{self.cle} ({self.endpoint})"
+
+
+@receiver(post_delete, sender=StockEntrepot)
+def synchroniser_stock_produit(sender, instance, **kwargs):
+    # Couvre aussi les suppressions en cascade (entrepôt supprimé)
+    Produit.objects.filter(pk=instance.produit_id).synchroniser_stocks()
+
+
+@receiver(post_save, sender=Vente)
+def mettre_a_jour_agregats_vente(sender, instance, **kwargs):
+    # Entrée ou sortie du statut 'confirmee' : agrégats mis à jour
+    ancien, nouveau = instance._statut_enregistre, instance.statut
+    if ancien != 'confirmee' and nouveau == 'confirmee':
+        VenteJournaliere.appliquer_vente(instance, 1)
+    elif ancien == 'confirmee' and nouveau != 'confirmee':
+        VenteJournaliere.appliquer_vente(instance, -1)
+    instance._statut_enregistre = nouveau
+
+
+@receiver(pre_delete, sender=Vente)
+def retirer_agregats_vente(sender, instance, **kwargs):
+    # Avant la suppression : les lignes, supprimées en cascade, sont lues
+    # par appliquer_vente
+    if instance._statut_enregistre == 'confirmee':
+        VenteJournaliere.appliquer_vente(instance, -1)
+
+
+# Montant total des ventes tenu à jour ligne par ligne
+@receiver(post_save, sender=LigneDeVente)
+def ajuster_total_vente_ligne(sender, instance, created, **kwargs):
+    ancien = 0 if created else instance._sous_total_enregistre
+    instance._sous_total_enregistre = instance.sous_total()
+    if ancien is None:
+        # Sous-total précédent inconnu (ligne non lue en base)
+        Vente.objects.filter(pk=instance.vente_id).recalculer_totaux()
+        return
+    delta = instance.sous_total() - ancien
+    if delta:
+        # La vente liée à la ligne (si chargée) est ajustée en mémoire aussi
+        Vente.ajuster_montant(
+            instance.vente_id, delta,
+            instance._state.fields_cache.get('vente'))
+
+
+@receiver(post_delete, sender=LigneDeVente)
+def retirer_ligne_total_vente(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Vente):
+        return  # Suppression de la vente elle-même
+    ancien = instance._sous_total_enregistre
+    if ancien is None:
+        ancien = instance.sous_total()
+    if ancien:
+        Vente.ajuster_montant(
+            instance.vente_id, -ancien,
+            instance._state.fields_cache.get('vente'))
+
+
+# Invalidation du cache du tableau de bord
+@receiver(post_save, sender=Vente)
+@receiver(post_delete, sender=Vente)
+def invalider_dashboard_vente(sender, instance, **kwargs):
+    invalider_dashboard('ventes', instance.created_by_id)
+
+
+@receiver(post_save, sender=Paiement)
+def invalider_dashboard_paiement(sender, instance, **kwargs):
+    invalider_dashboard('ventes', instance.vente.created_by_id)
+
+
+@receiver(post_save, sender=StockEntrepot)
+@receiver(post_delete, sender=StockEntrepot)
+@receiver(post_save, sender=Entrepot)
+@receiver(post_delete, sender=Entrepot)
+def invalider_dashboard_stock(sender, instance, **kwargs):
+    invalider_dashboard('stocks')
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalider_dashboard_client(sender, instance, **kwargs):
+    # total_clients, et nom du client dans les dernières ventes
+    invalider_dashboard('ventes', instance.created_by_id)
+
+
+@receiver(post_save, sender=Produit)
+@receiver(post_delete, sender=Produit)
+def invalider_dashboard_produit(sender, instance, **kwargs):
+    # Nombre de produits et valorisation (prix_achat) ; noms affichés dans
+    # les meilleures ventes et les dernières ventes
+    invalider_dashboard('stocks')
+    invalider_dashboard('ventes')
+
+
 # Signaux pour la traçabilité
 @receiver(post_save, sender=Produit)
 def log_produit_save(sender, instance, created, **kwargs):
     action = 'creation' if created else 'modification'
-    AuditLog.objects.create(
+    journaliser(
         user=instance.created_by,
         action=action,
         modele='Produit',
@@ -696,7 +1841,7 @@ def log_produit_save(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Vente)
 def log_vente(sender, instance, created, **kwargs):
     if created:
-        AuditLog.objects.create(
+        journaliser(
             user=instance.created_by,
             action='vente',
             modele='Vente',
@@ -712,7 +1857,7 @@ def log_vente(sender, instance, created, **kwargs):
 @receiver(post_save, sender=MouvementStock)
 def log_mouvement_stock(sender, instance, created, **kwargs):
     if created:
-        AuditLog.objects.create(
+        journaliser(
             user=instance.created_by,
             action='mouvement_stock',
             modele='MouvementStock',
@@ -728,7 +1873,7 @@ def log_mouvement_stock(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Client)
 def log_client_save(sender, instance, created, **kwargs):
     action = 'creation' if created else 'modification'
-    AuditLog.objects.create(
+    journaliser(
         user=instance.created_by,
         action=action,
         modele='Client',
@@ -0,0 +1,89 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination, PageNumberPagination
+
+
+class StandardPagination(PageNumberPagination):
+    """Pagination par numéro de page, taille configurable via ?page_size="""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class CurseurPagination(CursorPagination):
+    """Pagination par curseur sur (created_at, id), du plus récent au plus ancien
+
+    Pour les tables alimentées en continu (ventes, mouvements, audit). Le
+    curseur contient le couple (created_at, id) de la dernière ligne vue :
+    la page suivante est lue par une condition de plage sur l'index
+    (-created_at, -id) au lieu d'un OFFSET. Son coût ne dépend donc pas de
+    la profondeur, même si plusieurs lignes ont la même date.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        self.cursor = self.decode_cursor(request)
+        inverse, position = (self.cursor.reverse, self.cursor.position) \
+            if self.cursor else (False, None)
+
+        if inverse:
+            queryset = queryset.order_by('created_at', 'id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+        if position is not None:
+            date, pk = position
+            # created_at <= date borne le parcours de l'index
+            if inverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=date) | Q(created_at=date, pk__gt=pk),
+                    created_at__gte=date)
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=date) | Q(created_at=date, pk__lt=pk),
+                    created_at__lte=date)
+
+        resultats = list(queryset[:self.page_size + 1])
+        self.page = resultats[:self.page_size]
+        suite = len(resultats) > self.page_size
+        if inverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, suite
+        else:
+            self.has_next, self.has_previous = suite, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self._lien(self.page[-1], inverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self._lien(self.page[0], inverse=True)
+
+    def _lien(self, ligne, inverse):
+        position = f'{ligne.created_at.isoformat()}|{ligne.pk}'
+        return self.encode_cursor(Cursor(offset=0, reverse=inverse,
+                                         position=position))
+
+    def decode_cursor(self, request):
+        curseur = super().decode_cursor(request)
+        if curseur is None or curseur.position is None:
+            return curseur
+        date, _, pk = curseur.position.partition('|')
+        date = parse_datetime(date)
+        if date is None or not pk.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return curseur._replace(position=(date, int(pk)))
@@ -0,0 +1,208 @@
+# rapports.py - Moteur du rapport des ventes (statistiques et classements)
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (LigneDeVente, LigneVenteJournaliere, Vente,
+                     VenteJournaliere)
+
+
+# Volumes et classements sont lus dans les agrégats quotidiens
+# (VenteJournaliere, LigneVenteJournaliere) : leur coût dépend du nombre de
+# jours de la période, pas du nombre de ventes. Ce que les agrégats ne
+# portent pas est lu sur les ventes de la période (plage sur created_at) :
+# - clients actifs et état des paiements, qui changent après confirmation
+# - nombres de ventes distinctes par entrepôt, et par vendeur ou au total
+#   avec un filtre entrepôt / catégorie : une vente compte une fois, quel
+#   que soit le nombre de ses lignes concernées
+# Les filtres entrepôt et catégorie sélectionnent les ventes qui ont une
+# ligne concernée ; les quantités (total et classement des produits) ne
+# comptent que ces lignes.
+# Le rapport est mémorisé par jeu de filtres pendant
+# RAPPORT_VENTES_CACHE_TIMEOUT secondes.
+FILTRES_VENTES = ('date_debut', 'date_fin', 'vendeur', 'entrepot', 'categorie')
+FILTRES_LIGNES = ('entrepot', 'categorie')
+
+TOP_MAX = 20
+
+
+def _debut_jour(jour):
+    return timezone.make_aware(datetime.combine(jour, time.min))
+
+
+def filtrer_ventes(filtres):
+    """Ventes confirmées correspondant aux filtres du rapport
+
+    `filtres` : valeurs déjà converties (dates, ids). Les dates deviennent
+    une plage sur created_at (index) ; les filtres sur les lignes passent
+    par une sous-requête, sans jointure ni distinct() sur les ventes.
+    """
+    ventes = Vente.objects.filter(statut='confirmee')
+    if filtres.get('date_debut'):
+        ventes = ventes.filter(
+            created_at__gte=_debut_jour(filtres['date_debut']))
+    if filtres.get('date_fin'):
+        ventes = ventes.filter(
+            created_at__lt=_debut_jour(filtres['date_fin'] + timedelta(days=1)))
+    if filtres.get('vendeur'):
+        ventes = ventes.filter(created_by_id=filtres['vendeur'])
+
+    lignes = Q()
+    if filtres.get('entrepot'):
+        lignes &= Q(entrepot_id=filtres['entrepot'])
+    if filtres.get('categorie'):
+        lignes &= Q(produit__categorie_id=filtres['categorie'])
+    if lignes:
+        ventes = ventes.filter(
+            pk__in=LigneDeVente.objects.filter(lignes).values('vente_id'))
+    return ventes
+
+
+def filtrer_agregats(agregats, filtres):
+    """Applique les filtres du rapport à VenteJournaliere ou LigneVenteJournaliere"""
+    if filtres.get('date_debut'):
+        agregats = agregats.filter(date__gte=filtres['date_debut'])
+    if filtres.get('date_fin'):
+        agregats = agregats.filter(date__lte=filtres['date_fin'])
+    if filtres.get('vendeur'):
+        agregats = agregats.filter(vendeur_id=filtres['vendeur'])
+    if filtres.get('entrepot'):
+        agregats = agregats.filter(entrepot_id=filtres['entrepot'])
+    if filtres.get('categorie'):
+        agregats = agregats.filter(produit__categorie_id=filtres['categorie'])
+    return agregats
+
+
+def statistiques_ventes(filtres):
+    """Indicateurs du rapport : agrégats quotidiens et une requête sur les ventes"""
+    montant = models.DecimalField(max_digits=14, decimal_places=2)
+    filtre_lignes = any(filtres.get(nom) for nom in FILTRES_LIGNES)
+
+    def nombre(statut_paiement):
+        return Count('pk', filter=Q(statut_paiement=statut_paiement))
+
+    agregations = {
+        'clients_actifs': Count('client', distinct=True),
+        'montant_encaisse': Coalesce(
+            Sum('montant_paye'), Value(0), output_field=montant),
+        'montant_restant': Coalesce(
+            Sum('montant_restant'), Value(0), output_field=montant),
+        'ventes_payees': nombre('paye'),
+        'ventes_partielles': nombre('partiel'),
+        'ventes_non_payees': nombre('non_paye'),
+    }
+    if filtre_lignes:
+        # Ventes distinctes ayant une ligne concernée
+        agregations.update(
+            total_ventes=Count('pk'),
+            chiffre_affaires_total=Coalesce(
+                Sum('montant_total'), Value(0), output_field=montant),
+        )
+    stats = filtrer_ventes(filtres).order_by().aggregate(**agregations)
+
+    if not filtre_lignes:
+        stats.update(filtrer_agregats(
+            VenteJournaliere.objects.all(), filtres
+        ).aggregate(
+            total_ventes=Coalesce(Sum('nombre_ventes'), Value(0)),
+            chiffre_affaires_total=Coalesce(
+                Sum('chiffre_affaires'), Value(0), output_field=montant),
+        ))
+    stats.update(filtrer_agregats(
+        LigneVenteJournaliere.objects.all(), filtres
+    ).aggregate(total_produits_vendus=Coalesce(Sum('quantite'), Value(0))))
+
+    return {nom: stats[nom] for nom in (
+        'total_ventes', 'chiffre_affaires_total', 'montant_encaisse',
+        'montant_restant', 'clients_actifs', 'total_produits_vendus',
+        'ventes_payees', 'ventes_partielles', 'ventes_non_payees')}
+
+
+def classements_ventes(filtres, top=5):
+    """Top `top` vendeurs, produits et entrepôts en une requête
+
+    Chaque dimension est une requête groupée (cle, nom, valeur), numérotée
+    par ROW_NUMBER() ; les trois classements sont réunis par UNION ALL.
+    L'ORM place la fenêtre dans le GROUP BY quand elle ordonne un agrégat :
+    elle est donc appliquée ici sur la requête groupée compilée par l'ORM,
+    en table dérivée.
+    """
+    lignes_ventes = LigneDeVente.objects.filter(
+        vente__in=filtrer_ventes(filtres)).order_by()
+    if any(filtres.get(nom) for nom in FILTRES_LIGNES):
+        vendeurs = lignes_ventes.values(
+            cle=F('vente__created_by'), nom=F('vente__created_by__email')
+        ).annotate(valeur=Count('vente', distinct=True))
+    else:
+        vendeurs = filtrer_agregats(
+            VenteJournaliere.objects.order_by(), filtres
+        ).values(cle=F('vendeur'), nom=F('vendeur__email')).annotate(
+            valeur=Sum('nombre_ventes')).filter(valeur__gt=0)
+    produits = filtrer_agregats(
+        LigneVenteJournaliere.objects.order_by(), filtres
+    ).values(cle=F('produit'), nom=F('produit__nom')).annotate(
+        valeur=Sum('quantite')).filter(valeur__gt=0)
+    entrepots = lignes_ventes.values(
+        cle=F('entrepot'), nom=F('entrepot__nom')
+    ).annotate(valeur=Count('vente', distinct=True))
+    dimensions = {
+        'vendeurs': vendeurs,
+        'produits': produits,
+        'entrepots': entrepots,
+    }
+
+    requetes, parametres = [], []
+    for dimension, groupes in dimensions.items():
+        sql, params = groupes.query.sql_with_params()
+        requetes.append(
+            'SELECT * FROM (SELECT %s AS dimension, cle, nom, valeur, '
+            'ROW_NUMBER() OVER (ORDER BY valeur DESC, cle) AS rang '
+            f'FROM ({sql}) groupes) classement WHERE rang <= %s')
+        parametres += [dimension, *params, top]
+
+    classements = {dimension: [] for dimension in dimensions}
+    with connection.cursor() as curseur:
+        curseur.execute(' UNION ALL '.join(requetes), parametres)
+        for dimension, cle, nom, valeur, rang in curseur.fetchall():
+            classements[dimension].append((rang, cle, nom, valeur))
+    return {
+        dimension: [
+            {'id': cle, 'nom': nom, 'valeur': valeur}
+            for _, cle, nom, valeur in sorted(lignes_dimension)
+        ]
+        for dimension, lignes_dimension in classements.items()
+    }
+
+
+def _cle(filtres, top):
+    empreinte = hashlib.sha1(json.dumps(
+        [filtres, top], sort_keys=True, default=str).encode()).hexdigest()
+    return f'rapport_ventes:{empreinte}'
+
+
+def rapport_ventes(filtres, top=5):
+    """Statistiques et classements, mémorisés par jeu de filtres
+
+    `filtres` : valeurs déjà converties (voir parametres_filtre). Retourne
+    (rapport, depuis_cache).
+    """
+    filtres = {nom: filtres[nom] for nom in FILTRES_VENTES if filtres.get(nom)}
+    cle = _cle(filtres, top)
+    rapport = cache.get(cle)
+    if rapport is not None:
+        return rapport, True
+
+    rapport = {
+        'stats': statistiques_ventes(filtres),
+        'classements': classements_ventes(filtres, top),
+    }
+    cache.set(cle, rapport,
+              getattr(settings, 'RAPPORT_VENTES_CACHE_TIMEOUT', 60))
+    return rapport, False
@@ -2,11 +2,10 @@ from .models import Produit, StockEntrepot
 import os
 from .models import Produit
 from .models import TransfertEntrepot, LigneTransfert, StockEntrepot
-from django.utils import timezone
 from rest_framework import serializers
 from .models import *
 from django.contrib.auth import get_user_model
-from datetime import datetime
+from decimal import Decimal
 from django.db import transaction
 
 User = get_user_model()
@@ -82,10 +81,48 @@ class FournisseurSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_by', 'created_at')
 
 
+class SparseFieldsetMixin:
+    """Champs partiels sur les lectures : ?fields=a,b ou ?omit=c,d
+
+    Ne s'applique qu'au serializer de premier niveau (pas aux imbriqués).
+    """
+
+    @staticmethod
+    def _parametre_champs(request, nom):
+        valeur = request.query_params.get(nom, '') if request else ''
+        return {champ.strip() for champ in valeur.split(',') if champ.strip()}
+
+    @classmethod
+    def champ_demande(cls, request, nom):
+        """Indique si le champ `nom` figurera dans la réponse"""
+        if request is None or request.method != 'GET':
+            return True
+        fields = cls._parametre_champs(request, 'fields')
+        omit = cls._parametre_champs(request, 'omit')
+        return (not fields or nom in fields) and nom not in omit
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        racine = self.parent is None or (
+            isinstance(self.parent, serializers.ListSerializer)
+            and self.parent.parent is None
+        )
+        if not racine or request is None or request.method != 'GET':
+            return fields
+
+        demandes = self._parametre_champs(request, 'fields')
+        exclus = self._parametre_champs(request, 'omit')
+        for nom in list(fields):
+            if (demandes and nom not in demandes and nom != 'id') or nom in exclus:
+                fields.pop(nom)
+        return fields
+
+
 # Dans serializers.py, modifiez ProduitSerializer
 
 
-class ProduitSerializer(serializers.ModelSerializer):
+class ProduitSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     stock_actuel = serializers.SerializerMethodField()
     en_rupture = serializers.SerializerMethodField()
     stock_faible = serializers.SerializerMethodField()
@@ -117,7 +154,8 @@ class ProduitSerializer(serializers.ModelSerializer):
 
     def get_stocks_entrepots(self, obj):
         """Retourne les stocks du produit par entrepôt"""
-        stocks = StockEntrepot.objects.filter(produit=obj)
+        # Utilise le prefetch de ProduitViewSet.get_queryset s'il existe
+        stocks = obj.stockentrepot_set.all()
         from .serializers import StockEntrepotSerializer
         return StockEntrepotSerializer(stocks, many=True, read_only=True).data
 
@@ -276,11 +314,56 @@ class StockEntrepotSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RelationEnLotField(serializers.PrimaryKeyRelatedField):
+    """Clé primaire résolue depuis les objets chargés en lot par la liste parente"""
+
+    def to_internal_value(self, data):
+        objets = (getattr(self.parent, 'objets_en_lot', None)
+                  or {}).get(self.field_name)
+        if objets is not None:
+            try:
+                objet = objets.get(int(data))
+            except (TypeError, ValueError):
+                objet = None
+            if objet is not None:
+                return objet
+        # Clé inconnue ou invalide : validation standard (messages d'erreur)
+        return super().to_internal_value(data)
+
+
+class LigneDeVenteListSerializer(serializers.ListSerializer):
+    """Charge produits et entrepôts de toutes les lignes en une requête chacun"""
+
+    def _charger_en_lot(self, data):
+        objets = {}
+        for nom in ('produit', 'entrepot'):
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(int(item.get(nom)))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+            objets[nom] = self.child.fields[nom].get_queryset().in_bulk(ids)
+        return objets
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.child.objets_en_lot = self._charger_en_lot(data)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child.objets_en_lot = None
+
+
 # Serializers pour les lignes de vente avec entrepôt
 class LigneDeVenteCreateSerializer(serializers.ModelSerializer):
     """Serializer pour la création des lignes de vente avec entrepôt"""
+    produit = RelationEnLotField(queryset=Produit.objects.all())
+    entrepot = RelationEnLotField(queryset=Entrepot.objects.all())
+
     class Meta:
         model = LigneDeVente
+        list_serializer_class = LigneDeVenteListSerializer
         fields = ('produit', 'entrepot', 'quantite', 'prix_unitaire')
         extra_kwargs = {
             'produit': {'required': True},
@@ -321,112 +404,6 @@ class VenteSerializer(serializers.ModelSerializer):
         return [entrepot.nom for entrepot in obj.entrepots.all()]
 
 
-class VenteCreateSerializer(serializers.ModelSerializer):
-    lignes_vente = LigneDeVenteCreateSerializer(many=True, write_only=True)
-
-    class Meta:
-        model = Vente
-        fields = ('client', 'remise', 'lignes_vente')
-        extra_kwargs = {
-            'client': {'required': False, 'allow_null': True},
-            'remise': {'required': False, 'default': 0}
-        }
-
-    def validate_lignes_vente(self, value):
-        """Validation des lignes de vente avec vérification des stocks par entrepôt"""
-        if not value or len(value) == 0:
-            raise serializers.ValidationError(
-                "Au moins une ligne de vente est requise."
-            )
-
-        for ligne in value:
-            produit = ligne.get('produit')
-            entrepot = ligne.get('entrepot')
-            quantite = ligne.get('quantite')
-
-            if not produit or not entrepot or not quantite or quantite <= 0:
-                raise serializers.ValidationError(
-                    "Chaque ligne doit avoir un produit, un entrepôt et une quantité positive."
-                )
-
-            if not ligne.get('prix_unitaire') or ligne['prix_unitaire'] <= 0:
-                raise serializers.ValidationError(
-                    "Le prix unitaire doit être positif."
-                )
-
-            # Vérifier le stock dans l'entrepôt spécifié
-            try:
-                stock_entrepot = StockEntrepot.objects.get(
-                    produit=produit,
-                    entrepot=entrepot
-                )
-                if quantite > stock_entrepot.quantite_disponible:
-                    raise serializers.ValidationError({
-                        'lignes_vente': f'Stock insuffisant pour {produit.nom} dans {entrepot.nom}. Disponible: {stock_entrepot.quantite_disponible}'
-                    })
-            except StockEntrepot.DoesNotExist:
-                raise serializers.ValidationError({
-                    'lignes_vente': f'Le produit {produit.nom} n\'est pas disponible dans {entrepot.nom}'
-                })
-
-        return value
-
-    @transaction.atomic
-    def create(self, validated_data):
-        lignes_data = validated_data.pop('lignes_vente')
-
-        # Générer numéro de vente unique
-        today = datetime.now().strftime('%Y%m%d')
-        last_vente_today = Vente.objects.filter(
-            numero_vente__startswith=f'V{today}'
-        ).count()
-        numero_vente = f'V{today}{last_vente_today + 1:04d}'
-
-        # Créer la vente
-        vente = Vente.objects.create(
-            numero_vente=numero_vente,
-            created_by=self.context['request'].user,
-            **validated_data
-        )
-
-        # Créer les lignes de vente et réserver le stock
-        entrepots_utilises = set()
-        for ligne_data in lignes_data:
-            ligne = LigneDeVente.objects.create(vente=vente, **ligne_data)
-            entrepots_utilises.add(ligne.entrepot)
-
-            # Réserver le stock dans l'entrepôt
-            stock_entrepot = StockEntrepot.objects.get(
-                produit=ligne.produit,
-                entrepot=ligne.entrepot
-            )
-            stock_entrepot.reserver_stock(ligne.quantite)
-
-        # Ajouter les entrepôts utilisés à la vente
-        vente.entrepots.set(entrepots_utilises)
-
-        # Calculer et sauvegarder le montant total
-        vente.montant_total = vente.calculer_total()
-        vente.save()
-
-        # Log d'audit
-        AuditLog.objects.create(
-            user=self.context['request'].user,
-            action='vente',
-            modele='Vente',
-            objet_id=vente.id,
-            details={
-                'numero_vente': vente.numero_vente,
-                'client': vente.client.nom if vente.client else 'Aucun',
-                'montant_total': str(vente.montant_total),
-                'lignes': len(lignes_data),
-                'entrepots': [e.nom for e in entrepots_utilises]
-            }
-        )
-
-        return vente
-
-
 # serializers.py - Partie Transferts
 # serializers.py - Ajoutez ces serializers
 
@@ -497,6 +474,62 @@ class VenteCreateSerializer(serializers.ModelSerializer):
             'remise': {'required': False, 'default': 0}
         }
 
+    def validate_lignes_vente(self, value):
+        """Validation des lignes avec vérification des stocks par entrepôt
+
+        Les stocks concernés sont chargés en une requête ; les quantités
+        d'un même produit dans un même entrepôt sont cumulées.
+        """
+        if not value:
+            raise serializers.ValidationError(
+                "Au moins une ligne de vente est requise."
+            )
+
+        demandes = {}
+        for ligne in value:
+            produit = ligne.get('produit')
+            entrepot = ligne.get('entrepot')
+            quantite = ligne.get('quantite')
+
+            if not produit or not entrepot or not quantite or quantite <= 0:
+                raise serializers.ValidationError(
+                    "Chaque ligne doit avoir un produit, un entrepôt et une quantité positive."
+                )
+
+            if not ligne.get('prix_unitaire') or ligne['prix_unitaire'] <= 0:
+                raise serializers.ValidationError(
+                    "Le prix unitaire doit être positif."
+                )
+
+            cle = (produit.id, entrepot.id)
+            demandes[cle] = demandes.get(cle, 0) + quantite
+
+        stocks = {
+            (stock.produit_id, stock.entrepot_id): stock
+            for stock in StockEntrepot.objects.filter(
+                produit_id__in={p for p, _ in demandes},
+                entrepot_id__in={e for _, e in demandes},
+            )
+        }
+
+        for ligne in value:
+            produit, entrepot = ligne['produit'], ligne['entrepot']
+            cle = (produit.id, entrepot.id)
+            stock_entrepot = stocks.get(cle)
+            if stock_entrepot is None:
+                raise serializers.ValidationError(
+                    f"Le produit {produit.nom} n'est pas disponible dans {entrepot.nom}"
+                )
+            if demandes[cle] > stock_entrepot.quantite_disponible:
+                raise serializers.ValidationError(
+                    f"Stock insuffisant pour {produit.nom} dans {entrepot.nom}. "
+                    f"Disponible: {stock_entrepot.quantite_disponible}"
+                )
+
+        # Réutilisé par create() pour la réservation
+        self._quantites_lignes = demandes
+        return value
+
     @transaction.atomic
     def create(self, validated_data):
         lignes_data = validated_data.pop('lignes_vente')
@@ -504,33 +537,45 @@ class VenteCreateSerializer(serializers.ModelSerializer):
         mode_paiement = validated_data.pop('mode_paiement', None)
 
         # Générer numéro de vente
-        today = datetime.now().strftime('%Y%m%d')
-        last_vente_today = Vente.objects.filter(
-            numero_vente__startswith=f'V{today}'
-        ).count()
-        numero_vente = f'V{today}{last_vente_today + 1:04d}'
+        numero_vente = CompteurDocument.generer_numero(
+            CompteurDocument.SERIE_VENTE)
+
+        # Montant total calculé en mémoire : la vente est écrite une seule fois
+        lignes = [LigneDeVente(**ligne_data) for ligne_data in lignes_data]
+        montant_total = (sum(ligne.sous_total() for ligne in lignes)
+                         - validated_data.get('remise', 0))
 
         # Créer la vente
         vente = Vente.objects.create(
             numero_vente=numero_vente,
             created_by=self.context['request'].user,
+            montant_total=montant_total,
             montant_paye=montant_paye,
             mode_paiement=mode_paiement,
             **validated_data
         )
 
-        # Créer les lignes de vente
-        entrepots_utilises = set()
-        for ligne_data in lignes_data:
-            ligne = LigneDeVente.objects.create(vente=vente, **ligne_data)
-            entrepots_utilises.add(ligne.entrepot)
+        # Créer les lignes de vente en une requête
+        for ligne in lignes:
+            ligne.vente = vente
+        LigneDeVente.objects.bulk_create(lignes)
 
         # Ajouter les entrepôts utilisés
-        vente.entrepots.set(entrepots_utilises)
+        entrepots_ids = {ligne.entrepot_id for ligne in lignes}
+        Vente.entrepots.through.objects.bulk_create(
+            Vente.entrepots.through(vente_id=vente.id, entrepot_id=entrepot_id)
+            for entrepot_id in entrepots_ids
+        )
 
-        # Calculer le montant total
-        vente.montant_total = vente.calculer_total()
-        vente.save()
+        # Réserver le stock : un UPDATE conditionnel par entrepôt (différé
+        # quand l'appelant réserve pour plusieurs ventes à la fois)
+        if not self.context.get('reservation_differee'):
+            try:
+                StockEntrepot.objects.reserver_lot(self._quantites_lignes)
+            except StockInsuffisantError as e:
+                # Stock pris par une vente concurrente depuis la validation
+                raise serializers.ValidationError({'lignes_vente': [
+                    detail['message'] for detail in e.details] or [str(e)]})
 
         # Si un paiement initial est fait, enregistrer
         if montant_paye > 0:
@@ -542,6 +587,53 @@ class VenteCreateSerializer(serializers.ModelSerializer):
             )
 
         return vente
+
+
+class PaiementSynchroSerializer(serializers.Serializer):
+    """Paiement encaissé hors ligne, joint à une vente synchronisée"""
+    montant = serializers.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    mode_paiement = serializers.ChoiceField(choices=Vente.MODE_PAIEMENT)
+    reference = serializers.CharField(
+        required=False, allow_blank=True, max_length=100)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+
+class VenteSynchroSerializer(VenteCreateSerializer):
+    """Vente enregistrée hors ligne par un terminal (POST /ventes/synchroniser/)
+
+    Même validation que VenteCreateSerializer, avec la référence du
+    terminal et la liste des paiements encaissés.
+    """
+    reference_locale = serializers.CharField(max_length=100)
+    paiements = PaiementSynchroSerializer(many=True, required=False)
+
+    class Meta(VenteCreateSerializer.Meta):
+        fields = VenteCreateSerializer.Meta.fields + (
+            'reference_locale', 'paiements')
+        # Unicité (vendeur, référence) vérifiée en lot par la vue
+        validators = []
+
+    @transaction.atomic
+    def create(self, validated_data):
+        paiements = validated_data.pop('paiements', None)
+        if not paiements:
+            return super().create(validated_data)
+
+        validated_data['montant_paye'] = 0
+        validated_data.setdefault('mode_paiement', paiements[0]['mode_paiement'])
+        vente = super().create(validated_data)
+
+        user = self.context['request'].user
+        Paiement.objects.bulk_create(
+            Paiement(vente=vente, created_by=user, **paiement)
+            for paiement in paiements
+        )
+        vente.montant_paye = sum(paiement['montant'] for paiement in paiements)
+        vente.save()
+        return vente
+
+
 # serializers.py - Ajoutez ce serializer
 
 
@@ -612,15 +704,8 @@ class VenteUpdateSerializer(serializers.ModelSerializer):
 
         # Libérer les stocks des anciennes lignes si de nouvelles lignes sont fournies
         if lignes_data:
-            for ancienne_ligne in instance.lignes_vente.all():
-                try:
-                    stock_entrepot = StockEntrepot.objects.get(
-                        entrepot=ancienne_ligne.entrepot,
-                        produit=ancienne_ligne.produit
-                    )
-                    stock_entrepot.liberer_stock(ancienne_ligne.quantite)
-                except StockEntrepot.DoesNotExist:
-                    pass
+            StockEntrepot.objects.liberer_lot(
+                quantites_par_stock(instance.lignes_vente.all()))
 
             # Supprimer les anciennes lignes
             instance.lignes_vente.all().delete()
@@ -632,22 +717,25 @@ class VenteUpdateSerializer(serializers.ModelSerializer):
                     vente=instance, **ligne_data)
                 entrepots_utilises.add(ligne.entrepot)
 
-                # Réserver le stock dans l'entrepôt
-                stock_entrepot = StockEntrepot.objects.get(
-                    produit=ligne.produit,
-                    entrepot=ligne.entrepot
-                )
-                stock_entrepot.reserver_stock(ligne.quantite)
+            # Réserver le stock dans les entrepôts
+            try:
+                StockEntrepot.objects.reserver_lot(quantites_par_stock(
+                    instance.lignes_vente.all()))
+            except StockInsuffisantError as e:
+                raise serializers.ValidationError({'lignes_vente': [
+                    detail['message'] for detail in e.details] or [str(e)]})
 
             # Mettre à jour les entrepôts
             instance.entrepots.set(entrepots_utilises)
 
+            # Montants ajustés en base par les signaux des lignes supprimées
+            instance.refresh_from_db(fields=Vente.CHAMPS_CALCULES)
+
         # Mettre à jour les autres champs
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        # Recalculer le montant total
-        instance.montant_total = instance.calculer_total()
+        # Seuls les champs modifiés sont écrits (remise répercutée sur le total)
         instance.save()
 
         return instance
@@ -698,6 +786,16 @@ class EnregistrerPaiementSerializer(serializers.Serializer):
         return data
 
 
+class ReglementClientSerializer(serializers.Serializer):
+    """Règlement global d'un client, réparti sur ses ventes dues"""
+    montant = serializers.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal('0.01'))
+    mode_paiement = serializers.ChoiceField(choices=Vente.MODE_PAIEMENT)
+    reference = serializers.CharField(
+        required=False, allow_blank=True, max_length=100)
+    notes = serializers.CharField(required=False, allow_blank=True)
+
+
 class HistoriqueClientSerializer(serializers.Serializer):
     """Serializer pour l'historique d'un client"""
     ventes = VenteDetailSerializer(many=True, read_only=True)
@@ -804,11 +902,8 @@ class TransfertEntrepotCreateSerializer(serializers.ModelSerializer):
         lignes_data = validated_data.pop('lignes_transfert')
 
         # Générer une référence unique
-        today = datetime.now().strftime('%Y%m%d')
-        last_transfert_today = TransfertEntrepot.objects.filter(
-            created_at__date=timezone.now().date()
-        ).count()
-        reference = f"TRF{today}{last_transfert_today + 1:04d}"
+        reference = CompteurDocument.generer_numero(
+            CompteurDocument.SERIE_TRANSFERT)
 
         # Créer le transfert
         transfert = TransfertEntrepot.objects.create(
@@ -1,3 +1,1134 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import viewsets
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import audit
+from .export import XLSXRenderer
+from .idempotence import idempotent
+from .models import (
+    AuditLog, CleIdempotence, Client, CompteurDocument, CustomUser, Entrepot,
+    LigneDeVente, LigneVenteJournaliere, MouvementStock, Paiement, Produit,
+    StockEntrepot, StockInsuffisantError, Vente, VenteJournaliere)
+from .views import RapportsViewSet, VenteViewSet
+
+
+# Cache en mémoire pendant les tests : le cache fichier du projet
+# (BASE_DIR/cache) n'est ni lu ni modifié
+cache_tests = override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+})
+
+
+def setUpModule():
+    cache_tests.enable()
+
+
+def tearDownModule():
+    cache_tests.disable()
+    # Entrées d'audit encore en file écrites dans la base de test, pas dans
+    # la base du projet rétablie après les tests
+    audit.vider()
+
+
+# Tests avec commits réels : entrées d'audit écrites dans la transaction,
+# pas par le thread après la remise à zéro des tables
+audit_synchrone = override_settings(AUDIT_DURABILITE='transaction')
+
+
+class CompteurDocumentTests(TestCase):
+    def test_numerotation_par_serie_et_par_jour(self):
+        jour = date(2026, 1, 15)
+        self.assertEqual(
+            CompteurDocument.generer_numero('V', jour), 'V202601150001')
+        self.assertEqual(
+            CompteurDocument.generer_numero('V', jour), 'V202601150002')
+        self.assertEqual(
+            CompteurDocument.generer_numero('F', jour), 'F202601150001')
+        self.assertEqual(
+            CompteurDocument.generer_numero('V', date(2026, 1, 16)),
+            'V202601160001')
+
+    def test_rollback_libere_le_numero(self):
+        jour = date(2026, 1, 15)
+        CompteurDocument.generer_numero('TRF', jour)
+        try:
+            with transaction.atomic():
+                CompteurDocument.generer_numero('TRF', jour)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(
+            CompteurDocument.generer_numero('TRF', jour), 'TRF202601150002')
+
+
+class CompteurDocumentConcurrenceTests(TransactionTestCase):
+    NB_THREADS = 8
+    NB_PAR_THREAD = 10
+
+    def test_creations_paralleles_sans_collision(self):
+        jour = date(2026, 1, 15)
+        numeros = []
+        erreurs = []
+        depart = threading.Barrier(self.NB_THREADS)
+
+        def creer():
+            try:
+                depart.wait()
+                for _ in range(self.NB_PAR_THREAD):
+                    with transaction.atomic():
+                        numeros.append(
+                            CompteurDocument.generer_numero('V', jour))
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=creer)
+                   for _ in range(self.NB_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        total = self.NB_THREADS * self.NB_PAR_THREAD
+        self.assertEqual(erreurs, [])
+        self.assertEqual(len(set(numeros)), total)
+        self.assertEqual(
+            sorted(numeros),
+            [f'V20260115{n:04d}' for n in range(1, total + 1)])
+
+
+@audit_synchrone
+class StockEntrepotConcurrenceTests(TransactionTestCase):
+    def test_reservations_paralleles_sans_survente(self):
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        stock = StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=5)
+        reussites = []
+        refus = []
+        depart = threading.Barrier(8)
+
+        def reserver():
+            try:
+                depart.wait()
+                StockEntrepot.objects.get(pk=stock.pk).reserver_stock(1)
+                reussites.append(1)
+            except StockInsuffisantError:
+                refus.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserver) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stock.refresh_from_db()
+        produit.refresh_from_db()
+        self.assertEqual((len(reussites), len(refus)), (5, 3))
+        self.assertEqual(stock.quantite_reservee, 5)
+        self.assertEqual(produit.quantite_reservee, 5)
+
+
+class FiltresStockTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        # stock_alerte = 5 : rupture, faible, suffisant
+        for code, quantite in (('P0', 0), ('P1', 3), ('P2', 20)):
+            StockEntrepot.objects.create(
+                entrepot=entrepot, quantite=quantite,
+                produit=Produit.objects.create(
+                    code=code, nom=code, prix_achat=5, prix_vente=10))
+
+    def codes(self, url, cle):
+        return sorted(ligne[cle] for ligne in self.api.get(url).data)
+
+    def test_produits(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.codes(
+                '/produits/?low_stock=1&omit=stocks_entrepots', 'code'), ['P1'])
+        self.assertEqual(self.codes('/produits/?out_of_stock=1', 'code'),
+                         ['P0'])
+
+    def test_stocks_entrepot(self):
+        self.assertEqual(self.codes(
+            '/stock-entrepot/?low_stock=1', 'produit_code'), ['P1'])
+        self.assertEqual(self.codes(
+            '/stock-entrepot/?out_of_stock=1', 'produit_code'), ['P0'])
+
+
+class ListesRequetesTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.admin = CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin')
+        self.api.force_authenticate(self.admin)
+        self.entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+
+    def creer_produits(self, nombre):
+        for _ in range(nombre):
+            n = Produit.objects.count()
+            StockEntrepot.objects.create(
+                entrepot=self.entrepot, quantite=10,
+                produit=Produit.objects.create(
+                    code=f'P{n}', nom=f'Produit {n}', prix_achat=5,
+                    prix_vente=10, created_by=self.admin))
+
+    def creer_ventes(self, nombre):
+        stock = StockEntrepot.objects.first()
+        for _ in range(nombre):
+            vente = creer_brouillon(f'V{Vente.objects.count()}', stock, 1)
+            vente.client = Client.objects.create(
+                nom='C', telephone='-', adresse='-')
+            vente.created_by = self.admin
+            vente.save()
+            vente.entrepots.add(self.entrepot)
+            Paiement.objects.create(vente=vente, montant=1,
+                                    mode_paiement='especes',
+                                    created_by=self.admin)
+
+    def test_produits_nombre_de_requetes_constant(self):
+        # Produits avec leurs relations, puis répartition par entrepôt
+        for nombre in (2, 5):
+            self.creer_produits(nombre)
+            with self.assertNumQueries(2):
+                reponse = self.api.get('/produits/')
+            self.assertEqual(len(reponse.data), Produit.objects.count())
+        # Répartition omise : pas de préchargement
+        with self.assertNumQueries(1):
+            self.api.get('/produits/?omit=stocks_entrepots')
+
+    def test_ventes_nombre_de_requetes_constant(self):
+        self.creer_produits(1)
+        comptes = []
+        for nombre in (2, 5):
+            self.creer_ventes(nombre)
+            with CaptureQueriesContext(connection) as requetes:
+                reponse = self.api.get('/ventes/')
+            self.assertEqual(len(reponse.data['results']),
+                             Vente.objects.count())
+            comptes.append(len(requetes))
+        self.assertEqual(comptes[0], comptes[1])
+
+    def test_champs_partiels(self):
+        self.creer_produits(1)
+        produit, = self.api.get('/produits/?fields=code,nom').data
+        self.assertEqual(set(produit), {'id', 'code', 'nom'})
+
+        produit, = self.api.get(
+            '/produits/?omit=stocks_entrepots,image_url,thumbnail_url').data
+        self.assertNotIn('stocks_entrepots', produit)
+        self.assertNotIn('image_url', produit)
+        self.assertEqual(produit['created_by_email'], 'admin@test.com')
+        self.assertEqual(produit['stock_actuel'], 10)
+
+
+class MatriceDisponibiliteTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        self.entrepots = [Entrepot.objects.create(nom=f'E{n}', adresse='-')
+                          for n in (1, 2)]
+        self.produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=5, prix_vente=10)
+        for entrepot, quantite in zip(self.entrepots, (4, 7)):
+            StockEntrepot.objects.create(
+                entrepot=entrepot, produit=self.produit, quantite=quantite)
+
+    def matrice(self, parametres, **entetes):
+        return self.api.get(f'/stock-disponible/?{parametres}', **entetes)
+
+    def test_matrice_et_etag(self):
+        autre = Produit.objects.create(
+            code='P2', nom='Autre', prix_achat=5, prix_vente=10)
+        reponse = self.matrice(f'produits={autre.pk},{self.produit.pk}')
+        self.assertEqual(reponse.status_code, 200)
+        ligne = reponse.data['disponibilites'][str(self.produit.pk)]
+        self.assertEqual(ligne['total']['quantite_disponible'], 11)
+        self.assertEqual(reponse.data['sans_stock'], [autre.pk])
+
+        # Même panier dans un autre ordre : même ETag, 304
+        etag = reponse['ETag']
+        reponse = self.matrice(f'produits={self.produit.pk}&produits={autre.pk}',
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((reponse.status_code, reponse['ETag']), (304, etag))
+
+        StockEntrepot.objects.reserver_lot(
+            {(self.produit.pk, self.entrepots[0].pk): 1})
+        reponse = self.matrice(f'produits={self.produit.pk},{autre.pk}',
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(reponse.status_code, 200)
+        self.assertNotEqual(reponse['ETag'], etag)
+
+    def test_ids_invalides(self):
+        for parametres in ('produits=1,x', f'produits={self.produit.pk}&entrepots=a'):
+            self.assertEqual(self.matrice(parametres).status_code, 400)
+
+
+class ValorisationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        self.entrepots = [Entrepot.objects.create(nom=f'E{n}', adresse='-')
+                          for n in (1, 2)]
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=5, prix_vente=10)
+        for entrepot, quantite in zip(self.entrepots, (4, 6)):
+            StockEntrepot.objects.create(
+                entrepot=entrepot, produit=produit, quantite=quantite)
+        for jour in ('2026-01-10', '2026-01-11'):
+            call_command('capturer_valorisation', date=jour,
+                         stdout=io.StringIO())
+
+    def valorisation(self, parametres=''):
+        return self.api.get(f'/valorisation/{parametres}')
+
+    def test_series(self):
+        serie, = self.valorisation('?date_debut=2026-01-11').data['series']
+        self.assertEqual(serie['points'], [
+            {'date': date(2026, 1, 11), 'quantite': 10, 'valeur': 50.0}])
+
+        e1 = self.entrepots[0]
+        series = self.valorisation(
+            f'?niveau=entrepot&entrepot={e1.pk}&prix=vente').data['series']
+        self.assertEqual([(serie['id'], [p['valeur'] for p in serie['points']])
+                          for serie in series], [(e1.pk, [40.0, 40.0])])
+
+    def test_parametres_invalides(self):
+        for parametres in ('?date_debut=xx', '?date_fin=2026-02-30',
+                           '?niveau=entrepot&entrepot=abc', '?niveau=rayon',
+                           '?prix=moyen', '?niveau=produit&entrepot=1'):
+            self.assertEqual(
+                self.valorisation(parametres).status_code, 400, parametres)
+
+
+class StockGlobalTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        for n in range(3):
+            StockEntrepot.objects.create(
+                entrepot=entrepot, quantite=n, produit=Produit.objects.create(
+                    code=f'P{n}', nom=f'Produit {n}', prix_achat=5,
+                    prix_vente=10))
+
+    def test_pagine_par_defaut(self):
+        reponse = self.api.get('/stock-entrepot/stock_global/?page_size=2')
+        self.assertEqual(reponse.data['count'], 3)
+        self.assertEqual(
+            [ligne['produit_code'] for ligne in reponse.data['results']],
+            ['P0', 'P1'])
+        self.assertIn('count', self.api.get(
+            '/stock-entrepot/stock_global/').data)
+
+    def test_stream_renvoie_toute_la_liste(self):
+        reponse = self.api.get('/stock-entrepot/stock_global/?stream=true')
+        lignes = json.loads(b''.join(reponse.streaming_content))
+        self.assertEqual([ligne['total_quantite'] for ligne in lignes],
+                         [0, 1, 2])
+
+
+class ProduitTotauxStockTests(TestCase):
+    def test_save_ne_reecrit_pas_les_totaux(self):
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        copie = Produit.objects.get(pk=produit.pk)
+        StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=7,
+            quantite_reservee=2)
+
+        copie.nom = 'Produit renommé'
+        copie.save()
+
+        produit.refresh_from_db()
+        self.assertEqual(produit.nom, 'Produit renommé')
+        self.assertEqual(
+            (produit.quantite_totale, produit.quantite_reservee), (7, 2))
+
+
+class TotauxVenteTests(TestCase):
+    def setUp(self):
+        self.produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        self.entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        self.vente = Vente.objects.create(numero_vente='V1')
+
+    def ajouter_ligne(self, quantite, prix):
+        return LigneDeVente.objects.create(
+            vente=self.vente, produit=self.produit, entrepot=self.entrepot,
+            quantite=quantite, prix_unitaire=prix)
+
+    def verifier_total(self, attendu):
+        vente = Vente.objects.get(pk=self.vente.pk)
+        self.assertEqual(vente.montant_total, attendu)
+        self.assertFalse(Vente.objects.incoherentes().exists())
+
+    def test_lignes_ajoutees_modifiees_supprimees(self):
+        ligne = self.ajouter_ligne(2, 10)
+        autre = self.ajouter_ligne(1, 25)
+        self.verifier_total(45)
+
+        # Instance créée puis modifiée, et instance relue en base
+        ligne.quantite = 3
+        ligne.save()
+        self.verifier_total(55)
+        relue = LigneDeVente.objects.get(pk=autre.pk)
+        relue.prix_unitaire = 20
+        relue.save()
+        self.verifier_total(50)
+
+        relue.delete()
+        self.verifier_total(30)
+        LigneDeVente.objects.get(pk=ligne.pk).delete()
+        self.verifier_total(0)
+
+    def test_remise_repercutee_sur_le_total(self):
+        self.ajouter_ligne(4, 10)
+        Vente.objects.filter(pk=self.vente.pk).update(
+            montant_paye=30, montant_restant=10, statut_paiement='partiel')
+
+        vente = Vente.objects.get(pk=self.vente.pk)
+        vente.remise = 10
+        vente.save()
+        self.verifier_total(30)
+        vente = Vente.objects.get(pk=self.vente.pk)
+        self.assertEqual((vente.montant_restant, vente.statut_paiement),
+                         (0, 'paye'))
+
+        vente.remise = 5
+        vente.save()
+        self.verifier_total(35)
+        self.assertEqual(
+            Vente.objects.get(pk=self.vente.pk).statut_paiement, 'partiel')
+
+    def test_save_n_ecrit_que_les_champs_modifies(self):
+        self.ajouter_ligne(2, 10)
+        vente = Vente.objects.get(pk=self.vente.pk)
+        # Paiement enregistré par une autre requête après la lecture
+        Vente.objects.filter(pk=vente.pk).update(
+            montant_paye=5, montant_restant=15, statut_paiement='partiel')
+
+        vente.notes = 'Livraison le matin'
+        with CaptureQueriesContext(connection) as requetes:
+            vente.save()
+
+        mises_a_jour = [requete['sql'] for requete in requetes
+                        if requete['sql'].startswith('UPDATE "users_vente"')]
+        self.assertEqual(len(mises_a_jour), 1)
+        self.assertIn('"notes"', mises_a_jour[0])
+        self.assertNotIn('"montant_paye"', mises_a_jour[0])
+        vente.refresh_from_db()
+        self.assertEqual((vente.notes, vente.montant_paye,
+                          vente.statut_paiement),
+                         ('Livraison le matin', 5, 'partiel'))
+
+
+@audit_synchrone
+class PaiementConcurrenceTests(TransactionTestCase):
+    def test_paiements_paralleles_sans_depassement(self):
+        vente = Vente.objects.create(
+            numero_vente='V1', statut='confirmee', montant_total=50)
+        reussites = []
+        refus = []
+        depart = threading.Barrier(8)
+
+        def payer():
+            try:
+                depart.wait()
+                Vente.objects.get(pk=vente.pk).ajouter_paiement(10, 'especes')
+                reussites.append(1)
+            except ValueError:
+                refus.append(1)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=payer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        vente.refresh_from_db()
+        self.assertEqual((len(reussites), len(refus)), (5, 3))
+        self.assertEqual(vente.montant_paye, 50)
+        self.assertEqual(vente.montant_restant, 0)
+        self.assertEqual(vente.statut_paiement, 'paye')
+        self.assertEqual(Paiement.objects.filter(vente=vente).count(), 5)
+
+    def test_reglement_reparti_des_plus_anciennes(self):
+        for n, montant in enumerate((10, 20, 30)):
+            Vente.objects.create(numero_vente=f'V{n}', statut='confirmee',
+                                 montant_total=montant)
+        Vente.repartir_paiement(Vente.objects.all(), 35, 'especes')
+
+        self.assertEqual(
+            [(v.montant_paye, v.statut_paiement)
+             for v in Vente.objects.order_by('created_at', 'pk')],
+            [(10, 'paye'), (20, 'paye'), (5, 'partiel')])
+        with self.assertRaises(ValueError):
+            Vente.repartir_paiement(Vente.objects.all(), 26, 'especes')
+        self.assertEqual(Paiement.objects.count(), 3)
+
+
+def creer_brouillon(numero, stock, quantite):
+    """Vente brouillon d'une ligne, quantité réservée sur `stock`"""
+    vente = Vente.objects.create(numero_vente=numero)
+    LigneDeVente.objects.create(
+        vente=vente, produit_id=stock.produit_id, entrepot_id=stock.entrepot_id,
+        quantite=quantite, prix_unitaire=10)
+    StockEntrepot.objects.reserver_lot(
+        {(stock.produit_id, stock.entrepot_id): quantite})
+    return vente
+
+
+def charger_ventes(*ventes):
+    return list(Vente.objects.filter(
+        pk__in=[vente.pk for vente in ventes]
+    ).order_by('pk').prefetch_related(
+        'lignes_vente__produit', 'lignes_vente__entrepot'))
+
+
+class ConfirmationLotTests(TestCase):
+    def setUp(self):
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        self.stock = StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=10)
+
+    def test_ventes_sans_stock_suffisant_ecartees(self):
+        ventes = [creer_brouillon(f'V{n}', self.stock, 3) for n in range(3)]
+        StockEntrepot.objects.filter(pk=self.stock.pk).update(quantite=5)
+
+        confirmees, echecs = Vente.confirmer_lot(charger_ventes(*ventes))
+
+        self.assertEqual([vente.pk for vente in confirmees], [ventes[0].pk])
+        self.assertEqual(set(echecs), {ventes[1].pk, ventes[2].pk})
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantite, self.stock.quantite_reservee),
+                         (2, 6))
+        self.assertEqual(
+            list(Vente.objects.order_by('pk').values_list('statut', flat=True)),
+            ['confirmee', 'brouillon', 'brouillon'])
+
+    def test_repli_vente_par_vente(self):
+        ventes = [creer_brouillon(f'V{n}', self.stock, 2) for n in range(3)]
+        prelever_lot = StockEntrepot.objects.prelever_lot
+        # Lot refusé (stock modifié entre-temps), puis 2e vente refusée seule
+        appels = iter([StockInsuffisantError('lot'), None,
+                       StockInsuffisantError('vente'), None])
+
+        def prelever(demandes):
+            erreur = next(appels)
+            if erreur:
+                raise erreur
+            prelever_lot(demandes)
+
+        with mock.patch.object(StockEntrepot.objects, 'prelever_lot',
+                               side_effect=prelever):
+            confirmees, echecs = Vente.confirmer_lot(charger_ventes(*ventes))
+
+        self.assertEqual([vente.pk for vente in confirmees],
+                         [ventes[0].pk, ventes[2].pk])
+        self.assertEqual(echecs, {ventes[1].pk: 'vente'})
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantite, self.stock.quantite_reservee),
+                         (6, 2))
+
+    def test_vente_plus_brouillon_refusee(self):
+        vente, autre = [creer_brouillon(f'V{n}', self.stock, 2)
+                        for n in range(2)]
+        chargees = charger_ventes(vente, autre)
+        # Annulée après la lecture : la copie en mémoire est encore brouillon
+        Vente.objects.filter(pk=vente.pk).update(statut='annulee')
+
+        confirmees, echecs = Vente.confirmer_lot(chargees)
+
+        self.assertEqual([v.pk for v in confirmees], [autre.pk])
+        self.assertIn(vente.pk, echecs)
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantite, self.stock.quantite_reservee),
+                         (8, 2))
+        self.assertEqual(Vente.objects.get(pk=vente.pk).statut, 'annulee')
+
+
+class AnnulationLotTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        self.stock = StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=10)
+
+    def annuler(self, corps):
+        return self.api.post('/ventes/annuler_lot/', corps, format='json')
+
+    def test_reservations_liberees(self):
+        ventes = [creer_brouillon(f'V{n}', self.stock, n + 2) for n in range(3)]
+        Vente.objects.filter(pk=ventes[2].pk).update(statut='confirmee')
+
+        reponse = self.annuler({'ventes': [vente.pk for vente in ventes]})
+
+        self.assertEqual((reponse.data['total_annulees'],
+                          reponse.data['total_echecs']), (2, 1))
+        self.assertEqual(
+            [resultat['succes'] for resultat in reponse.data['resultats']],
+            [True, True, False])
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.quantite, self.stock.quantite_reservee),
+                         (10, 4))
+        self.assertEqual(
+            sorted(MouvementStock.objects.filter(
+                type_mouvement='liberation').values_list('quantite', 'motif')),
+            [(2, 'Annulation vente V0'), (3, 'Annulation vente V1')])
+
+    def test_brouillons_avant(self):
+        ancien, recent = [creer_brouillon(f'V{n}', self.stock, 2)
+                          for n in range(2)]
+        Vente.objects.filter(pk=ancien.pk).update(created_at=timezone.make_aware(
+            datetime(2026, 1, 10, 12)))
+        Vente.objects.filter(pk=recent.pk).update(created_at=timezone.make_aware(
+            datetime(2026, 2, 1, 12)))
+
+        reponse = self.annuler({'brouillons_avant': '2026-01-31'})
+
+        self.assertEqual([resultat['id'] for resultat in
+                          reponse.data['resultats']], [ancien.pk])
+        self.assertEqual(
+            dict(Vente.objects.values_list('numero_vente', 'statut')),
+            {'V0': 'annulee', 'V1': 'brouillon'})
+        self.stock.refresh_from_db()
+        self.assertEqual(self.stock.quantite_reservee, 2)
+        self.assertEqual(self.annuler(
+            {'brouillons_avant': '31/01/2026'}).status_code, 400)
+
+
+@audit_synchrone
+class ConfirmationLotConcurrenceTests(TransactionTestCase):
+    def test_confirmations_paralleles_prelevees_une_fois(self):
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        stock = StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=10)
+        vente = creer_brouillon('V1', stock, 2)
+        # Réservation d'une autre vente : le prélèvement en double passerait
+        creer_brouillon('V2', stock, 4)
+        confirmations = []
+        erreurs = []
+        depart = threading.Barrier(4)
+
+        def confirmer():
+            try:
+                ventes = charger_ventes(vente)
+                depart.wait()
+                confirmees, _ = Vente.confirmer_lot(ventes)
+                confirmations.extend(confirmees)
+            except Exception as e:
+                erreurs.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=confirmer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stock.refresh_from_db()
+        self.assertEqual(erreurs, [])
+        self.assertEqual(len(confirmations), 1)
+        self.assertEqual((stock.quantite, stock.quantite_reservee), (8, 4))
+
+
+class SynchronisationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'v@test.com', 'x', username='v', role='vendeur'))
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        self.stocks = [StockEntrepot.objects.create(
+            entrepot=entrepot, quantite=5, produit=Produit.objects.create(
+                code=f'P{n}', nom=f'Produit {n}', prix_achat=5, prix_vente=10))
+            for n in (1, 2)]
+
+    def vente(self, reference, quantite=1, stock=0):
+        stock = self.stocks[stock]
+        return {'reference_locale': reference, 'lignes_vente': [{
+            'produit': stock.produit_id, 'entrepot': stock.entrepot_id,
+            'quantite': quantite, 'prix_unitaire': 10}]}
+
+    def envoyer(self, corps, content_type='application/json'):
+        return self.api.generic('POST', '/ventes/synchroniser/', corps,
+                                content_type=content_type)
+
+    def statuts(self, reponse):
+        return {ref: resultat['statut']
+                for ref, resultat in reponse.data['resultats'].items()}
+
+    def test_tableau_json_et_ndjson(self):
+        reponse = self.envoyer(json.dumps([self.vente('A'), self.vente('B')]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.statuts(reponse), {'A': 'creee', 'B': 'creee'})
+
+        corps = '\n'.join(json.dumps(self.vente(ref)) for ref in ('C', 'D'))
+        reponse = self.envoyer(corps + '\n', 'application/x-ndjson')
+        self.assertEqual((reponse.data['total'], reponse.data['creees']), (2, 2))
+        self.assertEqual(Vente.objects.count(), 4)
+        self.stocks[0].refresh_from_db()
+        self.assertEqual(self.stocks[0].quantite_reservee, 4)
+
+    def test_tableau_tronque(self):
+        corps = json.dumps([self.vente('A'), self.vente('B')])[:-20]
+        with mock.patch.object(VenteViewSet, 'TAILLE_LOT_SYNCHRO', 1):
+            reponse = self.envoyer(corps)
+        # Le lot lu avant l'erreur reste enregistré et rapporté
+        self.assertEqual(reponse.status_code, 400)
+        self.assertEqual(self.statuts(reponse), {'A': 'creee'})
+        self.assertEqual(Vente.objects.count(), 1)
+
+    def test_doublon_et_rejeu(self):
+        reponse = self.envoyer(json.dumps(
+            [self.vente('A'), self.vente('A', quantite=2)]))
+        self.assertEqual(self.statuts(reponse), {'A': 'creee', '#1': 'erreur'})
+        vente_id = reponse.data['resultats']['A']['id']
+
+        reponse = self.envoyer(json.dumps([self.vente('A'), self.vente('B')]))
+        self.assertEqual(self.statuts(reponse),
+                         {'A': 'deja_synchronisee', 'B': 'creee'})
+        self.assertEqual(reponse.data['resultats']['A']['id'], vente_id)
+        self.assertEqual(Vente.objects.count(), 2)
+
+    def test_stock_insuffisant_sur_une_vente_du_lot(self):
+        # Chaque vente passe la validation seule ; ensemble elles dépassent
+        # le stock de P1 : seule la seconde est refusée
+        reponse = self.envoyer(json.dumps([
+            self.vente('A', quantite=3), self.vente('B', quantite=3),
+            self.vente('C', stock=1)]))
+        self.assertEqual(reponse.status_code, 200)
+        self.assertEqual(self.statuts(reponse),
+                         {'A': 'creee', 'B': 'erreur', 'C': 'creee'})
+        self.assertEqual(
+            sorted(Vente.objects.values_list('reference_locale', flat=True)),
+            ['A', 'C'])
+        self.assertEqual(
+            [stock.quantite_reservee for stock in StockEntrepot.objects.order_by(
+                'produit__code')], [3, 1])
+
+
+class CurseurPaginationTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        for n in range(7):
+            Vente.objects.create(numero_vente=f'V{n}')
+        # Même date pour toutes : seul l'id départage
+        Vente.objects.update(created_at=timezone.make_aware(
+            datetime(2026, 1, 10, 12)))
+
+    def parcourir(self, url, lien):
+        ids = []
+        while url:
+            reponse = self.api.get(url)
+            self.assertEqual(reponse.status_code, 200)
+            ids += [vente['id'] for vente in reponse.data['results']]
+            url = reponse.data[lien]
+        return ids, reponse
+
+    def test_pages_sans_doublon_ni_trou(self):
+        attendus = list(Vente.objects.order_by('-id').values_list('id', flat=True))
+        ids, derniere = self.parcourir('/ventes/?page_size=3', 'next')
+        self.assertEqual(ids, attendus)
+
+        # Retour en arrière depuis la dernière page
+        ids, _ = self.parcourir(derniere.data['previous'], 'previous')
+        ids = [vente['id'] for vente in derniere.data['results']] + ids
+        self.assertEqual(sorted(ids, reverse=True), attendus)
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_curseur_altere(self):
+        for curseur in ('pas-un-curseur',
+                        base64.b64encode(b'p=pas-une-date|1').decode(),
+                        base64.b64encode(b'p=2026-01-10T12:00:00|x').decode()):
+            self.assertIn(self.api.get(
+                '/ventes/', {'cursor': curseur}).status_code, (400, 404))
+
+
+class ExportMouvementsTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        produit = Produit.objects.create(
+            code='P1', nom='Café', prix_achat=5, prix_vente=10)
+        entrepot = Entrepot.objects.create(nom='Entrepôt', adresse='-')
+        MouvementStock.objects.create(
+            produit=produit, entrepot=entrepot, type_mouvement='entree',
+            quantite=4, motif='Réception')
+
+    def exporter(self, format_export):
+        reponse = self.api.get(
+            '/rapports/mouvements_stock/', {'format': format_export})
+        self.assertEqual(reponse.status_code, 200)
+        self.assertRegex(
+            reponse['Content-Disposition'],
+            rf'^attachment; filename="mouvements_stock_\d{{8}}\.{format_export}"$')
+        return reponse, b''.join(reponse.streaming_content)
+
+    def test_csv(self):
+        reponse, contenu = self.exporter('csv')
+        self.assertEqual(reponse['Content-Type'], 'text/csv; charset=utf-8')
+        texte = contenu.decode('utf-8')
+        # BOM pour Excel
+        self.assertTrue(texte.startswith('\ufeff'))
+        entete, ligne = csv.reader(io.StringIO(texte[1:]))
+        self.assertEqual(entete, [titre for _, titre in
+                                  RapportsViewSet.COLONNES_MOUVEMENTS])
+        self.assertEqual(ligne[2:8], ['entree', 'P1', 'Café', 'Entrepôt',
+                                      '4', '5.00'])
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        reponse, contenu = self.exporter('xlsx')
+        self.assertEqual(reponse['Content-Type'], XLSXRenderer.media_type)
+        feuille = load_workbook(io.BytesIO(contenu)).active
+        entete, ligne = feuille.iter_rows(values_only=True)
+        self.assertEqual(entete[3:6], ('Code produit', 'Produit', 'Entrepôt'))
+        self.assertEqual(ligne[3:7], ('P1', 'Café', 'Entrepôt', 4))
+        # Date sans fuseau horaire, refusée sinon par openpyxl
+        self.assertIsInstance(ligne[1], datetime)
+
+    def test_ndjson(self):
+        reponse, contenu = self.exporter('ndjson')
+        self.assertEqual(reponse['Content-Type'], 'application/x-ndjson')
+        lignes = [json.loads(ligne) for ligne in contenu.decode().splitlines()]
+        self.assertEqual(len(lignes), 1)
+        self.assertEqual(
+            (lignes[0]['produit__nom'], lignes[0]['quantite'],
+             lignes[0]['motif']), ('Café', 4, 'Réception'))
+
+
+class IdempotenceTests(TestCase):
+    class VueCompteur(viewsets.ViewSet):
+        appels = 0
+
+        @idempotent
+        def create(self, request):
+            type(self).appels += 1
+            return Response({'appel': type(self).appels}, status=201)
+
+    def setUp(self):
+        self.VueCompteur.appels = 0
+        self.user = CustomUser.objects.create_user('u@test.com', 'x')
+        self.vue = self.VueCompteur.as_view({'post': 'create'})
+
+    def envoyer(self):
+        request = APIRequestFactory().post(
+            '/compteur/', {'n': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        force_authenticate(request, self.user)
+        return self.vue(request)
+
+    def test_rejeu_de_la_reponse(self):
+        self.assertEqual(self.envoyer().data, {'appel': 1})
+        reponse = self.envoyer()
+        self.assertEqual((reponse.status_code, reponse.data),
+                         (201, {'appel': 1}))
+        self.assertEqual(self.VueCompteur.appels, 1)
+
+    def test_cle_interrompue_reprise_apres_le_bail(self):
+        # Requête dont le worker a été tué : clé restée en cours
+        cle = CleIdempotence.objects.create(
+            user=self.user, cle='k1', endpoint='POST /compteur/',
+            empreinte='', bail_expire_le=timezone.now() + timedelta(minutes=1))
+        with mock.patch('users.idempotence._empreinte', return_value=''):
+            self.assertEqual(self.envoyer().status_code, 409)
+
+            CleIdempotence.objects.filter(pk=cle.pk).update(
+                bail_expire_le=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(self.envoyer().data, {'appel': 1})
+            self.assertEqual(self.envoyer().data, {'appel': 1})
+        self.assertEqual(self.VueCompteur.appels, 1)
+
+
+class RapportClientsTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        self.clients = {
+            nom: Client.objects.create(nom=nom, telephone='-', adresse='-')
+            for nom in ('Alpha', 'Beta', 'Gamma')
+        }
+        for n, (nom, montant, jour) in enumerate((
+                ('Alpha', 100, datetime(2026, 1, 10, 12)),
+                ('Beta', 50, datetime(2026, 1, 12, 12)),
+                ('Beta', 80, datetime(2026, 3, 1, 12)))):
+            vente = Vente.objects.create(
+                numero_vente=f'V{n}', statut='confirmee', montant_total=montant,
+                client=self.clients[nom])
+            Vente.objects.filter(pk=vente.pk).update(
+                created_at=timezone.make_aware(jour))
+
+    def rapport(self, parametres=''):
+        return self.api.get(f'/rapports/clients/{parametres}')
+
+    def test_periode_avec_clients_sans_vente(self):
+        reponse = self.rapport('?date_debut=2026-01-01&date_fin=2026-01-31')
+        self.assertEqual(reponse.status_code, 200)
+        lignes = {ligne['nom']: ligne for ligne in reponse.data['clients']}
+        self.assertEqual(
+            [(lignes[nom]['total_achats'], lignes[nom]['nombre_commandes'])
+             for nom in ('Alpha', 'Beta', 'Gamma')],
+            [(100, 1), (50, 1), (0, 0)])
+        self.assertIsNone(lignes['Gamma']['dernier_achat'])
+
+    def test_tri(self):
+        def noms(parametres):
+            return [ligne['nom'] for ligne in
+                    self.rapport(parametres).data['clients']]
+
+        self.assertEqual(noms(''), ['Beta', 'Alpha', 'Gamma'])
+        self.assertEqual(noms('?tri=nom'), ['Alpha', 'Beta', 'Gamma'])
+        # Clients sans achat en dernier, dans les deux sens
+        self.assertEqual(noms('?tri=-dernier_achat'), ['Beta', 'Alpha', 'Gamma'])
+        self.assertEqual(noms('?tri=dernier_achat'), ['Alpha', 'Beta', 'Gamma'])
+        self.assertEqual(self.rapport('?tri=telephone').status_code, 400)
+
+    def test_pagination(self):
+        reponse = self.rapport('?page_size=2')
+        self.assertEqual(reponse.data['count'], 3)
+        self.assertEqual([ligne['nom'] for ligne in reponse.data['results']],
+                         ['Beta', 'Alpha'])
+        self.assertIsNotNone(reponse.data['next'])
+        reponse = self.rapport('?page_size=2&page=2')
+        self.assertEqual([ligne['nom'] for ligne in reponse.data['results']],
+                         ['Gamma'])
+
+    def test_date_invalide(self):
+        self.assertEqual(self.rapport('?date_debut=xx').status_code, 400)
+        self.assertEqual(self.rapport('?date_fin=2026-02-30').status_code, 400)
+
+
+class RapportEntrepotsTests(TestCase):
+    def test_remise_repartie_sans_troncature(self):
+        e1, e2 = [Entrepot.objects.create(nom=f'E{n}', adresse='-')
+                  for n in (1, 2)]
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=5, prix_vente=10)
+        vente = Vente.objects.create(numero_vente='V1', statut='confirmee')
+        for entrepot, prix in ((e1, 50), (e2, 10)):
+            LigneDeVente.objects.create(
+                vente=vente, produit=produit, entrepot=entrepot, quantite=1,
+                prix_unitaire=prix)
+        vente = Vente.objects.get(pk=vente.pk)
+        vente.remise = 5
+        vente.save()
+
+        chiffres = dict(Entrepot.objects.avec_ventes().values_list(
+            'nom', 'chiffre_affaires'))
+        self.assertEqual(chiffres, {'E1': Decimal('45.83'),
+                                    'E2': Decimal('9.17')})
+        self.assertEqual(sum(chiffres.values()), vente.montant_total)
+
+
+# Rapport non mémorisé : le cache est partagé entre les tests
+@override_settings(RAPPORT_VENTES_CACHE_TIMEOUT=0)
+class RapportVentesTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin'))
+        entrepots = [Entrepot.objects.create(nom=f'E{n}', adresse='-')
+                     for n in (1, 2)]
+        produits = [Produit.objects.create(
+            code=f'P{n}', nom=f'Produit {n}', prix_achat=5, prix_vente=10)
+            for n in (1, 2)]
+        for produit in produits:
+            for entrepot in entrepots:
+                StockEntrepot.objects.create(
+                    entrepot=entrepot, produit=produit, quantite=50)
+        self.e1, self.e2 = entrepots
+        self.p1, self.p2 = produits
+
+    def confirmer(self, numero, lignes):
+        vente = Vente.objects.create(numero_vente=numero)
+        for produit, entrepot, quantite in lignes:
+            LigneDeVente.objects.create(
+                vente=vente, produit=produit, entrepot=entrepot,
+                quantite=quantite, prix_unitaire=10)
+            StockEntrepot.objects.reserver_lot(
+                {(produit.pk, entrepot.pk): quantite})
+        Vente.confirmer_lot(charger_ventes(vente))
+
+    def test_statistiques_et_classements_des_agregats(self):
+        self.confirmer('V1', [(self.p1, self.e1, 2), (self.p2, self.e1, 1),
+                              (self.p2, self.e2, 1)])
+        self.confirmer('V2', [(self.p2, self.e2, 4)])
+
+        stats = self.api.get('/rapports/ventes/').data['stats']
+        self.assertEqual(
+            (stats['total_ventes'], stats['chiffre_affaires_total'],
+             stats['total_produits_vendus']), (2, 80, 8))
+        self.assertEqual(stats['top_produit']['id'], self.p2.pk)
+        self.assertEqual(
+            (stats['top_entrepot']['id'], stats['top_entrepot']['total_ventes']),
+            (self.e2.pk, 2))
+
+        # Filtre entrepôt : ventes ayant une ligne dans E1, quantités de E1
+        stats = self.api.get(
+            f'/rapports/ventes/?entrepot={self.e1.pk}').data['stats']
+        self.assertEqual(
+            (stats['total_ventes'], stats['chiffre_affaires_total'],
+             stats['total_produits_vendus']), (1, 40, 3))
+        self.assertEqual(stats['top_produit']['id'], self.p1.pk)
+
+    def test_vente_supprimee_retiree_des_agregats(self):
+        self.confirmer('V1', [(self.p1, self.e1, 2), (self.p2, self.e2, 1)])
+        vente = Vente.objects.get(numero_vente='V1')
+        self.assertEqual(self.api.delete(f'/ventes/{vente.pk}/').status_code, 204)
+
+        self.assertEqual(
+            VenteJournaliere.objects.aggregate(
+                n=Sum('nombre_ventes'), ca=Sum('chiffre_affaires')),
+            {'n': 0, 'ca': 0})
+        self.assertEqual(
+            LigneVenteJournaliere.objects.aggregate(q=Sum('quantite'))['q'], 0)
+        stats = self.api.get('/rapports/ventes/').data['stats']
+        self.assertEqual(
+            (stats['total_ventes'], stats['total_produits_vendus']), (0, 0))
+
+    def test_filtres_invalides(self):
+        for parametres in ('?date_debut=xx', '?date_fin=2026-02-30',
+                           '?vendeur=abc', '?top=x'):
+            self.assertEqual(
+                self.api.get(f'/rapports/ventes/{parametres}').status_code, 400)
+
+
+@audit_synchrone
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(
+            'admin@test.com', 'x', role='admin')
+        self.vendeurs = [
+            CustomUser.objects.create_user(
+                f'v{n}@test.com', 'x', username=f'v{n}', role='vendeur')
+            for n in (1, 2)]
+
+    def tableau(self, user):
+        api = APIClient()
+        api.force_authenticate(user)
+        return api.get('/dashboard/').data
+
+    def hits(self, user):
+        sections = self.tableau(user)['cache']['sections']
+        return sections['ventes']['hit'], sections['stocks']['hit']
+
+    def test_sections_servies_depuis_le_cache(self):
+        self.assertEqual(self.hits(self.admin), (False, False))
+        self.assertEqual(self.hits(self.admin), (True, True))
+
+    def test_portees_separees(self):
+        v1, v2 = self.vendeurs
+        Client.objects.create(nom='C1', telephone='-', adresse='-',
+                              created_by=v1)
+        self.assertEqual(self.tableau(v1)['stats']['total_clients'], 1)
+        self.assertEqual(self.hits(v2), (False, False))
+        self.assertEqual(self.hits(v1), (True, True))
+        self.assertEqual(self.tableau(v2)['stats']['total_clients'], 0)
+
+    def test_vente_invalide_admin_et_vendeur_concerne(self):
+        v1, v2 = self.vendeurs
+        for user in (self.admin, v1, v2):
+            self.tableau(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            Vente.objects.create(numero_vente='V1', created_by=v1)
+        self.assertEqual(self.hits(self.admin), (False, True))
+        self.assertEqual(self.hits(v1), (False, True))
+        self.assertEqual(self.hits(v2), (True, True))
+
+    def test_client_produit_entrepot_invalident(self):
+        self.tableau(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(nom='C1', telephone='-', adresse='-')
+        self.assertEqual(self.tableau(self.admin)['stats']['total_clients'], 1)
+
+        entrepot = Entrepot.objects.create(nom='E1', adresse='-')
+        produit = Produit.objects.create(
+            code='P1', nom='Produit', prix_achat=10, prix_vente=15)
+        StockEntrepot.objects.create(
+            entrepot=entrepot, produit=produit, quantite=3)
+        self.tableau(self.admin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            produit.prix_achat = 20
+            produit.save()
+            Produit.objects.create(
+                code='P2', nom='Autre', prix_achat=1, prix_vente=2)
+            Entrepot.objects.create(nom='E2', adresse='-')
+        stats = self.tableau(self.admin)['stats']
+        self.assertEqual(
+            (stats['total_produits'], stats['total_entrepots'],
+             stats['valeur_stock_total']), (2, 2, 60))
+
+
+@override_settings(AUDIT_DURABILITE='tampon', AUDIT_DELAI_FLUSH=60)
+class EcrivainAuditTests(TransactionTestCase):
+    def setUp(self):
+        # Entrées laissées en file par les tests précédents
+        audit.vider()
+        AuditLog.objects.all().delete()
+
+    def test_entrees_ecrites_apres_commit(self):
+        with transaction.atomic():
+            for objet_id in range(5):
+                audit.journaliser(action='creation', modele='Test',
+                                  objet_id=objet_id)
+        self.assertTrue(audit.vider())
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list('objet_id', flat=True)),
+            [0, 1, 2, 3, 4])
+
+    def test_rollback_annule_les_entrees(self):
+        try:
+            with transaction.atomic():
+                audit.journaliser(action='creation', modele='Test', objet_id=1)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        audit.journaliser(action='creation', modele='Test', objet_id=2)
+        self.assertTrue(audit.vider())
+        self.assertEqual(
+            list(AuditLog.objects.values_list('objet_id', flat=True)), [2])
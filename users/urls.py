@@ -26,6 +26,7 @@ router.register('dashboard', DashboardViewSet, basename='dashboard')
 router.register('audit-logs', AuditLogViewSet, basename='audit-logs')
 router.register('rapports', RapportsViewSet, basename='rapports')
 router.register('statistiques', StatistiquesViewSet, basename='statistiques')
+router.register('valorisation', ValorisationViewSet, basename='valorisation')
 router.register('stock-operations', StockOperationsViewSet,
                 basename='stock-operations')
 router.register('stock-disponible', StockDisponibleViewSet,
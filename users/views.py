@@ -7,14 +7,29 @@ from .models import TransfertEntrepot, StockEntrepot
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model, authenticate
 from knox.models import AuthToken
-from django.db import transaction
-from django.db.models import Sum, Q, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Sum, Q, Count, Prefetch, F
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from rest_framework.utils.encoders import JSONEncoder
 from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+import codecs
+import hashlib
+import json
 from .serializers import *
 from .models import *
+from .pagination import CurseurPagination, StandardPagination
+from .cache import portee_dashboard, section_dashboard
+from .idempotence import idempotent
+from .audit import journaliser
+from .export import FORMATS_EXPORT, RENDERERS_EXPORT, reponse_export
+from .rapports import TOP_MAX, filtrer_ventes, rapport_ventes
 
 User = get_user_model()
 
@@ -29,6 +44,37 @@ class IsAdminOrVendeur(permissions.BasePermission):
         return request.user.is_authenticated and request.user.role in ['admin', 'vendeur']
 
 
+def parametres_filtre(request, dates=(), ids=()):
+    """Lit des paramètres de filtre : (valeurs, None) ou (None, réponse 400)
+
+    `dates` : paramètres AAAA-MM-JJ, `ids` : identifiants numériques. Les
+    paramètres absents ou vides ne figurent pas dans les valeurs.
+    """
+    valeurs = {}
+    for nom in dates:
+        brut = request.query_params.get(nom)
+        if not brut:
+            continue
+        try:
+            valeurs[nom] = parse_date(brut)
+        except ValueError:
+            valeurs[nom] = None
+        if valeurs[nom] is None:
+            return None, Response(
+                {'error': f"{nom} doit être une date AAAA-MM-JJ"}, status=400)
+    for nom in ids:
+        brut = request.query_params.get(nom)
+        if not brut:
+            continue
+        try:
+            valeurs[nom] = int(brut)
+        except ValueError:
+            return None, Response(
+                {'error': f"{nom} doit être un identifiant numérique"},
+                status=400)
+    return valeurs, None
+
+
 class LoginViewset(viewsets.ViewSet):
     permission_classes = [permissions.AllowAny]
     serializer_class = LoginSerializer
@@ -41,7 +87,7 @@ class LoginViewset(viewsets.ViewSet):
             user = authenticate(request, email=email, password=password)
             if user:
                 # Log de connexion
-                AuditLog.objects.create(
+                journaliser(
                     user=user,
                     action='connexion',
                     modele='User',
@@ -148,7 +194,7 @@ class UserViewset(viewsets.ViewSet):
             user.save()
 
             # Log d'audit
-            AuditLog.objects.create(
+            journaliser(
                 user=request.user,
                 action='modification',
                 modele='User',
@@ -211,7 +257,18 @@ class ProduitViewSet(viewsets.ModelViewSet):
         return context
 
     def get_queryset(self):
-        queryset = Produit.objects.all()
+        queryset = Produit.objects.select_related(
+            'categorie', 'fournisseur', 'created_by'
+        )
+
+        # Répartition par entrepôt chargée en une requête, sauf si omise
+        if ProduitSerializer.champ_demande(self.request, 'stocks_entrepots'):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'stockentrepot_set',
+                    queryset=StockEntrepot.objects.select_related('entrepot')
+                )
+            )
 
         # Filtre par catégorie
         categorie_id = self.request.query_params.get('categorie')
@@ -221,14 +278,12 @@ class ProduitViewSet(viewsets.ModelViewSet):
         # Filtre stock faible
         low_stock = self.request.query_params.get('low_stock')
         if low_stock:
-            produits_ids = [p.id for p in queryset if p.stock_faible()]
-            queryset = queryset.filter(id__in=produits_ids)
+            queryset = queryset.stock_faible()
 
         # Filtre rupture de stock
         out_of_stock = self.request.query_params.get('out_of_stock')
         if out_of_stock:
-            produits_ids = [p.id for p in queryset if p.en_rupture()]
-            queryset = queryset.filter(id__in=produits_ids)
+            queryset = queryset.en_rupture()
 
         return queryset
 
@@ -250,13 +305,51 @@ class ClientViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def regler(self, request, pk=None):
+        """Règlement global réparti sur les ventes dues, les plus anciennes d'abord"""
+        client = self.get_object()
+        serializer = ReglementClientSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        ventes = Vente.objects.filter(client=client)
+        if request.user.role != 'admin':
+            ventes = ventes.filter(created_by=request.user)
+
+        try:
+            paiements = Vente.repartir_paiement(
+                ventes,
+                data['montant'],
+                data['mode_paiement'],
+                reference=data.get('reference', ''),
+                notes=data.get('notes', ''),
+                user=request.user
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': 'Règlement enregistré avec succès',
+            'montant': data['montant'],
+            'paiements': [{
+                'id': paiement.id,
+                'vente': paiement.vente_id,
+                'numero_vente': paiement.vente.numero_vente,
+                'montant': paiement.montant,
+            } for paiement in paiements],
+        }, status=status.HTTP_200_OK)
+
 
 class MouvementStockViewSet(viewsets.ModelViewSet):
     serializer_class = MouvementStockSerializer
     permission_classes = [IsAdmin]
+    pagination_class = CurseurPagination
 
     def get_queryset(self):
-        queryset = MouvementStock.objects.all().order_by('-created_at')
+        queryset = MouvementStock.objects.select_related(
+            'produit', 'entrepot', 'created_by').order_by('-created_at')
 
         # Filtre par entrepôt
         entrepot_id = self.request.query_params.get('entrepot')
@@ -280,7 +373,9 @@ class EntrepotViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdmin]
 
     def get_queryset(self):
-        return Entrepot.objects.all()
+        return Entrepot.objects.select_related(
+            'responsable', 'created_by'
+        ).avec_valorisation()
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -291,7 +386,7 @@ class StockEntrepotViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrVendeur]
 
     def get_queryset(self):
-        queryset = StockEntrepot.objects.all()
+        queryset = StockEntrepot.objects.select_related('entrepot', 'produit')
 
         # Filtre par entrepôt
         entrepot_id = self.request.query_params.get('entrepot')
@@ -306,60 +401,108 @@ class StockEntrepotViewSet(viewsets.ModelViewSet):
         # Filtre stock faible
         low_stock = self.request.query_params.get('low_stock')
         if low_stock:
-            stocks_ids = [s.id for s in queryset if s.stock_faible]
-            queryset = queryset.filter(id__in=stocks_ids)
+            queryset = queryset.stock_faible()
 
         # Filtre rupture de stock
         out_of_stock = self.request.query_params.get('out_of_stock')
         if out_of_stock:
-            stocks_ids = [s.id for s in queryset if s.en_rupture]
-            queryset = queryset.filter(id__in=stocks_ids)
+            queryset = queryset.en_rupture()
 
         return queryset
 
     @action(detail=False, methods=['get'])
     def stock_global(self, request):
-        """Retourne le stock global de tous les produits par entrepôt"""
-        entrepot_id = request.query_params.get('entrepot')
+        """Retourne le stock global de tous les produits par entrepôt
 
+        Les totaux par produit sont calculés en une seule requête groupée,
+        puis la répartition par entrepôt est chargée en une requête par page.
+        Réponse paginée (StandardPagination, ?page=/?page_size=) ; ?stream=true
+        renvoie toute la liste, diffusée au fil de l'eau. Filtres : ?entrepot=,
+        ?categorie=.
+        """
+        stocks = StockEntrepot.objects.all()
+
+        entrepot_id = request.query_params.get('entrepot')
         if entrepot_id:
-            stocks = StockEntrepot.objects.filter(entrepot_id=entrepot_id)
-        else:
-            stocks = StockEntrepot.objects.all()
+            stocks = stocks.filter(entrepot_id=entrepot_id)
 
-        # Agrégation par produit
-        data = []
-        produits_ids = stocks.values_list('produit_id', flat=True).distinct()
+        categorie_id = request.query_params.get('categorie')
+        if categorie_id:
+            stocks = stocks.filter(produit__categorie_id=categorie_id)
 
-        for produit_id in produits_ids:
-            produit_stocks = stocks.filter(produit_id=produit_id)
-            produit = Produit.objects.get(id=produit_id)
+        # Agrégation par produit (une seule requête GROUP BY)
+        totaux = stocks.order_by().values(
+            'produit_id', 'produit__nom', 'produit__code'
+        ).annotate(
+            total_quantite=Sum('quantite'),
+            total_reservee=Sum('quantite_reservee'),
+        ).order_by('produit__nom', 'produit_id')
+
+        if request.query_params.get('stream') in ('1', 'true'):
+            return StreamingHttpResponse(
+                self._stock_global_stream(totaux, stocks),
+                content_type='application/json'
+            )
 
-            total_quantite = produit_stocks.aggregate(
-                Sum('quantite'))['quantite__sum'] or 0
-            total_reservee = produit_stocks.aggregate(Sum('quantite_reservee'))[
-                'quantite_reservee__sum'] or 0
+        paginator = StandardPagination()
+        page = paginator.paginate_queryset(totaux, request, view=self)
+        return paginator.get_paginated_response(
+            self._stock_global_lignes(page, stocks)
+        )
 
+    def _stock_global_lignes(self, totaux, stocks):
+        """Construit les lignes du stock global pour un lot de totaux"""
+        totaux = list(totaux)
+        par_produit = {}
+        repartition = stocks.filter(
+            produit_id__in=[t['produit_id'] for t in totaux]
+        ).select_related('produit', 'entrepot')
+        for stock in repartition:
+            par_produit.setdefault(stock.produit_id, []).append(stock)
+
+        data = []
+        for t in totaux:
             data.append({
-                'produit_id': produit_id,
-                'produit_nom': produit.nom,
-                'produit_code': produit.code,
-                'total_quantite': total_quantite,
-                'total_reservee': total_reservee,
-                'total_disponible': total_quantite - total_reservee,
+                'produit_id': t['produit_id'],
+                'produit_nom': t['produit__nom'],
+                'produit_code': t['produit__code'],
+                'total_quantite': t['total_quantite'] or 0,
+                'total_reservee': t['total_reservee'] or 0,
+                'total_disponible': (t['total_quantite'] or 0) - (t['total_reservee'] or 0),
                 'stocks_par_entrepot': StockEntrepotSerializer(
-                    produit_stocks, many=True
+                    par_produit.get(t['produit_id'], []), many=True
                 ).data
             })
-
-        return Response(data)
+        return data
+
+    def _stock_global_stream(self, totaux, stocks, taille_lot=500):
+        """Génère le tableau JSON du stock global, lot par lot"""
+        yield '['
+        premier = True
+        lot = []
+        for ligne in totaux.iterator(chunk_size=taille_lot):
+            lot.append(ligne)
+            if len(lot) == taille_lot:
+                for item in self._stock_global_lignes(lot, stocks):
+                    yield ('' if premier else ',') + json.dumps(item, cls=JSONEncoder)
+                    premier = False
+                lot = []
+        for item in self._stock_global_lignes(lot, stocks):
+            yield ('' if premier else ',') + json.dumps(item, cls=JSONEncoder)
+            premier = False
+        yield ']'
 
 
 class StockDisponibleViewSet(viewsets.ViewSet):
     """API pour récupérer les stocks disponibles par produit"""
     permission_classes = [IsAdminOrVendeur]
 
+    MAX_PRODUITS_LOT = 500
+
     def list(self, request):
+        if request.query_params.get('produits'):
+            return self._matrice(request)
+
         produit_id = request.query_params.get('produit')
 
         if not produit_id:
@@ -371,7 +514,8 @@ class StockDisponibleViewSet(viewsets.ViewSet):
             return Response({'error': 'Produit non trouvé'}, status=404)
 
         # Récupérer les stocks par entrepôt
-        stocks = StockEntrepot.objects.filter(produit=produit)
+        stocks = StockEntrepot.objects.filter(
+            produit=produit).select_related('entrepot')
 
         data = []
         for stock in stocks:
@@ -395,12 +539,97 @@ class StockDisponibleViewSet(viewsets.ViewSet):
             'stocks': data
         })
 
+    @staticmethod
+    def _ids(request, nom):
+        """Liste triée et dédoublonnée d'ids : ?nom=1,2,3 ou ?nom=1&nom=2"""
+        ids = set()
+        for valeur in request.query_params.getlist(nom):
+            for morceau in valeur.split(','):
+                morceau = morceau.strip()
+                if morceau:
+                    ids.add(int(morceau))
+        return sorted(ids)
+
+    def _matrice(self, request):
+        """Matrice produit × entrepôt des disponibilités, en une requête
+
+        ?produits=1,2,3[&entrepots=4,5]. Les clés sont des ids triés pour que
+        deux paniers identiques donnent la même réponse (ETag stable).
+        """
+        try:
+            produits_ids = self._ids(request, 'produits')
+            entrepots_ids = self._ids(request, 'entrepots')
+        except ValueError:
+            return Response({'error': 'Les ids doivent être des entiers'}, status=400)
+
+        if len(produits_ids) > self.MAX_PRODUITS_LOT:
+            return Response(
+                {'error': f'Maximum {self.MAX_PRODUITS_LOT} produits par appel'},
+                status=400
+            )
+
+        stocks = StockEntrepot.objects.filter(produit_id__in=produits_ids)
+        if entrepots_ids:
+            stocks = stocks.filter(entrepot_id__in=entrepots_ids)
+        stocks = stocks.order_by('produit_id', 'entrepot_id').values_list(
+            'produit_id', 'produit__stock_alerte', 'entrepot_id',
+            'quantite', 'quantite_reservee', 'stock_alerte'
+        )
+
+        matrice = {}
+        for produit_id, alerte_produit, entrepot_id, quantite, reservee, alerte in stocks:
+            disponible = max(0, quantite - reservee)
+            ligne = matrice.setdefault(str(produit_id), {
+                'total': {
+                    'quantite_totale': 0,
+                    'quantite_reservee': 0,
+                    'quantite_disponible': 0,
+                    'stock_alerte': alerte_produit,
+                },
+                'entrepots': {},
+            })
+            ligne['entrepots'][str(entrepot_id)] = {
+                'quantite_totale': quantite,
+                'quantite_reservee': reservee,
+                'quantite_disponible': disponible,
+                'en_rupture': disponible <= 0,
+                'stock_faible': 0 < disponible <= alerte,
+            }
+            ligne['total']['quantite_totale'] += quantite
+            ligne['total']['quantite_reservee'] += reservee
+            ligne['total']['quantite_disponible'] += disponible
+
+        for ligne in matrice.values():
+            total = ligne['total']
+            total['en_rupture'] = total['quantite_disponible'] <= 0
+            total['stock_faible'] = 0 < total['quantite_disponible'] <= total['stock_alerte']
+
+        payload = {
+            'produits': produits_ids,
+            'entrepots': entrepots_ids or None,
+            'disponibilites': matrice,
+            # Produits sans aucun stock dans les entrepôts demandés
+            'sans_stock': [pid for pid in produits_ids if str(pid) not in matrice],
+        }
+
+        etag = '"%s"' % hashlib.md5(
+            json.dumps(payload, sort_keys=True).encode()
+        ).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(payload)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, max-age=5'
+        return response
+
 
 # views.py - TransfertEntrepotViewSet
 
 
 class TransfertEntrepotViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CurseurPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -568,7 +797,7 @@ class VenteViewSet(viewsets.ModelViewSet):
                 vente.save()
 
                 # Log d'audit
-                AuditLog.objects.create(
+                journaliser(
                     user=request.user,
                     action='vente',
                     modele='Paiement',
@@ -602,21 +831,20 @@ class VenteViewSet(viewsets.ModelViewSet):
             if hasattr(vente, 'facture'):
                 return Response({'error': 'Une facture existe déjà pour cette vente'}, status=400)
 
-            # Générer numéro de facture
-            today = datetime.now().strftime('%Y%m%d')
-            last_facture_today = Facture.objects.filter(
-                numero_facture__startswith=f'F{today}'
-            ).count()
-            numero_facture = f'F{today}{last_facture_today + 1:04d}'
-
-            # Créer la facture (sans PDF pour l'instant)
-            facture = Facture.objects.create(
-                vente=vente,
-                numero_facture=numero_facture,
-                montant_ttc=vente.montant_total,
-                montant_ht=vente.montant_total / 1.2,  # Exemple avec 20% TVA
-                tva=20.0
-            )
+            # Numéro et facture dans la même transaction : un échec de
+            # création libère le numéro
+            with transaction.atomic():
+                numero_facture = CompteurDocument.generer_numero(
+                    CompteurDocument.SERIE_FACTURE)
+
+                # Créer la facture (sans PDF pour l'instant)
+                facture = Facture.objects.create(
+                    vente=vente,
+                    numero_facture=numero_facture,
+                    montant_ttc=vente.montant_total,
+                    montant_ht=vente.montant_total / Decimal('1.2'),  # Exemple avec 20% TVA
+                    tva=20.0
+                )
 
             return Response({
                 'message': 'Facture générée avec succès',
@@ -694,28 +922,12 @@ class HistoriqueClientViewSet(viewsets.ViewSet):
 
         dernier_achat = ventes.first().created_at if ventes.exists() else None
 
-        # Pagination
-        page = self.paginate_queryset(ventes)
-        if page is not None:
-            ventes_serializer = VenteDetailSerializer(page, many=True)
-
-            return self.get_paginated_response({
-                'client': ClientSerializer(client).data,
-                'statistiques': {
-                    'total_achats': total_achats,
-                    'total_paye': total_paye,
-                    'solde_restant': total_achats - total_paye,
-                    'nombre_ventes': ventes.count(),
-                    'ventes_en_retard': ventes_en_retard,
-                    'dernier_achat': dernier_achat
-                },
-                'ventes': ventes_serializer.data
-            })
+        # Pagination par curseur (ViewSet simple : paginateur instancié ici)
+        paginator = CurseurPagination()
+        page = paginator.paginate_queryset(ventes, request, view=self)
+        ventes_serializer = VenteDetailSerializer(page, many=True)
 
-        # Si pas de pagination
-        ventes_serializer = VenteDetailSerializer(ventes, many=True)
-
-        return Response({
+        return paginator.get_paginated_response({
             'client': ClientSerializer(client).data,
             'statistiques': {
                 'total_achats': total_achats,
@@ -787,6 +999,10 @@ class RapportPaiementsViewSet(viewsets.ViewSet):
 class VenteViewSet(viewsets.ModelViewSet):
     serializer_class = VenteDetailSerializer
     permission_classes = [IsAdminOrVendeur]
+    pagination_class = CurseurPagination
+    MAX_VENTES_LOT = 500
+    MAX_VENTES_SYNCHRO = 5000
+    TAILLE_LOT_SYNCHRO = 50
 
     def get_queryset(self):
         user = self.request.user
@@ -811,6 +1027,15 @@ class VenteViewSet(viewsets.ModelViewSet):
         if user.role != 'admin':
             queryset = queryset.filter(created_by=user)
 
+        # Relations lues par VenteDetailSerializer : nombre de requêtes
+        # constant quelle que soit la taille de la page
+        if self.action in ('list', 'retrieve'):
+            queryset = queryset.select_related(
+                'client', 'created_by', 'facture'
+            ).prefetch_related(
+                'entrepots', 'lignes_vente__produit', 'lignes_vente__entrepot',
+                'paiements__created_by')
+
         return queryset
 
     def get_serializer_class(self):
@@ -822,6 +1047,11 @@ class VenteViewSet(viewsets.ModelViewSet):
             return EnregistrerPaiementSerializer
         return VenteDetailSerializer
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Créer une vente (rejouable avec l'en-tête Idempotency-Key)"""
+        return super().create(request, *args, **kwargs)
+
     @action(detail=True, methods=['post'])
     def confirmer(self, request, pk=None):
         """Confirmer une vente"""
@@ -850,6 +1080,281 @@ class VenteViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def confirmer_lot(self, request):
+        """Confirmer plusieurs ventes brouillon : {"ventes": [1, 2, 3]}
+
+        Une seule transaction, prélèvements groupés par entrepôt ; le
+        résultat est détaillé vente par vente.
+        """
+        ids, erreur = self._ids_lot(request)
+        if erreur:
+            return erreur
+
+        ventes = self.get_queryset().filter(pk__in=ids).select_related(
+            'client'
+        ).prefetch_related('lignes_vente__produit', 'lignes_vente__entrepot')
+        ventes = {vente.id: vente for vente in ventes}
+
+        confirmees, echecs = Vente.confirmer_lot(
+            [ventes[vente_id] for vente_id in ids if vente_id in ventes],
+            user=request.user
+        )
+        confirmees = {vente.id for vente in confirmees}
+
+        return Response({
+            'message': f"{len(confirmees)} vente(s) confirmée(s) sur {len(ids)}",
+            'total_confirmees': len(confirmees),
+            'total_echecs': len(ids) - len(confirmees),
+            'resultats': self._resultats_lot(ids, ventes, confirmees, echecs),
+        })
+
+    @action(detail=False, methods=['post'])
+    def annuler_lot(self, request):
+        """Annuler plusieurs ventes brouillon
+
+        Corps : {"ventes": [1, 2, 3]}, ou {"brouillons_avant": "2026-01-31"}
+        pour les brouillons créés avant cette date (MAX_VENTES_LOT au plus).
+        Une seule transaction, réservations libérées en un UPDATE par
+        entrepôt ; le résultat est détaillé vente par vente.
+        """
+        avant = request.data.get('brouillons_avant')
+        if avant is not None:
+            try:
+                avant = datetime.strptime(str(avant), '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {"error": "brouillons_avant doit être une date AAAA-MM-JJ"},
+                    status=status.HTTP_400_BAD_REQUEST)
+            ids = list(self.get_queryset().filter(
+                statut='brouillon', created_at__date__lt=avant
+            ).order_by('created_at').values_list(
+                'pk', flat=True)[:self.MAX_VENTES_LOT])
+        else:
+            ids, erreur = self._ids_lot(request)
+            if erreur:
+                return erreur
+
+        ventes = self.get_queryset().filter(pk__in=ids).prefetch_related(
+            'lignes_vente__produit')
+        ventes = {vente.id: vente for vente in ventes}
+
+        annulees, echecs = Vente.annuler_lot(
+            [ventes[vente_id] for vente_id in ids if vente_id in ventes],
+            user=request.user
+        )
+        annulees = {vente.id for vente in annulees}
+
+        return Response({
+            'message': f"{len(annulees)} vente(s) annulée(s) sur {len(ids)}",
+            'total_annulees': len(annulees),
+            'total_echecs': len(ids) - len(annulees),
+            'resultats': self._resultats_lot(ids, ventes, annulees, echecs),
+        })
+
+    def _ids_lot(self, request):
+        """Ids du champ 'ventes' : (ids, None) ou (None, réponse d'erreur)"""
+        ids = request.data.get('ventes')
+        if not isinstance(ids, list) or not ids:
+            return None, Response(
+                {"error": "Le champ 'ventes' doit être une liste d'ids non vide"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = list(dict.fromkeys(int(vente_id) for vente_id in ids))
+        except (TypeError, ValueError):
+            return None, Response({"error": "Les ids doivent être des entiers"},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > self.MAX_VENTES_LOT:
+            return None, Response(
+                {"error": f"Maximum {self.MAX_VENTES_LOT} ventes par appel"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return ids, None
+
+    @staticmethod
+    def _resultats_lot(ids, ventes, reussies, echecs):
+        resultats = []
+        for vente_id in ids:
+            vente = ventes.get(vente_id)
+            if vente is None:
+                resultats.append({'id': vente_id, 'succes': False,
+                                  'error': "Vente non trouvée"})
+            elif vente_id in reussies:
+                resultats.append({'id': vente_id, 'succes': True,
+                                  'numero_vente': vente.numero_vente})
+            else:
+                resultats.append({'id': vente_id, 'succes': False,
+                                  'numero_vente': vente.numero_vente,
+                                  'error': echecs[vente_id]})
+        return resultats
+
+    @action(detail=False, methods=['post'])
+    def synchroniser(self, request):
+        """Synchroniser les ventes enregistrées hors ligne par un terminal
+
+        Corps : tableau JSON, ou NDJSON (Content-Type: application/x-ndjson),
+        de ventes au format de VenteSynchroSerializer. Le flux est lu au fil
+        de l'eau et traité par lots de TAILLE_LOT_SYNCHRO ventes, chacun dans
+        sa transaction. Les résultats sont indexés par reference_locale ; une
+        vente déjà synchronisée n'est pas recréée.
+        """
+        resultats = {}
+        total = 0
+        flux = self._lire_flux_ventes(request)
+        while True:
+            # Seule la lecture du flux est couverte : une erreur pendant le
+            # traitement (stock insuffisant...) est rapportée vente par vente
+            try:
+                lot = list(islice(flux, self.TAILLE_LOT_SYNCHRO))
+                if total + len(lot) > self.MAX_VENTES_SYNCHRO:
+                    raise ValueError(
+                        f"maximum {self.MAX_VENTES_SYNCHRO} ventes par envoi")
+            except ValueError as e:
+                # Les lots déjà traités restent enregistrés : leurs résultats
+                # sont renvoyés avec l'erreur
+                return Response({
+                    'error': f"Flux invalide après {total} vente(s) : {e}",
+                    'resultats': resultats,
+                }, status=status.HTTP_400_BAD_REQUEST)
+            if not lot:
+                break
+            self._synchroniser_lot(
+                request, list(enumerate(lot, start=total)), resultats)
+            total += len(lot)
+
+        statuts = [resultat['statut'] for resultat in resultats.values()]
+        return Response({
+            'total': total,
+            'creees': statuts.count('creee'),
+            'deja_synchronisees': statuts.count('deja_synchronisee'),
+            'erreurs': statuts.count('erreur'),
+            'resultats': resultats,
+        })
+
+    @staticmethod
+    def _lire_flux_ventes(request):
+        """Objets JSON du corps, lus par morceaux (NDJSON ou tableau JSON)"""
+        flux = request.stream
+        if flux is None:
+            return
+        if request.content_type in ('application/x-ndjson', 'application/jsonl'):
+            for numero, ligne in enumerate(flux, start=1):
+                ligne = ligne.strip()
+                if not ligne:
+                    continue
+                try:
+                    yield json.loads(ligne)
+                except ValueError:
+                    raise ValueError(f"ligne {numero} : JSON invalide")
+            return
+
+        decodeur = json.JSONDecoder()
+        texte = codecs.getincrementaldecoder('utf-8')()
+        tampon, position, ouvert = '', 0, False
+        while True:
+            morceau = flux.read(64 * 1024)
+            tampon = tampon[position:] + texte.decode(morceau, final=not morceau)
+            position = 0
+            while True:
+                while position < len(tampon) and tampon[position] in ' \t\r\n,':
+                    position += 1
+                if position == len(tampon):
+                    break
+                if not ouvert:
+                    if tampon[position] != '[':
+                        raise ValueError("un tableau JSON est attendu")
+                    ouvert = True
+                    position += 1
+                    continue
+                if tampon[position] == ']':
+                    return
+                try:
+                    objet, position = decodeur.raw_decode(tampon, position)
+                except ValueError:
+                    break  # Objet incomplet : lire la suite du flux
+                yield objet
+            if not morceau:
+                raise ValueError("tableau JSON incomplet ou invalide")
+
+    def _synchroniser_lot(self, request, lot, resultats):
+        if not lot:
+            return
+
+        def reference(index, donnees):
+            ref = donnees.get('reference_locale') if isinstance(donnees, dict) else None
+            return ref if isinstance(ref, str) and ref else f'#{index}'
+
+        references = [reference(index, donnees) for index, donnees in lot]
+        existantes = {
+            ref: {'statut': 'deja_synchronisee', 'id': vente_id,
+                  'numero_vente': numero}
+            for ref, vente_id, numero in Vente.objects.filter(
+                created_by=request.user, reference_locale__in=references
+            ).values_list('reference_locale', 'id', 'numero_vente')
+        }
+
+        valides = []
+        for ref, (index, donnees) in zip(references, lot):
+            if ref in resultats:
+                resultats[f'#{index}'] = {'statut': 'erreur', 'erreurs': {
+                    'reference_locale': ["Référence en double dans l'envoi"]}}
+            elif ref in existantes:
+                resultats[ref] = existantes[ref]
+            elif not isinstance(donnees, dict):
+                resultats[ref] = {'statut': 'erreur', 'erreurs': {
+                    'non_field_errors': ["Objet JSON attendu"]}}
+            else:
+                serializer = VenteSynchroSerializer(data=donnees, context={
+                    'request': request, 'reservation_differee': True})
+                if serializer.is_valid():
+                    valides.append((ref, serializer))
+                else:
+                    resultats[ref] = {'statut': 'erreur',
+                                      'erreurs': serializer.errors}
+                # Réserve la référence contre un doublon plus loin dans l'envoi
+                resultats.setdefault(ref, None)
+
+        creees = []
+        try:
+            # Tout le lot dans une transaction, réservation de stock groupée
+            with transaction.atomic():
+                quantites = {}
+                for ref, serializer in valides:
+                    creees.append((ref, serializer.save()))
+                    for cle, quantite in serializer._quantites_lignes.items():
+                        quantites[cle] = quantites.get(cle, 0) + quantite
+                StockEntrepot.objects.reserver_lot(quantites)
+        except (StockInsuffisantError, IntegrityError, serializers.ValidationError):
+            # Stock insuffisant pour l'ensemble ou référence créée entre-temps :
+            # vente par vente, chacune dans sa transaction
+            creees = []
+            for ref, serializer in valides:
+                serializer.instance = None
+                try:
+                    with transaction.atomic():
+                        vente = serializer.save()
+                        StockEntrepot.objects.reserver_lot(
+                            serializer._quantites_lignes)
+                except StockInsuffisantError as e:
+                    resultats[ref] = {'statut': 'erreur', 'erreurs': {
+                        'lignes_vente': [detail['message'] for detail in
+                                         e.details] or [str(e)]}}
+                except serializers.ValidationError as e:
+                    resultats[ref] = {'statut': 'erreur', 'erreurs': e.detail}
+                except IntegrityError:
+                    vente = Vente.objects.get(
+                        created_by=request.user, reference_locale=ref)
+                    resultats[ref] = {'statut': 'deja_synchronisee',
+                                      'id': vente.id,
+                                      'numero_vente': vente.numero_vente}
+                else:
+                    creees.append((ref, vente))
+
+        for ref, vente in creees:
+            resultats[ref] = {'statut': 'creee', 'id': vente.id,
+                              'numero_vente': vente.numero_vente}
+
     @action(detail=True, methods=['post'])
     def annuler(self, request, pk=None):
         """Annuler une vente"""
@@ -862,20 +1367,8 @@ class VenteViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Libérer les stocks réservés
-            for ligne in vente.lignes_vente.all():
-                try:
-                    stock_entrepot = StockEntrepot.objects.get(
-                        produit=ligne.produit,
-                        entrepot=ligne.entrepot
-                    )
-                    stock_entrepot.liberer_stock(ligne.quantite)
-                except StockEntrepot.DoesNotExist:
-                    pass
-
-            # Annuler la vente
-            vente.statut = 'annulee'
-            vente.save()
+            # Réservations libérées en un UPDATE par entrepôt
+            vente.annuler_vente(user=request.user)
 
             # Rafraîchir les données
             vente.refresh_from_db()
@@ -891,6 +1384,7 @@ class VenteViewSet(viewsets.ModelViewSet):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'])
+    @idempotent
     def enregistrer_paiement(self, request, pk=None):
         """Enregistrer un paiement pour une vente"""
         try:
@@ -918,50 +1412,18 @@ class VenteViewSet(viewsets.ModelViewSet):
             if serializer.is_valid():
                 data = serializer.validated_data
 
-                # Créer le paiement
-                paiement = Paiement.objects.create(
-                    vente=vente,
-                    montant=data['montant'],
-                    mode_paiement=data['mode_paiement'],
-                    reference=data.get('reference', ''),
-                    notes=data.get('notes', ''),
-                    created_by=request.user
-                )
-
-                # Mettre à jour le montant payé de la vente
-                vente.montant_paye += data['montant']
-
-                # Si la vente n'a pas de mode de paiement principal, utiliser celui du premier paiement
-                if not vente.mode_paiement:
-                    vente.mode_paiement = data['mode_paiement']
-
-                # Mettre à jour le statut de paiement
-                if vente.montant_paye >= vente.montant_total:
-                    vente.statut_paiement = 'paye'
-                    vente.date_paiement = timezone.now()
-                elif vente.montant_paye > 0:
-                    vente.statut_paiement = 'partiel'
-
-                # Si la vente a une date d'échéance et est en retard
-                if vente.date_echeance and vente.statut_paiement != 'paye':
-                    if timezone.now().date() > vente.date_echeance:
-                        vente.statut_paiement = 'retard'
-
-                vente.save()
-
-                # Log d'audit
-                AuditLog.objects.create(
-                    user=request.user,
-                    action='vente',
-                    modele='Paiement',
-                    objet_id=paiement.id,
-                    details={
-                        'vente': vente.numero_vente,
-                        'montant': str(data['montant']),
-                        'mode_paiement': data['mode_paiement'],
-                        'nouveau_statut': vente.statut_paiement
-                    }
-                )
+                # Montants incrémentés sur la ligne verrouillée, restant revérifié
+                try:
+                    paiement = vente.ajouter_paiement(
+                        data['montant'],
+                        data['mode_paiement'],
+                        reference=data.get('reference', ''),
+                        notes=data.get('notes', ''),
+                        user=request.user
+                    )
+                except ValueError as e:
+                    return Response({'error': str(e)},
+                                    status=status.HTTP_409_CONFLICT)
 
                 return Response({
                     'message': 'Paiement enregistré avec succès',
@@ -986,21 +1448,20 @@ class VenteViewSet(viewsets.ModelViewSet):
             if hasattr(vente, 'facture'):
                 return Response({'error': 'Une facture existe déjà pour cette vente'}, status=400)
 
-            # Générer numéro de facture
-            today = timezone.now().strftime('%Y%m%d')
-            last_facture_today = Facture.objects.filter(
-                numero_facture__startswith=f'F{today}'
-            ).count()
-            numero_facture = f'F{today}{last_facture_today + 1:04d}'
-
-            # Créer la facture (sans PDF pour l'instant)
-            facture = Facture.objects.create(
-                vente=vente,
-                numero_facture=numero_facture,
-                montant_ttc=vente.montant_total,
-                montant_ht=vente.montant_total / 1.2,  # Exemple avec 20% TVA
-                tva=20.0
-            )
+            # Numéro et facture dans la même transaction : un échec de
+            # création libère le numéro
+            with transaction.atomic():
+                numero_facture = CompteurDocument.generer_numero(
+                    CompteurDocument.SERIE_FACTURE)
+
+                # Créer la facture (sans PDF pour l'instant)
+                facture = Facture.objects.create(
+                    vente=vente,
+                    numero_facture=numero_facture,
+                    montant_ttc=vente.montant_total,
+                    montant_ht=vente.montant_total / Decimal('1.2'),  # Exemple avec 20% TVA
+                    tva=20.0
+                )
 
             return Response({
                 'message': 'Facture générée avec succès',
@@ -1016,15 +1477,13 @@ class VenteViewSet(viewsets.ModelViewSet):
         queryset = self.get_queryset().filter(
             statut='confirmee',
             statut_paiement__in=['non_paye', 'partiel']
-        ).order_by('date_echeance')
+        ).order_by('date_echeance', 'id')
 
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            serializer = VenteDetailSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = VenteDetailSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # Tri par échéance : pagination par page plutôt que par curseur
+        paginator = StandardPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = VenteDetailSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def ventes_en_retard(self, request):
@@ -1047,10 +1506,46 @@ class VenteViewSet(viewsets.ModelViewSet):
 
 
 class DashboardViewSet(viewsets.ViewSet):
+    """Tableau de bord, mis en cache par portée (admin / chaque vendeur)
+
+    Les sections 'ventes' et 'stocks' sont invalidées par les signaux des
+    modèles dont elles dépendent (voir cache.py) ; ?refresh=1 force le
+    recalcul.
+    """
     permission_classes = [IsAdminOrVendeur]
 
     def list(self, request):
         user = request.user
+        portee = portee_dashboard(user)
+        rafraichir = request.query_params.get('refresh') in ('1', 'true')
+
+        ventes, ventes_le, ventes_hit = section_dashboard(
+            'ventes', portee, lambda: self._section_ventes(user), rafraichir)
+        stocks, stocks_le, stocks_hit = section_dashboard(
+            'stocks', portee, lambda: self._section_stocks(user), rafraichir)
+
+        maintenant = timezone.now()
+        genere_le = min(ventes_le, stocks_le)
+
+        return Response({
+            'stats': {**ventes['stats'], **stocks['stats']},
+            'entrepots': stocks['entrepots'],
+            'produits_low_stock': stocks['produits_low_stock'],
+            'top_produits': ventes['top_produits'],
+            'dernieres_ventes': ventes['dernieres_ventes'],
+            'cache': {
+                'genere_le': genere_le,
+                'age': int((maintenant - genere_le).total_seconds()),
+                'sections': {
+                    'ventes': {'hit': ventes_hit,
+                               'age': int((maintenant - ventes_le).total_seconds())},
+                    'stocks': {'hit': stocks_hit,
+                               'age': int((maintenant - stocks_le).total_seconds())},
+                }
+            }
+        })
+
+    def _section_ventes(self, user):
         today = datetime.now().date()
         month_start = today.replace(day=1)
         week_start = today - timedelta(days=today.weekday())
@@ -1059,55 +1554,104 @@ class DashboardViewSet(viewsets.ViewSet):
         if user.role == 'admin':
             ventes_filter = Vente.objects.filter(statut='confirmee')
             clients_filter = Client.objects.all()
-            entrepots_filter = Entrepot.objects.all()
         else:
             ventes_filter = Vente.objects.filter(
                 created_by=user, statut='confirmee'
             )
             clients_filter = Client.objects.filter(created_by=user)
+
+        total_clients = clients_filter.count()
+
+        # Totaux lus dans les agrégats quotidiens
+        agregats = VenteJournaliere.objects.all()
+        agregats_lignes = LigneVenteJournaliere.objects.all()
+        if user.role != 'admin':
+            agregats = agregats.filter(vendeur=user)
+            agregats_lignes = agregats_lignes.filter(vendeur=user)
+
+        def totaux(qs):
+            return qs.aggregate(
+                ventes=Sum('nombre_ventes'), montant=Sum('chiffre_affaires'))
+
+        global_ = totaux(agregats)
+        total_ventes = global_['ventes'] or 0
+        chiffre_affaires = global_['montant'] or 0
+
+        # Ventes du mois
+        ventes_mois = totaux(agregats.filter(date__gte=month_start))[
+            'montant'] or 0
+
+        # Ventes de la semaine
+        ventes_semaine = totaux(agregats.filter(date__gte=week_start))[
+            'montant'] or 0
+
+        # Dernières ventes
+        dernieres_ventes = ventes_filter.select_related(
+            'client', 'created_by'
+        ).prefetch_related(
+            'entrepots', 'lignes_vente__produit', 'lignes_vente__entrepot'
+        ).order_by('-created_at')[:5]
+        ventes_serializer = VenteSerializer(dernieres_ventes, many=True)
+
+        # Top produits vendus
+        top_produits = agregats_lignes.filter(
+            date__gte=month_start
+        ).order_by().values('produit_id', 'produit__nom').annotate(
+            total_vendu=Sum('quantite')
+        ).order_by('-total_vendu')[:5]
+
+        top_produits_data = []
+        for produit in top_produits:
+            top_produits_data.append({
+                'id': produit['produit_id'],
+                'nom': produit['produit__nom'],
+                'total_vendu': produit['total_vendu'] or 0
+            })
+
+        return {
+            'stats': {
+                'total_ventes': total_ventes,
+                'chiffre_affaires': float(chiffre_affaires),
+                'chiffre_affaires_mois': float(ventes_mois),
+                'chiffre_affaires_semaine': float(ventes_semaine),
+                'total_clients': total_clients,
+            },
+            'top_produits': top_produits_data,
+            # Liste simple (ReturnList garde une référence au serializer)
+            'dernieres_ventes': list(ventes_serializer.data),
+        }
+
+    def _section_stocks(self, user):
+        if user.role == 'admin':
+            entrepots_filter = Entrepot.objects.all()
+        else:
             # Un vendeur peut voir les entrepôts où il est responsable
             entrepots_filter = Entrepot.objects.filter(
                 Q(responsable=user) | Q(created_by=user)
             ).distinct()
 
-        # Statistiques générales
-        total_ventes = ventes_filter.count()
-        chiffre_affaires = ventes_filter.aggregate(Sum('montant_total'))[
-            'montant_total__sum'] or 0
-        total_clients = clients_filter.count()
         total_produits = Produit.objects.count()
 
         # Statistiques entrepôts
         total_entrepots = entrepots_filter.count()
 
-        # Calculer la valeur totale des stocks par entrepôt
+        # Valeur des stocks et nombre de produits : une requête groupée
         valeur_stock_total = 0
         entrepots_stocks = []
-        for entrepot in entrepots_filter:
-            valeur_stock = entrepot.stock_total_valeur()
-            valeur_stock_total += valeur_stock
+        for entrepot in entrepots_filter.avec_valorisation():
+            valeur_stock_total += entrepot.valeur_stock
             entrepots_stocks.append({
                 'id': entrepot.id,
                 'nom': entrepot.nom,
-                'valeur_stock': float(valeur_stock),
-                'produits_count': entrepot.produits_count(),
+                'valeur_stock': float(entrepot.valeur_stock),
+                'produits_count': entrepot.nombre_produits,
                 'statut': 'actif' if entrepot.actif else 'inactif'
             })
 
-        # Ventes du mois
-        ventes_mois = ventes_filter.filter(created_at__gte=month_start).aggregate(
-            Sum('montant_total'))['montant_total__sum'] or 0
-
-        # Ventes de la semaine
-        ventes_semaine = ventes_filter.filter(created_at__gte=week_start).aggregate(
-            Sum('montant_total'))['montant_total__sum'] or 0
-
         # Produits en stock faible (par entrepôt)
         produits_low_stock = []
-        stocks_faibles = StockEntrepot.objects.filter(
-            quantite_disponible__gt=0,
-            quantite_disponible__lte=models.F('stock_alerte')
-        ).select_related('produit', 'entrepot')
+        stocks_faibles = StockEntrepot.objects.stock_faible().select_related(
+            'produit', 'entrepot')
 
         for stock in stocks_faibles[:10]:  # Limiter à 10 résultats
             produits_low_stock.append({
@@ -1121,48 +1665,21 @@ class DashboardViewSet(viewsets.ViewSet):
                 'statut': 'faible'
             })
 
-        # Dernières ventes
-        dernieres_ventes = ventes_filter.order_by('-created_at')[:5]
-        ventes_serializer = VenteSerializer(dernieres_ventes, many=True)
-
-        # Top produits vendus
-        top_produits = Produit.objects.filter(
-            lignedevente__vente__in=ventes_filter.filter(
-                created_at__gte=month_start
-            )
-        ).annotate(
-            total_vendu=Sum('lignedevente__quantite')
-        ).order_by('-total_vendu')[:5]
-
-        top_produits_data = []
-        for produit in top_produits:
-            top_produits_data.append({
-                'id': produit.id,
-                'nom': produit.nom,
-                'total_vendu': produit.total_vendu or 0
-            })
-
-        return Response({
+        return {
             'stats': {
-                'total_ventes': total_ventes,
-                'chiffre_affaires': float(chiffre_affaires),
-                'chiffre_affaires_mois': float(ventes_mois),
-                'chiffre_affaires_semaine': float(ventes_semaine),
-                'total_clients': total_clients,
                 'total_produits': total_produits,
                 'total_entrepots': total_entrepots,
                 'valeur_stock_total': float(valeur_stock_total),
             },
             'entrepots': entrepots_stocks,
             'produits_low_stock': produits_low_stock,
-            'top_produits': top_produits_data,
-            'dernieres_ventes': ventes_serializer.data
-        })
+        }
 
 
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = AuditLogSerializer
     permission_classes = [IsAdmin]
+    pagination_class = CurseurPagination
 
     def get_queryset(self):
         queryset = AuditLog.objects.all().order_by('-created_at')
@@ -1213,98 +1730,62 @@ class RapportsViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def ventes(self, request):
-        """Rapport détaillé des ventes"""
-        date_debut = request.query_params.get('date_debut')
-        date_fin = request.query_params.get('date_fin')
-        categorie_id = request.query_params.get('categorie')
-        vendeur_id = request.query_params.get('vendeur')
-        entrepot_id = request.query_params.get('entrepot')
-
-        # Filtrage de base
-        queryset = Vente.objects.filter(statut='confirmee')
-
-        if date_debut and date_fin:
-            queryset = queryset.filter(
-                created_at__date__gte=date_debut,
-                created_at__date__lte=date_fin
-            )
-
-        if vendeur_id:
-            queryset = queryset.filter(created_by_id=vendeur_id)
-
-        if entrepot_id:
-            queryset = queryset.filter(
-                lignes_vente__entrepot_id=entrepot_id
-            ).distinct()
-
-        # Filtrage par catégorie
-        if categorie_id:
-            queryset = queryset.filter(
-                lignes_vente__produit__categorie_id=categorie_id
-            ).distinct()
+        """Rapport détaillé des ventes
+
+        Paramètres : ?date_debut= / ?date_fin=, ?vendeur=, ?entrepot=,
+        ?categorie=, ?top= (taille des classements, TOP_MAX au plus) et
+        ?page= / ?page_size= pour les ventes détaillées. Statistiques et
+        classements viennent surtout des agrégats quotidiens (rapports.py),
+        mémorisés RAPPORT_VENTES_CACHE_TIMEOUT secondes.
+        """
+        try:
+            top = min(max(int(request.query_params.get('top', 5)), 1), TOP_MAX)
+        except ValueError:
+            return Response({'error': 'top doit être un entier'}, status=400)
+        filtres, erreur = parametres_filtre(
+            request, dates=('date_debut', 'date_fin'),
+            ids=('vendeur', 'entrepot', 'categorie'))
+        if erreur:
+            return erreur
+
+        rapport, depuis_cache = rapport_ventes(filtres, top)
+        classements = rapport['classements']
+
+        def premier(dimension, cle_nom, cle_valeur):
+            meilleur = (classements[dimension] or [None])[0]
+            return {
+                'id': meilleur['id'] if meilleur else None,
+                cle_nom: meilleur['nom'] if meilleur else 'N/A',
+                cle_valeur: meilleur['valeur'] if meilleur else 0,
+            }
 
-        # Statistiques
         stats = {
-            'total_ventes': queryset.count(),
-            'chiffre_affaires_total': queryset.aggregate(
-                total=Sum('montant_total')
-            )['total'] or 0,
-            'clients_actifs': Client.objects.filter(
-                vente__in=queryset
-            ).distinct().count(),
-            'total_produits_vendus': LigneDeVente.objects.filter(
-                vente__in=queryset
-            ).aggregate(total=Sum('quantite'))['total'] or 0,
-        }
-
-        # Top vendeur
-        top_vendeur = User.objects.filter(
-            vente__in=queryset
-        ).annotate(
-            total_ventes=Count('vente')
-        ).order_by('-total_ventes').first()
-
-        stats['top_vendeur'] = {
-            'id': top_vendeur.id if top_vendeur else None,
-            'email': top_vendeur.email if top_vendeur else 'N/A',
-            'total_ventes': top_vendeur.total_ventes if top_vendeur else 0
+            **rapport['stats'],
+            'top_vendeur': premier('vendeurs', 'email', 'total_ventes'),
+            'top_produit': premier('produits', 'nom', 'total_vendu'),
+            'top_entrepot': premier('entrepots', 'nom', 'total_ventes'),
         }
 
-        # Top produit
-        top_produit = Produit.objects.filter(
-            lignedevente__vente__in=queryset
-        ).annotate(
-            total_vendu=Sum('lignedevente__quantite')
-        ).order_by('-total_vendu').first()
-
-        stats['top_produit'] = {
-            'id': top_produit.id if top_produit else None,
-            'nom': top_produit.nom if top_produit else 'N/A',
-            'total_vendu': top_produit.total_vendu if top_produit else 0
-        }
-
-        # Top entrepôt
-        top_entrepot = Entrepot.objects.filter(
-            lignes_vente__vente__in=queryset
-        ).annotate(
-            total_ventes=Count('lignedevente__vente', distinct=True)
-        ).order_by('-total_ventes').first()
-
-        stats['top_entrepot'] = {
-            'id': top_entrepot.id if top_entrepot else None,
-            'nom': top_entrepot.nom if top_entrepot else 'N/A',
-            'total_ventes': top_entrepot.total_ventes if top_entrepot else 0
-        }
-
-        # Ventes détaillées
-        ventes_detaillees = VenteSerializer(
-            queryset.order_by('-created_at')[:50],  # Limiter à 50 résultats
-            many=True
-        ).data
+        # Ventes détaillées, paginées
+        ventes = filtrer_ventes(filtres).select_related(
+            'client', 'created_by'
+        ).prefetch_related(
+            'entrepots',
+            'lignes_vente__produit', 'lignes_vente__entrepot',
+        ).order_by('-created_at', '-id')
+        paginator = StandardPagination()
+        page = paginator.paginate_queryset(ventes, request, view=self)
 
         return Response({
             'stats': stats,
-            'ventes_detaillees': ventes_detaillees
+            'classements': classements,
+            'depuis_cache': depuis_cache,
+            'ventes_detaillees': VenteSerializer(page, many=True).data,
+            'pagination': {
+                'count': paginator.page.paginator.count,
+                'next': paginator.get_next_link(),
+                'previous': paginator.get_previous_link(),
+            },
         })
 
     @action(detail=False, methods=['get'])
@@ -1317,17 +1798,16 @@ class RapportsViewSet(viewsets.ViewSet):
         else:
             stocks = StockEntrepot.objects.all()
 
+        # Filtre par statut (rupture, faible, normal) via l'index statut_stock
+        statut = request.query_params.get('statut')
+        if statut:
+            stocks = stocks.filter(statut_stock=statut)
+
         stocks = stocks.select_related(
             'produit', 'entrepot', 'produit__categorie')
 
         produits_data = []
         for stock in stocks:
-            statut = 'normal'
-            if stock.en_rupture:
-                statut = 'rupture'
-            elif stock.stock_faible:
-                statut = 'faible'
-
             produits_data.append({
                 'id': stock.produit.id,
                 'nom': stock.produit.nom,
@@ -1339,7 +1819,7 @@ class RapportsViewSet(viewsets.ViewSet):
                 'stock_total': stock.quantite,
                 'stock_reserve': stock.quantite_reservee,
                 'stock_alerte': stock.stock_alerte,
-                'statut': statut,
+                'statut': stock.statut_stock,
                 'prix_achat': stock.produit.prix_achat,
                 'prix_vente': stock.produit.prix_vente,
             })
@@ -1350,47 +1830,80 @@ class RapportsViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def clients(self, request):
-        """Rapport sur les clients"""
-        date_debut = request.query_params.get('date_debut')
-        date_fin = request.query_params.get('date_fin')
+        """Rapport sur les clients (une requête groupée)
 
-        clients = Client.objects.all()
-
-        clients_data = []
-        for client in clients:
-            # Calculer les statistiques client
-            ventes_client = Vente.objects.filter(
-                client=client,
-                statut='confirmee'
-            )
-
-            if date_debut and date_fin:
-                ventes_client = ventes_client.filter(
-                    created_at__date__gte=date_debut,
-                    created_at__date__lte=date_fin
-                )
-
-            total_achats = ventes_client.aggregate(
-                total=Sum('montant_total')
-            )['total'] or 0
-
-            clients_data.append({
-                'id': client.id,
-                'nom': client.nom,
-                'type_client': client.type_client,
-                'telephone': client.telephone,
-                'email': client.email,
-                'total_achats': float(total_achats),
-                'nombre_commandes': ventes_client.count(),
-            })
+        Paramètres : ?date_debut= / ?date_fin=, ?tri= parmi TRIS_CLIENTS
+        (préfixe '-' pour l'ordre décroissant) et ?page= / ?page_size=.
+        """
+        tri = request.query_params.get('tri', '-total_achats')
+        if tri.lstrip('-') not in self.TRIS_CLIENTS:
+            return Response(
+                {'error': f"tri doit être l'une des colonnes {', '.join(self.TRIS_CLIENTS)}"},
+                status=400)
+
+        filtres, erreur = parametres_filtre(
+            request, dates=('date_debut', 'date_fin'))
+        if erreur:
+            return erreur
+
+        colonne = F(tri.lstrip('-'))
+        clients = Client.objects.avec_statistiques(
+            filtres.get('date_debut'), filtres.get('date_fin'),
+        ).order_by(
+            colonne.desc(nulls_last=True) if tri.startswith('-')
+            else colonne.asc(nulls_last=True),
+            'id')
+
+        if 'page' in request.query_params or 'page_size' in request.query_params:
+            paginator = StandardPagination()
+            page = paginator.paginate_queryset(clients, request, view=self)
+            return paginator.get_paginated_response(
+                [self._ligne_client(client) for client in page])
 
         return Response({
-            'clients': clients_data
+            'clients': [self._ligne_client(client) for client in clients]
         })
 
-    @action(detail=False, methods=['get'])
+    # Colonnes acceptées par ?tri= du rapport clients
+    TRIS_CLIENTS = ('nom', 'total_achats', 'nombre_commandes',
+                    'dernier_achat', 'solde_restant')
+
+    @staticmethod
+    def _ligne_client(client):
+        return {
+            'id': client.id,
+            'nom': client.nom,
+            'type_client': client.type_client,
+            'telephone': client.telephone,
+            'email': client.email,
+            'total_achats': float(client.total_achats),
+            'nombre_commandes': client.nombre_commandes,
+            'dernier_achat': client.dernier_achat,
+            'solde_restant': float(client.solde_restant),
+        }
+
+    # Colonnes des exports du rapport des mouvements (values_list)
+    COLONNES_MOUVEMENTS = (
+        ('id', 'ID'),
+        ('created_at', 'Date'),
+        ('type_mouvement', 'Type'),
+        ('produit__code', 'Code produit'),
+        ('produit__nom', 'Produit'),
+        ('entrepot__nom', 'Entrepôt'),
+        ('quantite', 'Quantité'),
+        ('prix_unitaire', 'Prix unitaire'),
+        ('motif', 'Motif'),
+        ('created_by__email', 'Créé par'),
+    )
+
+    @action(detail=False, methods=['get'], renderer_classes=(
+        api_settings.DEFAULT_RENDERER_CLASSES + list(RENDERERS_EXPORT)))
     def mouvements_stock(self, request):
-        """Rapport des mouvements de stock"""
+        """Rapport des mouvements de stock
+
+        ?format=csv|xlsx|ndjson : export diffusé au fil de l'eau, lu par
+        morceaux en base (mémoire constante quel que soit le volume).
+        """
         date_debut = request.query_params.get('date_debut')
         date_fin = request.query_params.get('date_fin')
         entrepot_id = request.query_params.get('entrepot')
@@ -1411,6 +1924,14 @@ class RapportsViewSet(viewsets.ViewSet):
         if type_mouvement:
             mouvements = mouvements.filter(type_mouvement=type_mouvement)
 
+        format_export = request.accepted_renderer.format
+        if format_export in FORMATS_EXPORT:
+            lignes = mouvements.order_by('-created_at', '-id').values_list(
+                *[cle for cle, _ in self.COLONNES_MOUVEMENTS]
+            ).iterator(chunk_size=2000)
+            return reponse_export(format_export, lignes,
+                                  self.COLONNES_MOUVEMENTS, 'mouvements_stock')
+
         mouvements_data = MouvementStockSerializer(
             mouvements.order_by('-created_at'),
             many=True
@@ -1422,33 +1943,37 @@ class RapportsViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def entrepots(self, request):
-        """Rapport sur les entrepôts"""
-        entrepots = Entrepot.objects.all()
+        """Rapport sur les entrepôts (une requête)
+
+        ?prix=achat|vente pour la valorisation du stock ; ?date_debut= /
+        ?date_fin= pour la période des ventes.
+        """
+        prix = request.query_params.get('prix', 'achat')
+        if prix not in ('achat', 'vente'):
+            return Response({'error': "prix doit valoir 'achat' ou 'vente'"}, status=400)
+
+        filtres, erreur = parametres_filtre(
+            request, dates=('date_debut', 'date_fin'))
+        if erreur:
+            return erreur
+
+        entrepots = Entrepot.objects.select_related(
+            'responsable'
+        ).avec_valorisation(prix).avec_ventes(
+            filtres.get('date_debut'), filtres.get('date_fin'),
+        )
 
         entrepots_data = []
         for entrepot in entrepots:
-            # Statistiques de l'entrepôt
-            stocks = StockEntrepot.objects.filter(entrepot=entrepot)
-            valeur_stock = entrepot.stock_total_valeur()
-
-            # Ventes depuis cet entrepôt
-            ventes_entrepot = Vente.objects.filter(
-                lignes_vente__entrepot=entrepot,
-                statut='confirmee'
-            ).distinct()
-
-            chiffre_affaires = ventes_entrepot.aggregate(
-                total=Sum('montant_total')
-            )['total'] or 0
-
             entrepots_data.append({
                 'id': entrepot.id,
                 'nom': entrepot.nom,
                 'responsable': entrepot.responsable.email if entrepot.responsable else 'N/A',
-                'valeur_stock': float(valeur_stock),
-                'nombre_produits': stocks.count(),
-                'chiffre_affaires': float(chiffre_affaires),
-                'nombre_ventes': ventes_entrepot.count(),
+                'valeur_stock': float(entrepot.valeur_stock),
+                'nombre_produits': entrepot.nombre_produits,
+                'chiffre_affaires': float(entrepot.chiffre_affaires),
+                'nombre_ventes': entrepot.nombre_ventes,
+                'quantite_vendue': entrepot.quantite_vendue,
                 'statut': 'actif' if entrepot.actif else 'inactif'
             })
 
@@ -1468,19 +1993,13 @@ class StatistiquesViewSet(viewsets.ViewSet):
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=30)
 
-        if user.role == 'admin':
-            ventes = Vente.objects.filter(
-                statut='confirmee',
-                created_at__date__gte=start_date,
-                created_at__date__lte=end_date
-            )
-        else:
-            ventes = Vente.objects.filter(
-                created_by=user,
-                statut='confirmee',
-                created_at__date__gte=start_date,
-                created_at__date__lte=end_date
-            )
+        # Lecture des agrégats quotidiens (VenteJournaliere)
+        agregats = VenteJournaliere.objects.filter(
+            date__gte=start_date,
+            date__lte=end_date
+        )
+        if user.role != 'admin':
+            agregats = agregats.filter(vendeur=user)
 
         # Grouper par jour
         jours = {}
@@ -1493,12 +2012,16 @@ class StatistiquesViewSet(viewsets.ViewSet):
             }
             current_date += timedelta(days=1)
 
-        for vente in ventes:
-            date_str = vente.created_at.date().strftime('%Y-%m-%d')
+        par_jour = agregats.order_by().values('date').annotate(
+            total_ventes=Sum('nombre_ventes'),
+            total_montant=Sum('chiffre_affaires'),
+        )
+        for jour in par_jour:
+            date_str = jour['date'].strftime('%Y-%m-%d')
             if date_str in jours:
-                jours[date_str]['ventes'] += 1
-                jours[date_str]['chiffre_affaires'] += float(
-                    vente.montant_total)
+                jours[date_str]['ventes'] = jour['total_ventes']
+                jours[date_str]['chiffre_affaires'] = float(
+                    jour['total_montant'])
 
         return Response({
             'periode': {
@@ -1517,35 +2040,27 @@ class StatistiquesViewSet(viewsets.ViewSet):
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days)
 
-        if user.role == 'admin':
-            ventes = Vente.objects.filter(
-                statut='confirmee',
-                created_at__date__gte=start_date
-            )
-        else:
-            ventes = Vente.objects.filter(
-                created_by=user,
-                statut='confirmee',
-                created_at__date__gte=start_date
-            )
+        # Lecture des agrégats quotidiens (LigneVenteJournaliere)
+        agregats = LigneVenteJournaliere.objects.filter(date__gte=start_date)
+        if user.role != 'admin':
+            agregats = agregats.filter(vendeur=user)
 
         # Produits les plus vendus
-        produits = Produit.objects.filter(
-            lignedevente__vente__in=ventes
+        produits = agregats.order_by().values(
+            'produit_id', 'produit__nom', 'produit__code'
         ).annotate(
-            total_vendu=Sum('lignedevente__quantite'),
-            chiffre_affaires=Sum('lignedevente__quantite') *
-            models.F('prix_vente')
+            total_vendu=Sum('quantite'),
+            total_montant=Sum('chiffre_affaires'),
         ).order_by('-total_vendu')[:10]
 
         data = []
         for produit in produits:
             data.append({
-                'id': produit.id,
-                'nom': produit.nom,
-                'code': produit.code,
-                'total_vendu': produit.total_vendu or 0,
-                'chiffre_affaires': float(produit.chiffre_affaires or 0)
+                'id': produit['produit_id'],
+                'nom': produit['produit__nom'],
+                'code': produit['produit__code'],
+                'total_vendu': produit['total_vendu'] or 0,
+                'chiffre_affaires': float(produit['total_montant'] or 0)
             })
 
         return Response({
@@ -1553,6 +2068,87 @@ class StatistiquesViewSet(viewsets.ViewSet):
             'produits': data
         })
 
+
+class ValorisationViewSet(viewsets.ViewSet):
+    """Séries temporelles de la valorisation du stock
+
+    Lit uniquement les photographies ValorisationStock (commande
+    capturer_valorisation), sans toucher à StockEntrepot.
+    """
+    permission_classes = [IsAdmin]
+
+    def list(self, request):
+        niveau = request.query_params.get('niveau')
+        prix = request.query_params.get('prix', 'achat')
+
+        if niveau and niveau not in dict(ValorisationStock.NIVEAU_CHOICES):
+            return Response({'error': 'niveau invalide'}, status=400)
+        if prix not in ('achat', 'vente'):
+            return Response({'error': "prix doit valoir 'achat' ou 'vente'"}, status=400)
+
+        filtres, erreur = parametres_filtre(
+            request, dates=('date_debut', 'date_fin'),
+            ids=('entrepot', 'categorie', 'produit'))
+        if erreur:
+            return erreur
+
+        # Sans niveau : total global, somme des lignes par entrepôt. Chaque
+        # ligne ne renseigne que l'objet de son niveau : un filtre sur un
+        # autre objet donnerait toujours une série vide
+        niveau_lignes = niveau or 'entrepot'
+        for param in ('entrepot', 'categorie', 'produit'):
+            if param in filtres and param != niveau_lignes:
+                return Response({
+                    'error': f"Le filtre {param} ne s'applique pas au niveau "
+                             f"{niveau or 'global'}"
+                }, status=400)
+
+        snapshots = ValorisationStock.objects.filter(niveau=niveau_lignes)
+
+        if 'date_debut' in filtres:
+            snapshots = snapshots.filter(date__gte=filtres['date_debut'])
+        if 'date_fin' in filtres:
+            snapshots = snapshots.filter(date__lte=filtres['date_fin'])
+        if niveau_lignes in filtres:
+            snapshots = snapshots.filter(
+                **{f'{niveau_lignes}_id': filtres[niveau_lignes]})
+
+        champ_valeur = f'valeur_{prix}'
+        series = {}
+
+        if niveau:
+            points = snapshots.order_by(
+                f'{niveau}_id', 'date'
+            ).values_list(f'{niveau}_id', 'libelle', 'date', 'quantite', champ_valeur)
+            for cle, libelle, jour, quantite, valeur in points:
+                serie = series.setdefault(cle, {
+                    'id': cle, 'libelle': libelle, 'points': []})
+                # Le libellé le plus récent l'emporte
+                serie['libelle'] = libelle
+                serie['points'].append({
+                    'date': jour, 'quantite': quantite, 'valeur': float(valeur)})
+        else:
+            points = snapshots.order_by().values('date').annotate(
+                total_quantite=Sum('quantite'),
+                total_valeur=Sum(champ_valeur),
+            ).order_by('date')
+            series[None] = {
+                'id': None,
+                'libelle': 'Total',
+                'points': [{
+                    'date': p['date'],
+                    'quantite': p['total_quantite'] or 0,
+                    'valeur': float(p['total_valeur'] or 0),
+                } for p in points]
+            }
+
+        return Response({
+            'niveau': niveau or 'global',
+            'prix': prix,
+            'series': list(series.values())
+        })
+
+
 # Vue pour les opérations de stock avancées
 
 
@@ -1607,7 +2203,7 @@ class StockOperationsViewSet(viewsets.ViewSet):
                 )
 
                 # Log d'audit
-                AuditLog.objects.create(
+                journaliser(
                     user=request.user,
                     action='modification',
                     modele='StockEntrepot',
@@ -1679,7 +2275,7 @@ class StockOperationsViewSet(viewsets.ViewSet):
                 )
 
                 # Log d'audit
-                AuditLog.objects.create(
+                journaliser(
                     user=request.user,
                     action='creation' if created else 'modification',
                     modele='StockEntrepot',